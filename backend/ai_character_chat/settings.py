@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import environ
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,6 +30,55 @@ GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 
 GEMINI_MODEL_NAME = env('GEMINI_MODEL_NAME', default='gemini-2.5-pro')
 
+# LLM provider: 'gemini', 'fake' (deterministic offline backend for load tests) or a dotted path
+LLM_BACKEND = env('LLM_BACKEND', default='gemini')
+# Fake backend behaviour (see chat.llm.fake.FakeBackend)
+LLM_FAKE_LATENCY = env.float('LLM_FAKE_LATENCY', default=0.5)
+LLM_FAKE_TOKENS_PER_SECOND = env.float('LLM_FAKE_TOKENS_PER_SECOND', default=50)
+LLM_FAKE_RESPONSE_TOKENS = env.int('LLM_FAKE_RESPONSE_TOKENS', default=60)
+LLM_FAKE_FAILURE_RATE = env.float('LLM_FAKE_FAILURE_RATE', default=0.0)
+LLM_FAKE_SEED = env.int('LLM_FAKE_SEED', default=0)
+
+# Resilience layer around every LLM call (see chat.llm.resilience.ResilientBackend)
+LLM_RESILIENCE_ENABLED = env.bool('LLM_RESILIENCE_ENABLED', default=True)
+LLM_TIMEOUT = env.float('LLM_TIMEOUT', default=60)  # per attempt (seconds)
+LLM_DEADLINE = env.float('LLM_DEADLINE', default=120)  # per call, across retries (seconds)
+LLM_MAX_ATTEMPTS = env.int('LLM_MAX_ATTEMPTS', default=3)
+LLM_RETRY_BASE_DELAY = env.float('LLM_RETRY_BASE_DELAY', default=0.5)
+LLM_RETRY_MAX_DELAY = env.float('LLM_RETRY_MAX_DELAY', default=8)
+LLM_CIRCUIT_FAILURE_THRESHOLD = env.int('LLM_CIRCUIT_FAILURE_THRESHOLD', default=5)
+LLM_CIRCUIT_RESET_TIMEOUT = env.float('LLM_CIRCUIT_RESET_TIMEOUT', default=30)
+# Send a second request when a call runs past this percentile of recent latencies (0 = off)
+LLM_HEDGE_PERCENTILE = env.float('LLM_HEDGE_PERCENTILE', default=0)
+LLM_HEDGE_MIN_SAMPLES = env.int('LLM_HEDGE_MIN_SAMPLES', default=20)
+
+# Cheaper model used for rolling conversation summaries
+GEMINI_SUMMARY_MODEL_NAME = env('GEMINI_SUMMARY_MODEL_NAME', default='gemini-2.5-flash')
+
+# Prompt size limits per turn: older turns are folded into a rolling summary
+CHAT_CONTEXT_TOKEN_BUDGET = env.int('CHAT_CONTEXT_TOKEN_BUDGET', default=32000)
+CHAT_CONTEXT_MAX_TURNS = env.int('CHAT_CONTEXT_MAX_TURNS', default=40)
+
+# Provider-side caching of each session's prompt prefix: '' (off), 'gemini', 'local' or a dotted path
+CHAT_CONTEXT_CACHE_BACKEND = env('CHAT_CONTEXT_CACHE_BACKEND', default='')
+CHAT_CONTEXT_CACHE_TTL = env.int('CHAT_CONTEXT_CACHE_TTL', default=60 * 60)
+# Prefixes smaller than this are sent inline (Gemini rejects caches below its minimum size)
+CHAT_CONTEXT_CACHE_MIN_TOKENS = env.int('CHAT_CONTEXT_CACHE_MIN_TOKENS', default=4096)
+
+# Long-term memory (chat.memory): once turns fall out of the window, up to CHAT_MEMORY_TOP_K earlier
+# messages most similar to the newest one are recalled into CHAT_MEMORY_TOKEN_BUDGET of the budget
+CHAT_MEMORY_ENABLED = env.bool('CHAT_MEMORY_ENABLED', default=True)
+CHAT_MEMORY_TOP_K = env.int('CHAT_MEMORY_TOP_K', default=5)
+CHAT_MEMORY_MIN_SCORE = env.float('CHAT_MEMORY_MIN_SCORE', default=0.3)
+CHAT_MEMORY_TOKEN_BUDGET = env.int('CHAT_MEMORY_TOKEN_BUDGET', default=2000)
+# 'session', or 'character' to share memory across a user's sessions with the same character
+CHAT_MEMORY_SCOPE = env('CHAT_MEMORY_SCOPE', default='session')
+# Vector files, one pair per scope; must be shared by every worker (a volume, not the container FS)
+CHAT_MEMORY_DIR = env('CHAT_MEMORY_DIR', default=str(BASE_DIR / 'memory_index'))
+# Dotted path of the embedder class; the default hashes words locally and needs no model
+CHAT_MEMORY_EMBEDDER = env('CHAT_MEMORY_EMBEDDER', default='chat.memory.HashingEmbedder')
+CHAT_MEMORY_DIMENSIONS = env.int('CHAT_MEMORY_DIMENSIONS', default=512)
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -49,6 +99,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'rest_framework',
     'rest_framework.authtoken',  # Add TokenAuthentication
@@ -68,6 +119,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Report per-request SQL query counts in a response header (used by `manage.py loadtest`)
+if env.bool('QUERY_COUNT_HEADER', default=False):
+    MIDDLEWARE.insert(0, 'chat.middleware.QueryCountHeaderMiddleware')
+
 ROOT_URLCONF = 'ai_character_chat.urls'
 
 TEMPLATES = [
@@ -168,12 +223,50 @@ CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[
     "http://localhost:3002",
     "http://127.0.0.1:3002",
 ])
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
 
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
 
+# Cache (formatted chat history, etc.): Redis when REDIS_URL is set, otherwise a per-process LRU.
+# The 'llm' alias holds cached LLM side-call results (chat.llm.cache); with Redis its size is
+# bounded by the server's maxmemory / allkeys-lru policy.
+REDIS_URL = env('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'llm',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': env.int('LOCAL_CACHE_MAX_ENTRIES', default=1000)},
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'llm',
+            'OPTIONS': {'MAX_ENTRIES': env.int('LLM_CACHE_MAX_ENTRIES', default=500)},
+        },
+    }
+
+# Content-addressed cache for deterministic LLM side calls (titles, character drafts)
+LLM_CACHE_ENABLED = env.bool('LLM_CACHE_ENABLED', default=True)
+LLM_CACHE_TTL = env.int('LLM_CACHE_TTL', default=24 * 60 * 60)
+
+# How long a session's formatted prompt history stays cached (seconds)
+CHAT_HISTORY_CACHE_TIMEOUT = env.int('CHAT_HISTORY_CACHE_TIMEOUT', default=60 * 60)
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -181,6 +274,72 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Keep chat job results around long enough for clients to poll them
+CELERY_RESULT_EXPIRES = env.int('CELERY_RESULT_EXPIRES', default=3600)
+
+# Session titles are generated in batches by a periodic job (run `celery -A ai_character_chat beat`);
+# turn this off to queue one title job per session after its first reply instead
+CHAT_TITLE_BATCH_ENABLED = env.bool('CHAT_TITLE_BATCH_ENABLED', default=True)
+CHAT_TITLE_BATCH_SIZE = env.int('CHAT_TITLE_BATCH_SIZE', default=50)
+CHAT_TITLE_BATCH_INTERVAL = env.int('CHAT_TITLE_BATCH_INTERVAL', default=60)  # seconds
+GEMINI_TITLE_MODEL_NAME = env('GEMINI_TITLE_MODEL_NAME', default='gemini-2.5-flash')
+
+# Sessions idle for this many days have their messages moved to one compressed
+# ArchivedSession row by a periodic job, and restored when reopened (0 = never archive)
+CHAT_ARCHIVE_AFTER_DAYS = env.int('CHAT_ARCHIVE_AFTER_DAYS', default=30)
+CHAT_ARCHIVE_BATCH_SIZE = env.int('CHAT_ARCHIVE_BATCH_SIZE', default=200)
+CHAT_ARCHIVE_INTERVAL = env.int('CHAT_ARCHIVE_INTERVAL', default=60 * 60)  # seconds
+# Monthly message partitions kept ready ahead of time, once the table has been converted
+# with `manage.py partition_messages --convert` (PostgreSQL only)
+CHAT_MESSAGE_PARTITIONS_AHEAD = env.int('CHAT_MESSAGE_PARTITIONS_AHEAD', default=3)
+
+# Messages written per bulk INSERT transaction by imports (POST /api/import/, `manage.py import_chat_data`)
+CHAT_IMPORT_BATCH_SIZE = env.int('CHAT_IMPORT_BATCH_SIZE', default=1000)
+
+CELERY_BEAT_SCHEDULE = {}
+if CHAT_TITLE_BATCH_ENABLED:
+    CELERY_BEAT_SCHEDULE['generate-session-titles'] = {
+        'task': 'chat.tasks.generate_session_titles',
+        'schedule': CHAT_TITLE_BATCH_INTERVAL,
+    }
+if CHAT_ARCHIVE_AFTER_DAYS:
+    CELERY_BEAT_SCHEDULE['archive-cold-sessions'] = {
+        'task': 'chat.tasks.archive_cold_sessions',
+        'schedule': CHAT_ARCHIVE_INTERVAL,
+    }
+CELERY_BEAT_SCHEDULE['ensure-message-partitions'] = {
+    'task': 'chat.tasks.ensure_message_partitions',
+    'schedule': 24 * 60 * 60,
+}
+
+# Longest a client may long-poll GET /api/chat/jobs/<id>/?wait=... (seconds)
+CHAT_JOB_MAX_WAIT = env.int('CHAT_JOB_MAX_WAIT', default=30)
+
+# A session's generation claim (ChatSession.is_generating_response) older than this is
+# treated as abandoned by a crashed worker (seconds)
+CHAT_GENERATION_LOCK_TIMEOUT = env.int('CHAT_GENERATION_LOCK_TIMEOUT', default=180)
+
+# send_message Idempotency-Key: how long results are kept, and how long a duplicate
+# waits for the first request to finish (seconds). In-flight keys expire after
+# CHAT_GENERATION_LOCK_TIMEOUT. Keys live in the default cache, so deduplication across
+# processes or hosts requires REDIS_URL; the LocMem fallback only dedupes within a process.
+CHAT_IDEMPOTENCY_TTL = env.int('CHAT_IDEMPOTENCY_TTL', default=24 * 60 * 60)
+CHAT_IDEMPOTENCY_WAIT = env.int('CHAT_IDEMPOTENCY_WAIT', default=30)
+
+# Per-user token-bucket limits on generation endpoints ('<burst>/<period>', '' = unlimited).
+# Buckets are shared across processes when REDIS_URL is set.
+CHAT_RATE_LIMITS = {
+    'send_message': env('CHAT_RATE_LIMIT_SEND_MESSAGE', default='20/min'),
+    'stream_message': env('CHAT_RATE_LIMIT_STREAM_MESSAGE', default='20/min'),
+    'character_draft': env('CHAT_RATE_LIMIT_CHARACTER_DRAFT', default='5/min'),
+}
+# Load shedding: generations running at once per server process, and Celery jobs allowed to
+# wait in the queue, before new requests get 429 with Retry-After (0 = unlimited).
+# Off by default: an async (ASGI) process can hold thousands of generations waiting on the LLM,
+# so a cap only makes sense sized to the upstream quota or to a sync worker's thread count.
+CHAT_MAX_IN_FLIGHT_GENERATIONS = env.int('CHAT_MAX_IN_FLIGHT_GENERATIONS', default=0)
+CHAT_MAX_QUEUE_DEPTH = env.int('CHAT_MAX_QUEUE_DEPTH', default=200)
+CHAT_OVERLOAD_RETRY_AFTER = env.int('CHAT_OVERLOAD_RETRY_AFTER', default=5)
 
 # Media files
 MEDIA_URL = '/media/'
@@ -0,0 +1,140 @@
+import json
+import logging
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .history_cache import invalidate_history
+from .models import ArchivedSession, ChatSession, Message
+from .signals import bulk_message_delete
+
+try:
+    import zstandard
+except ImportError:  # optional: archives fall back to zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+# Columns of a message kept in the transcript, in row order
+TRANSCRIPT_FIELDS = ('id', 'role', 'content', 'timestamp', 'character_id')
+INSERT_BATCH_SIZE = 500
+
+def compress(data):
+    """
+    (codec, compressed bytes); zstd when the zstandard package is installed.
+    """
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, ZLIB_LEVEL)
+
+def decompress(codec, data):
+    data = bytes(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read zstd session archives")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+def _cold_cutoff(days=None):
+    days = getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 30) if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+def cold_sessions(days=None):
+    """
+    Idle, non-empty sessions not yet archived, least recently updated first.
+    """
+    return ChatSession.objects.filter(
+        is_archived=False,
+        is_generating_response=False,
+        message_count__gt=0,
+        updated_at__lt=_cold_cutoff(days)
+    ).order_by('updated_at')
+
+def archive_session(chat_session_id, days=None):
+    """
+    Move the messages of a cold session into one compressed ArchivedSession row.
+    The session row (title, settings, statistics) stays, so the sidebar is unchanged.
+    Returns False if the session became active, or was archived, meanwhile.
+    """
+    with transaction.atomic():
+        # Locking the session row serializes archival with rehydration and new turns
+        chat_session = cold_sessions(days).select_for_update().filter(pk=chat_session_id).first()
+        if chat_session is None:
+            return False
+        messages = Message.objects.filter(chat_session_id=chat_session_id).order_by('timestamp', 'id')
+        rows = [
+            [row[0], row[1], row[2], row[3].isoformat(), row[4]]
+            for row in messages.values_list(*TRANSCRIPT_FIELDS)
+        ]
+        codec, transcript = compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        ArchivedSession.objects.create(
+            chat_session_id=chat_session_id,
+            codec=codec,
+            transcript=transcript,
+            message_count=len(rows)
+        )
+        # The session keeps its statistics while archived; the history is invalidated once below
+        with bulk_message_delete():
+            messages.delete()
+        # update() leaves updated_at alone, so the session keeps its place in the history list
+        ChatSession.objects.filter(pk=chat_session_id).update(is_archived=True)
+    invalidate_history(chat_session_id)
+    return True
+
+def _insert_messages(chat_session_id, rows):
+    Message.objects.bulk_create(
+        [
+            Message(
+                id=pk,
+                chat_session_id=chat_session_id,
+                role=role,
+                content=content,
+                timestamp=parse_datetime(timestamp),
+                character_id=character_id
+            )
+            for pk, role, content, timestamp, character_id in rows
+        ],
+        batch_size=INSERT_BATCH_SIZE
+    )
+
+def rehydrate(chat_session):
+    """
+    Restore an archived session's messages into the message table and drop its archive.
+    Updates `chat_session.is_archived`; returns True if messages were restored.
+    """
+    with transaction.atomic():
+        locked = ChatSession.objects.select_for_update().filter(pk=chat_session.pk, is_archived=True).first()
+        if locked is None:
+            chat_session.is_archived = False
+            return False
+        archive = ArchivedSession.objects.filter(chat_session_id=chat_session.pk).first()
+        if archive is not None:
+            _insert_messages(chat_session.pk, json.loads(decompress(archive.codec, archive.transcript)))
+            archive.delete()
+        ChatSession.objects.filter(pk=chat_session.pk).update(is_archived=False)
+    chat_session.is_archived = False
+    invalidate_history(chat_session.pk)
+    logger.info(f"Rehydrated archived session {chat_session.pk}")
+    return True
+
+def ensure_hot(chat_session):
+    """
+    Rehydrate `chat_session` if it is archived; a no-op (no query) otherwise.
+    """
+    if chat_session.is_archived:
+        rehydrate(chat_session)
+    return chat_session
+
+def ensure_hot_by_id(chat_session_id, user):
+    """
+    Rehydrate the user's session `chat_session_id` if it is archived. One query when it is not.
+    """
+    chat_session = ChatSession.objects.filter(pk=chat_session_id, user=user, is_archived=True).only('id').first()
+    if chat_session is not None:
+        rehydrate(chat_session)
@@ -0,0 +1,163 @@
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .models import Character, ChatSession, Message
+from .serializers import MessageSerializer
+from . import archive, idempotency, throttling
+from .tasks import agenerate_ai_response, aclaim_generation
+from .views import session_settings_from_data, generation_in_progress
+
+logger = logging.getLogger(__name__)
+
+@sync_to_async
+def _authenticate(request):
+    """
+    Resolve the user with the same authentication classes the DRF views use.
+    """
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    user = drf_request.user
+    return user if user and user.is_authenticated else None
+
+@csrf_exempt
+@require_POST
+async def send_message_async(request):
+    """
+    Native async version of ChatViewSet.send_message.
+    Same request/response format and Idempotency-Key handling; runs on the ASGI event
+    loop end-to-end, so an in-flight generation only costs a coroutine instead of a worker thread.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=401
+        )
+
+    try:
+        data = json.loads(request.body or b'{}')
+        key = idempotency.get_key(request)
+    except ValueError as e:
+        message = 'Invalid JSON body' if isinstance(e, json.JSONDecodeError) else str(e)
+        return JsonResponse({'error': message}, status=400)
+
+    if key is None:
+        return await _admit_send_message(user, data)
+
+    fingerprint = idempotency.request_fingerprint(data)
+    record = await idempotency.abegin(user.id, key, fingerprint)
+    if record is not None:
+        return await _replay(request, user, key, fingerprint, record)
+
+    response = await _admit_send_message(user, data)
+    if response.status_code < 400:
+        await idempotency.acomplete(user.id, key, fingerprint, response.status_code, json.loads(response.content))
+    else:
+        await idempotency.aabandon(user.id, key)
+    return response
+
+async def _replay(request, user, key, fingerprint, record):
+    if record['fingerprint'] != fingerprint:
+        return JsonResponse({'error': f'{idempotency.HEADER} was already used for a different request'}, status=422)
+
+    if record['state'] == idempotency.PENDING:
+        record = await idempotency.await_for(user.id, key, getattr(settings, 'CHAT_IDEMPOTENCY_WAIT', 30))
+        if record is None:
+            # The first request failed and released the key; this one takes over
+            return await send_message_async(request)
+        if record['state'] == idempotency.PENDING:
+            return JsonResponse(
+                {'error': f'A request with this {idempotency.HEADER} is still being processed'},
+                status=409
+            )
+
+    response = JsonResponse(record['body'], status=record['status_code'])
+    response[idempotency.REPLAY_HEADER] = 'true'
+    return response
+
+def _rejected(error):
+    response = JsonResponse({'error': str(error)}, status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+async def _admit_send_message(user, data):
+    """
+    _send_message behind the same rate limit and generation slots as ChatViewSet.send_message.
+    """
+    try:
+        await sync_to_async(throttling.check_rate)(user.id, 'send_message')
+        with throttling.generation_slot():
+            return await _send_message(user, data)
+    except throttling.GenerationRejected as e:
+        return _rejected(e)
+
+async def _send_message(user, data):
+    message_content = data.get('message')
+    character_id = data.get('character_id')
+    chat_session_id = data.get('chat_session_id')
+
+    if not message_content or not character_id:
+        return JsonResponse({'error': 'message and character_id are required'}, status=400)
+
+    try:
+        if chat_session_id:
+            chat_session = await ChatSession.objects.select_related('character').aget(
+                id=chat_session_id,
+                user=user,
+                character_id=character_id
+            )
+            if chat_session.is_archived:
+                await sync_to_async(archive.rehydrate)(chat_session)
+            character = chat_session.character
+            if not await aclaim_generation(chat_session):
+                return JsonResponse(generation_in_progress(chat_session.id), status=409)
+        else:
+            character = await Character.objects.aget(id=character_id)
+            chat_session = await ChatSession.objects.acreate(
+                user=user,
+                character=character,
+                title=f"Chat with {character.name}",
+                is_generating_response=True,
+                **session_settings_from_data(data)
+            )
+
+        user_message = await Message.objects.acreate(
+            chat_session=chat_session,
+            role='user',
+            content=message_content,
+            character=character
+        )
+
+    except Character.DoesNotExist:
+        return JsonResponse({'error': 'Character not found'}, status=404)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({'error': 'Chat session not found or access denied'}, status=404)
+
+    result = await agenerate_ai_response(user_message, chat_session, character)
+
+    if result.get('retry_after'):
+        # Circuit open: the upstream was not called
+        response = JsonResponse({'error': result['error']}, status=503)
+        response['Retry-After'] = str(result['retry_after'])
+        return response
+
+    if not result.get('success'):
+        logger.error(f"Async generation failed for session {chat_session.id}: {result.get('error')}")
+        return JsonResponse(
+            {'error': result.get('error', 'Failed to generate AI response')},
+            status=500
+        )
+
+    return JsonResponse({
+        'user_message': MessageSerializer(user_message).data,
+        'ai_message': MessageSerializer(result['message']).data,
+        'chat_session_id': chat_session.id
+    })
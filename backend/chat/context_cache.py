@@ -0,0 +1,193 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import google.generativeai as genai
+from .context_window import estimate_turn_tokens
+from .llm.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Renew a handle this long before it expires so an in-flight request never hits an expired cache
+EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+
+class ContextCacheBackend:
+    """
+    Stores a session's stable prompt prefix on the provider side.
+    """
+    def create(self, model_name, contents, tools, ttl):
+        """
+        Cache `contents` and return (handle_name, expire_time).
+        """
+        raise NotImplementedError
+
+    def refresh(self, name, ttl):
+        """
+        Extend the handle's TTL and return the new expire_time.
+        """
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def bind(self, name, contents):
+        """
+        (contents, cached_content) to pass to the LLM backend for a request using handle `name`.
+        """
+        raise NotImplementedError
+
+class GeminiContextCache(ContextCacheBackend):
+    """
+    Gemini context caching (`genai.caching.CachedContent`).
+    """
+    def create(self, model_name, contents, tools, ttl):
+        registry.configure()
+        cached = genai.caching.CachedContent.create(
+            model=model_name if model_name.startswith('models/') else f"models/{model_name}",
+            contents=contents,
+            tools=tools,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return cached.name, cached.expire_time
+
+    def refresh(self, name, ttl):
+        registry.configure()
+        cached = genai.caching.CachedContent.get(name)
+        cached.update(ttl=datetime.timedelta(seconds=ttl))
+        return cached.expire_time
+
+    def delete(self, name):
+        registry.configure()
+        registry.forget_cached_model(name)
+        genai.caching.CachedContent.get(name).delete()
+
+    def bind(self, name, contents):
+        return contents, name
+
+class LocalContextCache(ContextCacheBackend):
+    """
+    In-process stand-in for provider-side caching: keeps the prefix in memory and
+    prepends it to every request. Lets the handle/TTL bookkeeping run without a network.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'refreshed': 0, 'deleted': 0, 'hits': 0}
+
+    def create(self, model_name, contents, tools, ttl):
+        name = f"localCachedContents/{uuid.uuid4().hex}"
+        expire_time = timezone.now() + datetime.timedelta(seconds=ttl)
+        with self._lock:
+            self._entries[name] = {'contents': list(contents), 'expire_time': expire_time}
+            self.stats['created'] += 1
+        return name, expire_time
+
+    def _get_entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None or entry['expire_time'] <= timezone.now():
+            raise LookupError(f"Cached content {name} not found or expired")
+        return entry
+
+    def refresh(self, name, ttl):
+        with self._lock:
+            entry = self._get_entry(name)
+            entry['expire_time'] = timezone.now() + datetime.timedelta(seconds=ttl)
+            self.stats['refreshed'] += 1
+            return entry['expire_time']
+
+    def delete(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+            self.stats['deleted'] += 1
+
+    def bind(self, name, contents):
+        with self._lock:
+            entry = self._get_entry(name)
+            self.stats['hits'] += 1
+        return entry['contents'] + list(contents), None
+
+_BACKEND_ALIASES = {
+    'gemini': 'chat.context_cache.GeminiContextCache',
+    'local': 'chat.context_cache.LocalContextCache',
+}
+_backend = None
+_backend_path = None
+_backend_lock = threading.Lock()
+
+def get_context_cache():
+    """
+    The configured CHAT_CONTEXT_CACHE_BACKEND ('gemini', 'local' or a dotted path), or None when disabled.
+    """
+    global _backend, _backend_path
+    path = getattr(settings, 'CHAT_CONTEXT_CACHE_BACKEND', '')
+    if not path:
+        return None
+    path = _BACKEND_ALIASES.get(path, path)
+    with _backend_lock:
+        if _backend is None or _backend_path != path:
+            _backend = import_string(path)()
+            _backend_path = path
+        return _backend
+
+def prefix_key(model_name, tools, prefix):
+    raw = json.dumps([model_name, tools, prefix], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def bind_cached_prefix(chat_session, model_name, tools, contents, prefix_length):
+    """
+    Serve contents[:prefix_length] from the session's cached-content handle, creating,
+    renewing or replacing the handle as needed.
+    Returns (contents, cached_content) for the LLM backend, or None when caching is
+    disabled, the prefix is too small to be worth caching, or the backend failed.
+    """
+    backend = get_context_cache()
+    prefix, remaining = contents[:prefix_length], contents[prefix_length:]
+    if backend is None or not remaining:
+        return None
+
+    min_tokens = getattr(settings, 'CHAT_CONTEXT_CACHE_MIN_TOKENS', 4096)
+    if sum(estimate_turn_tokens(turn) for turn in prefix) < min_tokens:
+        return None
+
+    ttl = getattr(settings, 'CHAT_CONTEXT_CACHE_TTL', 60 * 60)
+    key = prefix_key(model_name, tools, prefix)
+    name = chat_session.gemini_chat_id
+    expires_at = chat_session.gemini_cache_expires_at
+    now = timezone.now()
+
+    try:
+        if name and chat_session.gemini_cache_key == key and expires_at and expires_at > now:
+            if expires_at - now < EXPIRY_MARGIN:
+                expires_at = backend.refresh(name, ttl)
+                _save_handle(chat_session, name, key, expires_at)
+            return backend.bind(name, remaining)
+
+        if name:
+            try:
+                backend.delete(name)
+            except Exception as e:
+                logger.info(f"Could not delete stale cached content {name}: {e}")
+
+        name, expires_at = backend.create(model_name, prefix, tools, ttl)
+        _save_handle(chat_session, name, key, expires_at)
+        logger.info(f"Created cached content {name} for session {chat_session.id}")
+        return backend.bind(name, remaining)
+
+    except Exception as e:
+        logger.warning(f"[WARNING] Context cache unavailable for session {chat_session.id}, sending full prompt: {e}")
+        return None
+
+def _save_handle(chat_session, name, key, expires_at):
+    chat_session.gemini_chat_id = name
+    chat_session.gemini_cache_key = key
+    chat_session.gemini_cache_expires_at = expires_at
+    type(chat_session).objects.filter(pk=chat_session.pk).update(
+        gemini_chat_id=name,
+        gemini_cache_key=key,
+        gemini_cache_expires_at=expires_at
+    )
@@ -0,0 +1,122 @@
+import re
+from django.conf import settings
+
+# CJK, kana and hangul are roughly one token per character; everything else ~4 characters per token
+_WIDE_CHARS = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+# Role markers and separators Gemini adds around each turn
+_TURN_OVERHEAD_TOKENS = 4
+# The background summary folds old turns until the recent window uses at most this share of the budget,
+# so it does not have to run again on every turn
+SUMMARY_HEADROOM = 0.5
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate; no API round trip.
+    """
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+def estimate_turn_tokens(turn):
+    return _TURN_OVERHEAD_TOKENS + sum(
+        estimate_tokens(part) for part in turn['parts'] if isinstance(part, str)
+    )
+
+def get_token_budget():
+    return getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 32000)
+
+def get_max_turns():
+    return getattr(settings, 'CHAT_CONTEXT_MAX_TURNS', 40)
+
+def get_memory_token_budget():
+    return getattr(settings, 'CHAT_MEMORY_TOKEN_BUDGET', 2000)
+
+def summary_turn(summary):
+    return {"role": "user", "parts": [f"[EARLIER CONVERSATION SUMMARY]\n{summary}"]}
+
+def memory_turn(memories, budget):
+    """
+    One turn quoting the recalled messages (most relevant first) that fit in `budget`
+    tokens, in chat order; None when none fits.
+    """
+    kept = []
+    used = _TURN_OVERHEAD_TOKENS
+    for memory in memories:
+        line = f"{'Character' if memory['role'] == 'assistant' else 'User'}: {memory['content']}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            continue
+        kept.append((memory['timestamp'], memory['id'], line))
+        used += cost
+    if not kept:
+        return None
+    lines = "\n".join(line for _, _, line in sorted(kept))
+    return {"role": "user", "parts": [f"[RELEVANT EARLIER MESSAGES]\n{lines}"]}
+
+def recent_window_start(turns, budget, max_turns):
+    """
+    Index of the oldest turn in the newest suffix of `turns` that fits in `budget` tokens
+    and `max_turns` turns. The newest turn is always kept.
+    """
+    start = len(turns)
+    used = 0
+    while start > 0 and len(turns) - start < max_turns:
+        cost = estimate_turn_tokens(turns[start - 1])
+        if used + cost > budget and start < len(turns):
+            break
+        used += cost
+        start -= 1
+    return start
+
+def _split_history(chat_session, formatted_history):
+    system_turn, turns = formatted_history[0], formatted_history[1:]
+    summarized = min(chat_session.summarized_turns, len(turns))
+    summary = chat_session.context_summary
+
+    budget = get_token_budget() - estimate_turn_tokens(system_turn)
+    if summary:
+        budget -= estimate_turn_tokens(summary_turn(summary))
+    return system_turn, turns, summarized, summary, budget
+
+def apply_context_window(chat_session, formatted_history, recall=None):
+    """
+    Trim the history to the system prompt, the rolling summary and the most recent turns
+    that fit in the token budget.
+    When turns fall out of the window and `recall` is given, CHAT_MEMORY_TOKEN_BUDGET of the
+    budget goes to the earlier messages most relevant to the newest turn instead:
+    recall(start) returns them (see memory.recall) for a window starting at turns[start].
+    Returns (contents, needs_summary); needs_summary is True when turns fell out of the
+    window without being folded into the summary yet.
+    """
+    system_turn, turns, summarized, summary, budget = _split_history(chat_session, formatted_history)
+
+    start = max(recent_window_start(turns, budget, get_max_turns()), summarized)
+    recalled = None
+    if recall is not None and start > 0:
+        memory_budget = min(get_memory_token_budget(), budget // 2)
+        memory_start = max(recent_window_start(turns, budget - memory_budget, get_max_turns()), summarized)
+        recalled = memory_turn(recall(memory_start), memory_budget)
+        if recalled is not None:
+            start = memory_start
+
+    # The system turn is the cached prefix (see tasks.prepare_generation); what follows may change every turn
+    contents = [system_turn]
+    if summary:
+        contents.append(summary_turn(summary))
+    if recalled is not None:
+        contents.append(recalled)
+    contents.extend(turns[start:])
+
+    return contents, start > summarized
+
+def turns_to_summarize(chat_session, formatted_history):
+    """
+    Turns that should be folded into the rolling summary next, and the new summarized-turn count.
+    """
+    system_turn, turns, summarized, summary, budget = _split_history(chat_session, formatted_history)
+
+    cut = recent_window_start(turns, int(budget * SUMMARY_HEADROOM), get_max_turns())
+    if cut <= summarized:
+        return [], summarized
+    return turns[summarized:cut], cut
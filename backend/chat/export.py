@@ -0,0 +1,113 @@
+import json
+import zlib
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from .archive import decompress
+from .models import ArchivedSession, Character, ChatSession, Message
+
+EXPORT_VERSION = 1
+# Rows fetched per round trip of the server-side cursors
+CHUNK_SIZE = 2000
+# Archives hold a whole compressed transcript each
+ARCHIVE_CHUNK_SIZE = 20
+# Bytes collected before a chunk is handed to the response or file
+WRITE_BUFFER_SIZE = 64 * 1024
+
+CHARACTER_FIELDS = (
+    'id', 'name', 'avatar_url', 'description', 'personality', 'appearance', 'first_message',
+    'scenario', 'example_dialogue', 'affiliation', 'tags', 'response_guidelines',
+    'disabled_states', 'created_at', 'updated_at',
+)
+SESSION_FIELDS = (
+    'id', 'character_id', 'title', 'title_generated', 'created_at', 'updated_at', 'world_time',
+    'user_persona', 'enable_web_search', 'output_language', 'additional_context',
+    'context_summary', 'summarized_turns',
+)
+MESSAGE_FIELDS = ('id', 'chat_session_id', 'role', 'content', 'timestamp', 'character_id')
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder cuts datetimes to milliseconds; exports keep the full microseconds
+    so an import restores timestamps exactly.
+    """
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def iter_records(user, chunk_size=CHUNK_SIZE):
+    """
+    The user's data as export records: a header, then characters (their own and those of
+    their sessions), sessions, and messages grouped by session in chat order. Each table is
+    read through a server-side cursor, so memory does not grow with the history.
+    """
+    yield {'type': 'export', 'version': EXPORT_VERSION, 'user': user.username, 'exported_at': timezone.now()}
+
+    sessions = ChatSession.objects.filter(user=user)
+    characters = Character.objects.filter(Q(created_by=user) | Q(id__in=sessions.values('character_id')))
+    for row in characters.order_by('id').values(*CHARACTER_FIELDS).iterator(chunk_size=chunk_size):
+        yield {'type': 'character', **row}
+
+    for row in sessions.order_by('id').values(*SESSION_FIELDS).iterator(chunk_size=chunk_size):
+        yield {'type': 'session', **row}
+
+    messages = Message.objects.filter(chat_session__user=user).order_by('chat_session_id', 'timestamp', 'id')
+    for row in messages.values(*MESSAGE_FIELDS).iterator(chunk_size=chunk_size):
+        yield {'type': 'message', **row}
+
+    # Messages of archived sessions live in their compressed transcripts (see chat.archive)
+    archives = ArchivedSession.objects.filter(chat_session__user=user).order_by('chat_session_id')
+    for archived in archives.iterator(chunk_size=ARCHIVE_CHUNK_SIZE):
+        for pk, role, content, timestamp, character_id in json.loads(decompress(archived.codec, archived.transcript)):
+            yield {
+                'type': 'message',
+                'id': pk,
+                'chat_session_id': archived.chat_session_id,
+                'role': role,
+                'content': content,
+                'timestamp': timestamp,
+                'character_id': character_id,
+            }
+
+def iter_ndjson(records, buffer_size=WRITE_BUFFER_SIZE):
+    """
+    Encode records as NDJSON (one JSON object per line), yielding chunks of about `buffer_size` bytes.
+    """
+    buffer = []
+    size = 0
+    for record in records:
+        line = (json.dumps(record, cls=ExportJSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def gzip_chunks(chunks, level=6):
+    """
+    Gzip a stream of byte chunks incrementally.
+    """
+    # wbits 31: zlib's deflate with a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def aiter_chunks(chunks):
+    """
+    Serve a synchronous chunk iterator from the ASGI app one chunk at a time (Django would
+    otherwise read a sync iterator to the end before sending anything). Every step runs in
+    the same thread, which keeps the server-side cursors on one connection.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    chunks = iter(chunks)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
@@ -0,0 +1,26 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from . import export
+from .views import _is_truthy
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_data(request):
+    """
+    Stream the user's characters, sessions and messages as NDJSON (`?gzip=1` to compress).
+    """
+    chunks = export.iter_ndjson(export.iter_records(request.user))
+    filename = f"chat-export-{request.user.username}.ndjson"
+    content_type = 'application/x-ndjson'
+    if _is_truthy(request.query_params.get('gzip')):
+        chunks = export.gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    # Django reads an iterator of the other kind to the end before sending anything
+    if isinstance(request._request, ASGIRequest):
+        chunks = export.aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
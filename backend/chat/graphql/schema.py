@@ -3,19 +3,38 @@ from typing import List, Optional
 from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.conf import settings
-import google.generativeai as genai
 import json
 import logging
 import os
 import re
 from urllib.parse import urlparse, unquote
 
-from .types import CharacterType, ChatSessionType, CharacterInput, AICharacterDraft
+from .types import CharacterType, ChatSessionType, CharacterInput, AICharacterDraft, MessageSearchHit, MessageSearchPage
 from chat.models import Character, ChatSession
 from chat.constants import DEFAULT_CHAT_SESSION_SETTINGS
+from chat.history_cache import invalidate_history
+from chat.llm.cache import response_cache
+from chat import throttling
+from chat.pagination import SearchPagination
+from chat.search import render_snippet, search_messages
+from rest_framework.exceptions import NotFound
 
 logger = logging.getLogger(__name__)
 
+def _parse_draft_json(raw_text):
+    raw_text = raw_text.strip()
+    json_match = re.search(r"```(?:json)?\s*(.*?)```", raw_text, re.DOTALL)
+    if json_match:
+        raw_text = json_match.group(1).strip()
+    return json.loads(raw_text)
+
+def _is_draft_json(result):
+    # Only cache drafts that parse, so a malformed reply is retried next time
+    try:
+        return isinstance(_parse_draft_json(result.text), dict)
+    except ValueError:
+        return False
+
 @strawberry.input
 class ChatSessionInput:
     character_id: strawberry.ID
@@ -29,24 +48,28 @@ class ChatSessionInput:
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    async def generate_character_draft(self, file_url: Optional[str] = None, text_context: Optional[str] = None) -> AICharacterDraft:
+    async def generate_character_draft(
+        self,
+        info,
+        file_url: Optional[str] = None,
+        text_context: Optional[str] = None,
+        regenerate: Optional[bool] = False
+    ) -> AICharacterDraft:
         """
-        Calls Gemini API to analyze text and return a structured Character Draft.
+        Calls the LLM backend to analyze text and return a structured Character Draft.
         Handles local file reading for .txt/.md/.json files to support "Auto-Create" from text files.
+        Drafts for identical input are served from the LLM response cache unless `regenerate` is set.
+        Rate limited per user; over the limit or at capacity the request fails with HTTP 429.
         """
-        api_key = getattr(settings, 'GEMINI_API_KEY', '')
-        if not api_key:
-            return AICharacterDraft(
-                name="Generation Failed",
-                description="Server Error: GEMINI_API_KEY not found.",
-                personality="", appearance="", affiliation="",
-                first_message="", scenario="", tags=[], visual_summary=""
-            )
-
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            await sync_to_async(throttling.check_rate)(info.context.request.user.id, 'character_draft')
+            throttling.generation_slots.acquire()
+        except throttling.GenerationRejected as e:
+            info.context.response.status_code = 429
+            info.context.response['Retry-After'] = str(e.retry_after)
+            raise Exception(str(e))
 
+        try:
             file_content_str = ""
             
             if file_url:
@@ -98,14 +121,13 @@ class Mutation:
                 content_parts.append(f"\n[Uploaded File Content]:\n{file_content_str}")
             
             # Generate
-            response = await sync_to_async(model.generate_content)(content_parts)
-            raw_text = response.text.strip()
-            
-            json_match = re.search(r"```(?:json)?\s*(.*?)```", raw_text, re.DOTALL)
-            if json_match:
-                raw_text = json_match.group(1).strip()
-            
-            data = json.loads(raw_text)
+            response = await response_cache.agenerate(
+                'gemini-2.5-flash',
+                content_parts,
+                use_cache=not regenerate,
+                cache_if=_is_draft_json
+            )
+            data = _parse_draft_json(response.text)
 
             return AICharacterDraft(
                 name=data.get("name", "Unknown"),
@@ -127,6 +149,8 @@ class Mutation:
                 personality="", appearance="", affiliation="",
                 first_message="", scenario="", tags=[], visual_summary=""
             )
+        finally:
+            throttling.generation_slots.release()
 
     @strawberry.mutation
     async def create_character(self, info, input: CharacterInput) -> CharacterType:
@@ -223,6 +247,7 @@ class Mutation:
                 session.output_language = input.output_language
                 session.additional_context = input.current_context
                 session.save()
+                invalidate_history(session.id)
                 return session
             except ChatSession.DoesNotExist:
                 raise Exception("Chat session not found")
@@ -252,4 +277,49 @@ class Query:
         except ChatSession.DoesNotExist:
             raise Exception("Chat session not found")
 
+    @strawberry.field
+    async def search_messages(
+        self,
+        info,
+        query: str,
+        chat_session_id: Optional[strawberry.ID] = None,
+        character_id: Optional[strawberry.ID] = None,
+        first: int = 20,
+        after: Optional[str] = None
+    ) -> MessageSearchPage:
+        """
+        Full-text search of the user's messages, best matches first; pass `nextCursor` as `after`.
+        """
+        @sync_to_async
+        def search_sync():
+            user = info.context.request.user
+            if not user.is_authenticated:
+                raise Exception("Authentication required")
+            if not query.strip():
+                raise Exception("query is required")
+            pagination = SearchPagination()
+            try:
+                cursor = pagination.parse_cursor(after) if after else None
+            except NotFound:
+                raise Exception("Invalid cursor")
+            messages = search_messages(user, query, chat_session_id=chat_session_id, character_id=character_id)
+            rows, next_cursor = pagination.page(messages, cursor, max(1, min(first, pagination.max_page_size)))
+            return MessageSearchPage(
+                results=[
+                    MessageSearchHit(
+                        id=message.id,
+                        chat_session_id=message.chat_session_id,
+                        chat_session_title=message.chat_session_title,
+                        role=message.role,
+                        content=message.content,
+                        timestamp=message.timestamp,
+                        rank=message.rank,
+                        snippet=render_snippet(message.snippet)
+                    )
+                    for message in rows
+                ],
+                next_cursor=next_cursor
+            )
+        return await search_sync()
+
 schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
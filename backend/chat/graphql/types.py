@@ -1,4 +1,5 @@
 import strawberry
+from datetime import datetime
 from typing import List, Optional
 
 @strawberry.type
@@ -13,6 +14,22 @@ class AICharacterDraft:
     tags: List[str]
     visual_summary: str
 
+@strawberry.type
+class MessageSearchHit:
+    id: strawberry.ID
+    chat_session_id: strawberry.ID
+    chat_session_title: str
+    role: str
+    content: str
+    timestamp: datetime
+    rank: float
+    snippet: str
+
+@strawberry.type
+class MessageSearchPage:
+    results: List[MessageSearchHit]
+    next_cursor: Optional[str]
+
 @strawberry.input
 class CharacterInput:
     name: str
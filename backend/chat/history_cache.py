@@ -0,0 +1,67 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+def _cache_key(session_id):
+    return f"chat:history:v2:{session_id}"
+
+def _timeout():
+    return getattr(settings, 'CHAT_HISTORY_CACHE_TIMEOUT', 60 * 60)
+
+def settings_fingerprint(chat_session):
+    """
+    Hash of the session settings baked into the system prompt; a change means the cached history is stale.
+    """
+    raw = "\x1f".join([
+        chat_session.world_time or '',
+        chat_session.user_persona or '',
+        chat_session.output_language or '',
+        chat_session.additional_context or '',
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _valid_entry(chat_session, entry):
+    if entry and entry.get('fingerprint') == settings_fingerprint(chat_session):
+        return entry
+    return None
+
+def _make_entry(chat_session, history, message_ids, last_message):
+    return {
+        'fingerprint': settings_fingerprint(chat_session),
+        'last_timestamp': last_message.timestamp,
+        'last_message_id': last_message.id,
+        'message_ids': message_ids,
+        'history': history,
+    }
+
+def get_history(chat_session):
+    """
+    Cached formatted history of a session as {'last_timestamp', 'last_message_id', 'history',
+    'message_ids', ...}, or None. message_ids[i] is the id of the message behind history[i];
+    (last_timestamp, last_message_id) is the position of the newest one in (timestamp, id) order.
+    """
+    return _valid_entry(chat_session, cache.get(_cache_key(chat_session.id)))
+
+async def aget_history(chat_session):
+    return _valid_entry(chat_session, await cache.aget(_cache_key(chat_session.id)))
+
+def store_history(chat_session, history, message_ids, last_message):
+    entry = _make_entry(chat_session, history, message_ids, last_message)
+    cache.set(_cache_key(chat_session.id), entry, _timeout())
+
+async def astore_history(chat_session, history, message_ids, last_message):
+    entry = _make_entry(chat_session, history, message_ids, last_message)
+    await cache.aset(_cache_key(chat_session.id), entry, _timeout())
+
+def invalidate_history(session_id):
+    cache.delete(_cache_key(session_id))
+
+def invalidate_unless_appended(message):
+    """
+    Drop the cached history if a new message sorts before its newest entry, e.g. a concurrent
+    insert that committed after a later one was cached, or a row with an older timestamp.
+    Such a message would otherwise never be picked up by the incremental load.
+    """
+    entry = cache.get(_cache_key(message.chat_session_id))
+    if entry and (message.timestamp, message.id) < (entry['last_timestamp'], entry['last_message_id']):
+        invalidate_history(message.chat_session_id)
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.25
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+
+def _cache_key(user_id, key):
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return f"chat:idempotency:{user_id}:{digest}"
+
+def _timeout():
+    return getattr(settings, 'CHAT_IDEMPOTENCY_TTL', 24 * 60 * 60)
+
+def _pending_timeout():
+    # A pending record only has to outlive the request holding it; if that process dies
+    # the key frees up after a generation's worth of time instead of CHAT_IDEMPOTENCY_TTL.
+    return getattr(settings, 'CHAT_GENERATION_LOCK_TIMEOUT', 180)
+
+def request_fingerprint(data):
+    """
+    Hash of the request body, so a key reused for a different request can be rejected.
+    """
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def get_key(request):
+    """
+    The client's Idempotency-Key header, or None. Over-long keys raise ValueError.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+    return key
+
+def begin(user_id, key, fingerprint):
+    """
+    Record that a request with this key is being processed.
+    Returns None if this is the first request with the key, otherwise the existing record
+    ({'state', 'fingerprint', 'status_code', 'body'}).
+    The pending record expires after CHAT_GENERATION_LOCK_TIMEOUT; complete() keeps the
+    result for CHAT_IDEMPOTENCY_TTL.
+    """
+    record = {'state': PENDING, 'fingerprint': fingerprint}
+    if cache.add(_cache_key(user_id, key), record, _pending_timeout()):
+        return None
+    return cache.get(_cache_key(user_id, key)) or record
+
+async def abegin(user_id, key, fingerprint):
+    record = {'state': PENDING, 'fingerprint': fingerprint}
+    if await cache.aadd(_cache_key(user_id, key), record, _pending_timeout()):
+        return None
+    return await cache.aget(_cache_key(user_id, key)) or record
+
+def complete(user_id, key, fingerprint, status_code, body):
+    cache.set(_cache_key(user_id, key), {
+        'state': COMPLETED,
+        'fingerprint': fingerprint,
+        'status_code': status_code,
+        'body': body,
+    }, _timeout())
+
+async def acomplete(user_id, key, fingerprint, status_code, body):
+    await cache.aset(_cache_key(user_id, key), {
+        'state': COMPLETED,
+        'fingerprint': fingerprint,
+        'status_code': status_code,
+        'body': body,
+    }, _timeout())
+
+def abandon(user_id, key):
+    """
+    Forget a key whose request failed, so the client can retry with it.
+    """
+    cache.delete(_cache_key(user_id, key))
+
+async def aabandon(user_id, key):
+    await cache.adelete(_cache_key(user_id, key))
+
+def wait_for(user_id, key, timeout):
+    """
+    Poll until the request holding the key completes. Returns the completed record,
+    None if the first request failed and released the key, or the pending record on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        record = cache.get(_cache_key(user_id, key))
+        if record is None or record['state'] == COMPLETED or time.monotonic() >= deadline:
+            return record
+        time.sleep(POLL_INTERVAL)
+
+async def await_for(user_id, key, timeout):
+    """
+    Async counterpart of wait_for for the ASGI chat path.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        record = await cache.aget(_cache_key(user_id, key))
+        if record is None or record['state'] == COMPLETED or time.monotonic() >= deadline:
+            return record
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,31 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .importer import BulkImporter, open_upload
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_data(request):
+    """
+    Import uploaded `file`s into the user's account: `.json` character cards first, then
+    NDJSON/JSONL exports and transcripts (optionally gzipped). Responds with the import report.
+    Very large migrations are better run with `manage.py import_chat_data`.
+    """
+    files = request.FILES.getlist('file')
+    if not files:
+        return Response({'error': 'At least one file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        batch_size = int(request.data.get('batch_size') or 0) or None
+    except ValueError:
+        return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    importer = BulkImporter(request.user, batch_size=batch_size)
+    # Cards first, so transcripts can find their character by name
+    files.sort(key=lambda upload: not upload.name.lower().endswith('.json'))
+    for upload in files:
+        if upload.name.lower().endswith('.json'):
+            importer.import_card(upload.read(), source=upload.name)
+        else:
+            importer.import_lines(open_upload(upload), source=upload.name)
+    return Response(importer.finish())
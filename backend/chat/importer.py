@@ -0,0 +1,335 @@
+import gzip
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import session_stats
+from .models import Character, ChatSession, Message
+
+GZIP_MAGIC = b'\x1f\x8b'
+MAX_REPORTED_ERRORS = 100
+ROLES = {role for role, _ in Message.ROLE_CHOICES}
+
+# Export records (chat.export) carry model field names; character cards use their own
+CARD_FIELDS = {
+    'name': 'name',
+    'description': 'description',
+    'personality': 'personality',
+    'scenario': 'scenario',
+    'first_mes': 'first_message',
+    'mes_example': 'example_dialogue',
+    'tags': 'tags',
+}
+SESSION_FIELDS = (
+    'title', 'title_generated', 'world_time', 'user_persona', 'enable_web_search', 'output_language',
+    'additional_context', 'context_summary', 'summarized_turns',
+)
+
+class ImportRecordError(ValueError):
+    """
+    An invalid import record; it is skipped and reported with its line number.
+    """
+
+def open_upload(fileobj):
+    """
+    The binary file object to read lines from, gunzipped when it starts with the gzip magic.
+    """
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    return gzip.GzipFile(fileobj=fileobj) if head == GZIP_MAGIC else fileobj
+
+def parse_timestamp(value):
+    """
+    An aware datetime from an ISO 8601 string or a Unix time in seconds or milliseconds;
+    None for a missing or unrecognised value.
+    """
+    if isinstance(value, bool) or value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        # Anything past the year 5000 in seconds is a JavaScript millisecond time
+        seconds = value / 1000 if value > 10 ** 11 else value
+        try:
+            return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    try:
+        parsed = parse_datetime(str(value).strip())
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+def _text(record, key, max_length=None, required=False):
+    value = record.get(key)
+    if value is None:
+        if required:
+            raise ImportRecordError(f"'{key}' is required")
+        return ''
+    if not isinstance(value, str):
+        raise ImportRecordError(f"'{key}' must be a string")
+    if required and not value.strip():
+        raise ImportRecordError(f"'{key}' must not be empty")
+    return value[:max_length] if max_length else value
+
+def card_fields(card):
+    """
+    Character fields from a character card (the spec v1 flat layout, or v2/v3 with the
+    fields under "data").
+    """
+    if not isinstance(card, dict):
+        raise ImportRecordError("A character card must be a JSON object")
+    data = card['data'] if isinstance(card.get('data'), dict) else card
+    fields = {field: data.get(key) for key, field in CARD_FIELDS.items() if data.get(key) is not None}
+    return _character_fields(fields)
+
+def _character_fields(record):
+    fields = {'name': _text(record, 'name', max_length=100, required=True)}
+    for field in ('description', 'first_message', 'scenario', 'example_dialogue', 'affiliation'):
+        fields[field] = _text(record, field)
+    for field in ('personality', 'appearance', 'response_guidelines'):
+        if record.get(field) is not None:
+            fields[field] = _text(record, field)
+    tags = record.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ImportRecordError("'tags' must be a list of strings")
+    fields['tags'] = tags
+    avatar_url = record.get('avatar_url')
+    if isinstance(avatar_url, str) and avatar_url.startswith(('http://', 'https://')):
+        fields['avatar_url'] = avatar_url[:500]
+    if isinstance(record.get('disabled_states'), dict):
+        fields['disabled_states'] = record['disabled_states']
+    return fields
+
+class BulkImporter:
+    """
+    Imports characters, sessions and messages for `user` from:
+    - NDJSON exports of chat.export (records with a "type"),
+    - JSONL chat transcripts in the SillyTavern layout (a header line with "character_name",
+      then one line per message with "mes", "is_user" and "send_date"),
+    - character-card JSON (import_card).
+
+    Records are validated one at a time as they are read; invalid ones are skipped and
+    reported. Messages are written with bulk_create, `batch_size` rows per transaction, with
+    their original timestamps. `progress` is called with report() after every batch.
+    """
+    def __init__(self, user, batch_size=None, progress=None):
+        self.user = user
+        self.batch_size = max(1, batch_size or getattr(settings, 'CHAT_IMPORT_BATCH_SIZE', 1000))
+        self.progress = progress
+        self.counts = {'characters': 0, 'sessions': 0, 'messages': 0, 'skipped': 0}
+        self.errors = []
+        self._started = time.monotonic()
+        # Export ids -> rows created by this import
+        self._characters = {}
+        self._sessions = {}
+        self._characters_by_name = {}
+        # Session id -> (created_at, updated_at) from the source, applied in finish()
+        self._session_times = {}
+        # Session id -> time of its latest imported message
+        self._last_timestamps = {}
+        self._pending = []
+        self._transcript = None
+
+    # Reading
+
+    def import_lines(self, lines, source=''):
+        """
+        Import an NDJSON/JSONL stream (an iterable of str or bytes lines).
+        """
+        self._transcript = None
+        for number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ImportRecordError("Each line must be a JSON object")
+                self._import_record(record)
+            except ValueError as e:
+                # ImportRecordError or a JSON syntax error
+                self._skip(f"{source}:{number}" if source else str(number), e)
+        self._flush()
+
+    def import_card(self, data, source=''):
+        """
+        Import a character card from a JSON document.
+        """
+        try:
+            card = json.loads(data)
+            self._create_character(card_fields(card))
+        except ValueError as e:
+            self._skip(source or 'card', e)
+
+    def _skip(self, where, error):
+        self.counts['skipped'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': where, 'error': str(error)})
+
+    def _import_record(self, record):
+        kind = record.get('type')
+        if kind == 'export':
+            return
+        if kind == 'character':
+            character = self._create_character(_character_fields(record))
+            if record.get('id') is not None:
+                self._characters[record['id']] = character
+        elif kind == 'session':
+            self._import_session(record)
+        elif kind == 'message':
+            chat_session = self._sessions.get(record.get('chat_session_id'))
+            if chat_session is None:
+                raise ImportRecordError(f"Unknown session {record.get('chat_session_id')}")
+            role = record.get('role')
+            if role not in ROLES:
+                raise ImportRecordError(f"Invalid role {role!r}")
+            self._add_message(chat_session, role, _text(record, 'content'), record.get('timestamp'))
+        elif kind is not None:
+            raise ImportRecordError(f"Unknown record type {kind!r}")
+        elif 'mes' in record:
+            self._import_transcript_message(record)
+        elif 'character_name' in record or 'user_name' in record:
+            self._start_transcript(record)
+        else:
+            raise ImportRecordError("Unrecognized record")
+
+    # Writing
+
+    def _create_character(self, fields):
+        character = Character.objects.create(created_by=self.user, **fields)
+        self._characters_by_name.setdefault(character.name, character)
+        self.counts['characters'] += 1
+        return character
+
+    def _character_named(self, name):
+        character = self._characters_by_name.get(name)
+        if character is None:
+            character = Character.objects.filter(created_by=self.user, name=name).order_by('id').first()
+            if character is None:
+                character = self._create_character({'name': name[:100], 'description': ''})
+            self._characters_by_name[name] = character
+        return character
+
+    def _create_session(self, character, fields, created_at=None, updated_at=None):
+        chat_session = ChatSession.objects.create(
+            user=self.user,
+            character=character,
+            **{'title': f"Chat with {character.name}", **fields}
+        )
+        self._session_times[chat_session.id] = (created_at, updated_at)
+        self.counts['sessions'] += 1
+        return chat_session
+
+    def _import_session(self, record):
+        character = self._characters.get(record.get('character_id'))
+        if character is None:
+            raise ImportRecordError(f"Unknown character {record.get('character_id')}")
+        fields = {}
+        for field in SESSION_FIELDS:
+            if record.get(field) is None:
+                continue
+            model_field = ChatSession._meta.get_field(field)
+            try:
+                value = model_field.to_python(record[field])
+            except ValidationError as e:
+                raise ImportRecordError(f"Invalid '{field}': {' '.join(e.messages)}")
+            if isinstance(value, int) and not isinstance(value, bool) and value < 0:
+                raise ImportRecordError(f"'{field}' must not be negative")
+            elif isinstance(value, str) and model_field.max_length:
+                value = value[:model_field.max_length]
+            fields[field] = value
+        chat_session = self._create_session(
+            character, fields,
+            created_at=parse_timestamp(record.get('created_at')),
+            updated_at=parse_timestamp(record.get('updated_at'))
+        )
+        if record.get('id') is not None:
+            self._sessions[record['id']] = chat_session
+
+    def _start_transcript(self, header):
+        name = header.get('character_name')
+        if not isinstance(name, str) or not name.strip():
+            raise ImportRecordError("'character_name' is required in a transcript header")
+        created_at = parse_timestamp(header.get('create_date'))
+        self._transcript = self._create_session(self._character_named(name.strip()), {}, created_at=created_at)
+
+    def _import_transcript_message(self, record):
+        if self._transcript is None:
+            raise ImportRecordError("Transcript message before the header line")
+        if record.get('is_system'):
+            # Hidden/system notes of the source frontend are not chat turns
+            self.counts['skipped'] += 1
+            return
+        role = 'user' if record.get('is_user') else 'assistant'
+        self._add_message(self._transcript, role, _text(record, 'mes'), record.get('send_date'))
+
+    def _add_message(self, chat_session, role, content, timestamp):
+        # Messages without a usable time keep their place right after the previous one
+        # ((timestamp, id) ordering; ids grow in insertion order)
+        timestamp = (
+            parse_timestamp(timestamp)
+            or self._last_timestamps.get(chat_session.id)
+            or self._session_times[chat_session.id][0]
+            or timezone.now()
+        )
+        self._last_timestamps[chat_session.id] = timestamp
+        self._pending.append(Message(
+            chat_session_id=chat_session.id,
+            role=role,
+            content=content,
+            timestamp=timestamp,
+            character_id=chat_session.character_id
+        ))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with transaction.atomic():
+            Message.objects.bulk_create(self._pending)
+        self.counts['messages'] += len(self._pending)
+        self._pending = []
+        if self.progress:
+            self.progress(self.report())
+
+    def finish(self):
+        """
+        Write the remaining messages, then compute the statistics and times of the imported
+        sessions. Returns report().
+        """
+        self._flush()
+        session_ids = list(self._session_times)
+        for start in range(0, len(session_ids), self.batch_size):
+            batch = session_ids[start:start + self.batch_size]
+            with transaction.atomic():
+                imported = ChatSession.objects.filter(id__in=batch)
+                session_stats.rebuild(imported)
+                # update() skips auto_now, so the source times stick
+                imported.exclude(last_message_at=None).update(updated_at=F('last_message_at'))
+                timed = []
+                for chat_session in imported.only('id', 'created_at', 'updated_at'):
+                    created_at, updated_at = self._session_times[chat_session.id]
+                    if created_at or updated_at:
+                        chat_session.created_at = created_at or chat_session.created_at
+                        chat_session.updated_at = updated_at or chat_session.updated_at
+                        timed.append(chat_session)
+                ChatSession.objects.bulk_update(timed, ['created_at', 'updated_at'])
+        return self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self._started
+        rows = self.counts['characters'] + self.counts['sessions'] + self.counts['messages']
+        return {
+            **self.counts,
+            'errors': list(self.errors),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+        }
@@ -0,0 +1,28 @@
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_BACKEND_ALIASES = {
+    'gemini': 'chat.llm.gemini.GeminiBackend',
+    'fake': 'chat.llm.fake.FakeBackend',
+}
+_backends = {}
+_lock = threading.Lock()
+
+def get_backend():
+    """
+    The LLM backend selected by settings.LLM_BACKEND ('gemini', 'fake' or a dotted path), one instance per process.
+    Unless LLM_RESILIENCE_ENABLED is off it is wrapped in chat.llm.resilience.ResilientBackend.
+    """
+    path = getattr(settings, 'LLM_BACKEND', 'gemini')
+    path = _BACKEND_ALIASES.get(path, path)
+    resilient = getattr(settings, 'LLM_RESILIENCE_ENABLED', True)
+    with _lock:
+        backend = _backends.get((path, resilient))
+        if backend is None:
+            backend = import_string(path)()
+            if resilient:
+                from .resilience import ResilientBackend
+                backend = ResilientBackend(backend)
+            _backends[(path, resilient)] = backend
+        return backend
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+class LLMError(Exception):
+    """
+    Raised by backends for upstream failures. `retryable` marks transient ones
+    (timeouts, rate limits, 5xx) that chat.llm.resilience may retry.
+    """
+    retryable = False
+
+class TransientLLMError(LLMError):
+    retryable = True
+
+class LLMTimeoutError(TransientLLMError):
+    """
+    The call did not finish before its deadline.
+    """
+
+class LLMUnavailableError(LLMError):
+    """
+    Raised without calling the upstream while its circuit breaker is open.
+    """
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class LLMResult:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+class LLMBackend:
+    """
+    Interface every LLM provider implements. `contents` is a prompt string or a list
+    of {"role", "parts"} turns; `cached_content` names a provider-side cached prefix
+    (see chat.context_cache); `timeout` is the call's deadline in seconds (None = no limit).
+    """
+    name = 'base'
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        """
+        Return an LLMResult for the whole response.
+        """
+        raise NotImplementedError
+
+    async def agenerate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        raise NotImplementedError
+
+    def stream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        """
+        Yield text chunks as they are produced, then (where the provider reports it)
+        an LLMResult with empty text carrying the token usage of the whole response.
+        """
+        raise NotImplementedError
+
+    async def astream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        raise NotImplementedError
+        yield
+
+    def count_tokens(self, model_name, contents):
+        raise NotImplementedError
+
+    def upload_file(self, path, display_name):
+        """
+        Upload a file for use in prompts; returns {"name", "uri", "display_name"}.
+        """
+        raise NotImplementedError
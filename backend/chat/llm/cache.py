@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import asdict
+from django.conf import settings
+from django.core.cache import caches
+from . import get_backend
+from .base import LLMResult
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'llm'
+KEY_VERSION = 1
+
+class LLMResponseCache:
+    """
+    Content-addressed cache for deterministic LLM side calls (titles, character drafts).
+
+    Results are stored under a hash of (backend, model, contents, tools) in the 'llm'
+    cache alias: a bounded in-process LRU, or Redis when REDIS_URL is set. Entries expire
+    after LLM_CACHE_TTL seconds. Hit/miss counters are per process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._errors = 0
+
+    def _store(self):
+        return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+    def _enabled(self, use_cache):
+        return use_cache and getattr(settings, 'LLM_CACHE_ENABLED', True)
+
+    def _timeout(self):
+        return getattr(settings, 'LLM_CACHE_TTL', 24 * 60 * 60)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def make_key(self, backend, model_name, contents, tools=None):
+        raw = json.dumps([backend.name, model_name, contents, tools], sort_keys=True, default=str)
+        return f"llm:response:v{KEY_VERSION}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, entry):
+        if entry is None:
+            self._count('_misses')
+            return None
+        self._count('_hits')
+        return LLMResult(**entry)
+
+    def _cacheable(self, result, cache_if):
+        return bool(result.text.strip()) and (cache_if is None or cache_if(result))
+
+    def generate(self, model_name, contents, tools=None, use_cache=True, cache_if=None):
+        """
+        backend.generate() through the cache. Pass use_cache=False to always call the
+        model; cache_if(result) can reject results that should not be stored.
+        """
+        backend = get_backend()
+        if not self._enabled(use_cache):
+            self._count('_bypassed')
+            return backend.generate(model_name, contents, tools=tools)
+
+        key = self.make_key(backend, model_name, contents, tools)
+        try:
+            cached = self._lookup(self._store().get(key))
+        except Exception as e:
+            self._count('_errors')
+            logger.warning(f"[WARNING] LLM cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        result = backend.generate(model_name, contents, tools=tools)
+        if self._cacheable(result, cache_if):
+            try:
+                self._store().set(key, asdict(result), self._timeout())
+            except Exception as e:
+                self._count('_errors')
+                logger.warning(f"[WARNING] LLM cache store failed: {e}")
+        return result
+
+    async def agenerate(self, model_name, contents, tools=None, use_cache=True, cache_if=None):
+        backend = get_backend()
+        if not self._enabled(use_cache):
+            self._count('_bypassed')
+            return await backend.agenerate(model_name, contents, tools=tools)
+
+        key = self.make_key(backend, model_name, contents, tools)
+        try:
+            cached = self._lookup(await self._store().aget(key))
+        except Exception as e:
+            self._count('_errors')
+            logger.warning(f"[WARNING] LLM cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        result = await backend.agenerate(model_name, contents, tools=tools)
+        if self._cacheable(result, cache_if):
+            try:
+                await self._store().aset(key, asdict(result), self._timeout())
+            except Exception as e:
+                self._count('_errors')
+                logger.warning(f"[WARNING] LLM cache store failed: {e}")
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = self._misses = self._bypassed = self._errors = 0
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': getattr(settings, 'LLM_CACHE_ENABLED', True),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'bypassed': self._bypassed,
+                'errors': self._errors,
+            }
+
+response_cache = LLMResponseCache()
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from django.conf import settings
+from chat.context_window import estimate_tokens
+from .base import LLMBackend, LLMResult, LLMTimeoutError, TransientLLMError
+
+_WORDS = (
+    "the quiet harbor lantern drifted past old stone walls while rain tapped softly on "
+    "copper roofs and a distant bell counted hours nobody remembered keeping"
+).split()
+
+class FakeLLMError(TransientLLMError):
+    """
+    Injected failure, standing in for a transient upstream error (e.g. a 503).
+    """
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline backend for load tests. The reply depends only on the prompt;
+    latency, throughput and failures are configured with the LLM_FAKE_* settings
+    (read on every call so they can be changed at runtime):
+
+    - LLM_FAKE_LATENCY: seconds before the first token
+    - LLM_FAKE_TOKENS_PER_SECOND: generation speed (0 = instant)
+    - LLM_FAKE_RESPONSE_TOKENS: reply length in words
+    - LLM_FAKE_FAILURE_RATE: probability in [0, 1] that a call raises FakeLLMError
+    - LLM_FAKE_SEED: seed for the failure sequence
+
+    A call whose delay exceeds its `timeout` raises LLMTimeoutError after `timeout` seconds.
+    """
+    name = 'fake'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._random = random.Random(getattr(settings, 'LLM_FAKE_SEED', 0))
+        self._in_flight = 0
+        self.stats = {'calls': 0, 'failures': 0, 'peak_in_flight': 0}
+
+    def _config(self):
+        return (
+            getattr(settings, 'LLM_FAKE_LATENCY', 0.5),
+            getattr(settings, 'LLM_FAKE_TOKENS_PER_SECOND', 50),
+            getattr(settings, 'LLM_FAKE_RESPONSE_TOKENS', 60),
+            getattr(settings, 'LLM_FAKE_FAILURE_RATE', 0.0),
+        )
+
+    def _begin(self, failure_rate):
+        with self._lock:
+            self.stats['calls'] += 1
+            if failure_rate and self._random.random() < failure_rate:
+                self.stats['failures'] += 1
+                raise FakeLLMError("Injected fake LLM failure")
+            self._in_flight += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self._in_flight)
+
+    def _end(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'calls': 0, 'failures': 0, 'peak_in_flight': self._in_flight}
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'in_flight': self._in_flight}
+
+    def _reply_words(self, model_name, contents, length):
+        digest = hashlib.sha256(
+            json.dumps([model_name, contents], sort_keys=True, default=str).encode('utf-8')
+        ).digest()
+        return [_WORDS[(digest[i % len(digest)] + i) % len(_WORDS)] for i in range(length)]
+
+    def _result(self, contents, words):
+        text = ' '.join(words).capitalize() + '.'
+        return LLMResult(text=text, prompt_tokens=self.count_tokens(None, contents), completion_tokens=len(words))
+
+    def _usage(self, contents, words):
+        return LLMResult(text='', prompt_tokens=self.count_tokens(None, contents), completion_tokens=len(words))
+
+    def _delay(self, delay, timeout):
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"Fake LLM call exceeded its {timeout}s deadline")
+        time.sleep(delay)
+
+    async def _adelay(self, delay, timeout):
+        if timeout and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"Fake LLM call exceeded its {timeout}s deadline")
+        await asyncio.sleep(delay)
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        latency, tokens_per_second, length, failure_rate = self._config()
+        self._begin(failure_rate)
+        try:
+            self._delay(latency + (length / tokens_per_second if tokens_per_second else 0), timeout)
+            return self._result(contents, self._reply_words(model_name, contents, length))
+        finally:
+            self._end()
+
+    async def agenerate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        latency, tokens_per_second, length, failure_rate = self._config()
+        self._begin(failure_rate)
+        try:
+            await self._adelay(latency + (length / tokens_per_second if tokens_per_second else 0), timeout)
+            return self._result(contents, self._reply_words(model_name, contents, length))
+        finally:
+            self._end()
+
+    def stream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        latency, tokens_per_second, length, failure_rate = self._config()
+        self._begin(failure_rate)
+        try:
+            self._delay(latency, timeout)
+            words = self._reply_words(model_name, contents, length)
+            for word in words:
+                if tokens_per_second:
+                    time.sleep(1 / tokens_per_second)
+                yield word + ' '
+            yield self._usage(contents, words)
+        finally:
+            self._end()
+
+    async def astream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        latency, tokens_per_second, length, failure_rate = self._config()
+        self._begin(failure_rate)
+        try:
+            await self._adelay(latency, timeout)
+            words = self._reply_words(model_name, contents, length)
+            for word in words:
+                if tokens_per_second:
+                    await asyncio.sleep(1 / tokens_per_second)
+                yield word + ' '
+            yield self._usage(contents, words)
+        finally:
+            self._end()
+
+    def count_tokens(self, model_name, contents):
+        if isinstance(contents, str):
+            return estimate_tokens(contents)
+        total = 0
+        for item in contents:
+            parts = item.get('parts', []) if isinstance(item, dict) else [item]
+            total += sum(estimate_tokens(part) for part in parts if isinstance(part, str))
+        return total
+
+    def upload_file(self, path, display_name):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        return {
+            'name': f"files/fake-{digest}",
+            'uri': f"fake://files/{digest}",
+            'display_name': display_name or os.path.basename(path),
+        }
@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from google.api_core import exceptions as google_exceptions
+import google.generativeai as genai
+from .base import LLMBackend, LLMError, LLMResult, LLMTimeoutError, TransientLLMError
+from .registry import registry
+
+# Upstream errors worth retrying: overload, rate limits and server-side failures
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.Aborted,
+)
+
+@contextmanager
+def _translate_errors():
+    try:
+        yield
+    except google_exceptions.DeadlineExceeded as e:
+        raise LLMTimeoutError(str(e)) from e
+    except RETRYABLE_ERRORS as e:
+        raise TransientLLMError(str(e)) from e
+    except google_exceptions.GoogleAPICallError as e:
+        raise LLMError(str(e)) from e
+    except ValueError as e:
+        # response.text of a blocked or empty candidate
+        raise LLMError(str(e)) from e
+
+def _request_options(timeout):
+    return {'timeout': timeout} if timeout else None
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. the final finish_reason chunk)
+        return ''
+
+def _result(response, text=None):
+    usage = getattr(response, 'usage_metadata', None)
+    return LLMResult(
+        text=response.text if text is None else text,
+        prompt_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+        completion_tokens=getattr(usage, 'candidates_token_count', 0) or 0,
+    )
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini through google-generativeai, using the shared model registry.
+    """
+    name = 'gemini'
+
+    def _model(self, model_name, tools, cached_content):
+        if cached_content:
+            return registry.get_cached_model(cached_content)
+        return registry.get_model(model_name, tools=tools)
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        with _translate_errors():
+            response = self._model(model_name, tools, cached_content).generate_content(
+                contents, request_options=_request_options(timeout)
+            )
+            return _result(response)
+
+    async def agenerate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        with _translate_errors():
+            response = await self._model(model_name, tools, cached_content).generate_content_async(
+                contents, request_options=_request_options(timeout)
+            )
+            return _result(response)
+
+    def stream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        with _translate_errors():
+            response = self._model(model_name, tools, cached_content).generate_content(
+                contents, stream=True, request_options=_request_options(timeout)
+            )
+            chunk = None
+            for chunk in response:
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        if chunk is not None:
+            # The last chunk carries the usage of the whole response
+            yield _result(chunk, text='')
+
+    async def astream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        model = self._model(model_name, tools, cached_content)
+        with _translate_errors():
+            response = await model.generate_content_async(
+                contents, stream=True, request_options=_request_options(timeout)
+            )
+            chunk = None
+            async for chunk in response:
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        if chunk is not None:
+            yield _result(chunk, text='')
+
+    def count_tokens(self, model_name, contents):
+        return registry.get_model(model_name).count_tokens(contents).total_tokens
+
+    def upload_file(self, path, display_name):
+        registry.configure()
+        gemini_file = genai.upload_file(path=path, display_name=display_name)
+        return {
+            'name': gemini_file.name,
+            'uri': gemini_file.uri,
+            'display_name': gemini_file.display_name,
+        }
@@ -0,0 +1,111 @@
+import json
+import threading
+from celery.signals import worker_process_init
+from django.conf import settings
+import google.generativeai as genai
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe cache of Gemini models keyed by (model name, tools config).
+
+    genai.configure() throws away the SDK's shared API clients (and their open
+    connections), so it runs once per API key instead of once per call. Cached
+    models keep using those clients across requests and Celery tasks.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._api_key = None
+        self._hits = 0
+        self._misses = 0
+        self._configures = 0
+
+    def configure(self):
+        """
+        Configure the SDK with GEMINI_API_KEY if it has not been already (or the key changed).
+        """
+        api_key = getattr(settings, 'GEMINI_API_KEY', '')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in settings")
+
+        if self._api_key == api_key:
+            return
+        with self._lock:
+            if self._api_key != api_key:
+                genai.configure(api_key=api_key)
+                self._models.clear()
+                self._api_key = api_key
+                self._configures += 1
+
+    def get_model(self, model_name, tools=None):
+        self.configure()
+        key = (model_name, json.dumps(tools, sort_keys=True) if tools else None)
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._hits += 1
+                return model
+
+            self._misses += 1
+            model = genai.GenerativeModel(model_name, tools=tools)
+            self._models[key] = model
+            return model
+
+    def get_cached_model(self, cached_content_name):
+        """
+        Model bound to a provider-side cached content handle (see chat.context_cache).
+        """
+        self.configure()
+        key = ('cached', cached_content_name)
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._hits += 1
+                return model
+
+        cached_content = genai.caching.CachedContent.get(cached_content_name)
+        model = genai.GenerativeModel.from_cached_content(cached_content)
+        with self._lock:
+            self._misses += 1
+            self._models[key] = model
+        return model
+
+    def forget_cached_model(self, cached_content_name):
+        with self._lock:
+            self._models.pop(('cached', cached_content_name), None)
+
+    def reset(self):
+        """
+        Drop cached models and force a fresh configure, e.g. in a newly forked worker process.
+        """
+        with self._lock:
+            self._models.clear()
+            self._api_key = None
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'models': len(self._models),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'configures': self._configures,
+                'keys': [
+                    {'model': model_name, 'tools': bool(tools)}
+                    for model_name, tools in self._models
+                    if model_name != 'cached'
+                ],
+            }
+
+registry = ModelRegistry()
+
+def get_model(model_name, tools=None):
+    return registry.get_model(model_name, tools=tools)
+
+@worker_process_init.connect
+def _reset_after_fork(**kwargs):
+    # gRPC channels must not be shared across fork(); each Celery child builds its own
+    registry.reset()
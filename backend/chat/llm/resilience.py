@@ -0,0 +1,363 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import aclosing, closing
+from django.conf import settings
+from .base import LLMBackend, LLMError, LLMTimeoutError, LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 200
+# Threads running sync calls; a call that overruns its timeout keeps its thread until it returns
+CALL_WORKERS = 64
+
+def _policy():
+    """
+    Resilience settings, read on every call so they can be changed at runtime.
+    """
+    return {
+        'attempt_timeout': getattr(settings, 'LLM_TIMEOUT', 60),
+        'deadline': getattr(settings, 'LLM_DEADLINE', 120),
+        'max_attempts': max(1, getattr(settings, 'LLM_MAX_ATTEMPTS', 3)),
+        'base_delay': getattr(settings, 'LLM_RETRY_BASE_DELAY', 0.5),
+        'max_delay': getattr(settings, 'LLM_RETRY_MAX_DELAY', 8),
+        'hedge_percentile': getattr(settings, 'LLM_HEDGE_PERCENTILE', 0),
+        'hedge_min_samples': getattr(settings, 'LLM_HEDGE_MIN_SAMPLES', 20),
+    }
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Full-jitter exponential backoff before retry number `attempt` (1-based).
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream model.
+
+    After LLM_CIRCUIT_FAILURE_THRESHOLD transient failures in a row the circuit opens
+    and calls fail fast with LLMUnavailableError. After LLM_CIRCUIT_RESET_TIMEOUT seconds
+    one trial call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _reset_timeout(self):
+        return getattr(settings, 'LLM_CIRCUIT_RESET_TIMEOUT', 30)
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            retry_after = self.opened_at + self._reset_timeout() - time.monotonic()
+            if retry_after <= 0:
+                # Let a single trial call through (or another one if the last trial never reported back)
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return
+            self.rejected += 1
+            raise LLMUnavailableError(
+                f"LLM upstream for {self.name} is unavailable; try again later",
+                retry_after=max(1, round(retry_after))
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        threshold = getattr(settings, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 5)
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (threshold and self.failures >= threshold):
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning(f"[WARNING] Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+class ResilientBackend(LLMBackend):
+    """
+    Wraps an LLMBackend with per-call deadlines, jittered retries of retryable errors,
+    a circuit breaker per model and optional hedging.
+
+    `timeout` on a call is its total deadline across retries (default LLM_DEADLINE); each
+    attempt gets at most LLM_TIMEOUT of it, and backoff never sleeps past it. Non-streaming
+    attempts are abandoned when their time is up even if the wrapped backend ignores its
+    timeout (sync calls run in a thread pool for that). With LLM_HEDGE_PERCENTILE set, a non-streaming
+    call still running after that percentile of recent latencies gets a second request and
+    the first answer wins. Streams are only retried before their first chunk.
+    Other attributes (e.g. the fake backend's stats) are delegated to the wrapped backend.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._latencies = {}
+        self._executor = None
+        self._stats = {'calls': 0, 'retries': 0, 'timeouts': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def breaker(self, model_name):
+        with self._lock:
+            if model_name not in self._breakers:
+                self._breakers[model_name] = CircuitBreaker(model_name)
+            return self._breakers[model_name]
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _record_latency(self, model_name, seconds):
+        with self._lock:
+            self._latencies.setdefault(model_name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def _hedge_delay(self, model_name, policy):
+        if not policy['hedge_percentile']:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(model_name, ()))
+        if len(samples) < policy['hedge_min_samples']:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * policy['hedge_percentile'] / 100))
+        return samples[index]
+
+    def _attempts(self, model_name, timeout):
+        """
+        Yield (attempt, attempt_timeout) while another attempt is allowed by the policy,
+        the deadline and the circuit breaker.
+        """
+        policy = _policy()
+        deadline = time.monotonic() + (timeout or policy['deadline'])
+        policy['expires_at'] = deadline
+        for attempt in range(1, policy['max_attempts'] + 1):
+            self.breaker(model_name).before_call()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call to {model_name} ran out of time after {attempt - 1} attempts")
+            yield attempt, min(policy['attempt_timeout'], remaining), policy
+
+    def _should_retry(self, model_name, error, attempt, policy):
+        """
+        Record the failure and return the backoff delay before the next attempt (cut short at the
+        deadline), or None to give up.
+        """
+        breaker = self.breaker(model_name)
+        if not getattr(error, 'retryable', False):
+            # The upstream answered; the request itself was bad
+            breaker.record_success()
+            return None
+        if isinstance(error, LLMTimeoutError):
+            self._count('timeouts')
+        breaker.record_failure()
+        if attempt >= policy['max_attempts']:
+            return None
+        self._count('retries')
+        delay = backoff_delay(attempt, policy['base_delay'], policy['max_delay'])
+        delay = max(0, min(delay, policy['expires_at'] - time.monotonic()))
+        logger.warning(f"[WARNING] LLM call to {model_name} failed ({error}); retry {attempt} in {delay:.2f}s")
+        return delay
+
+    def _succeeded(self, model_name, started):
+        self.breaker(model_name).record_success()
+        self._record_latency(model_name, time.monotonic() - started)
+
+    def _submit(self, call, attempt_timeout):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix='llm-call')
+        return self._executor.submit(call, attempt_timeout)
+
+    def _hedged(self, call, model_name, attempt_timeout, policy):
+        """
+        Sync counterpart of _ahedged: the attempt runs in the pool and is given up on after
+        attempt_timeout, hedge included, like asyncio.wait_for on the async path.
+        """
+        started = time.monotonic()
+        first = self._submit(call, attempt_timeout)
+        pending = {first}
+        second = None
+        hedge_delay = self._hedge_delay(model_name, policy)
+        if hedge_delay is not None and hedge_delay < attempt_timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count('hedged')
+                second = self._submit(call, max(0.001, attempt_timeout - (time.monotonic() - started)))
+                pending.add(second)
+
+        error = None
+        while pending:
+            remaining = attempt_timeout - (time.monotonic() - started)
+            done, pending = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                # The requests cannot be cancelled; they end at their own timeout
+                raise LLMTimeoutError(f"LLM call to {model_name} exceeded {attempt_timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count('hedge_wins')
+                    # The losing request cannot be cancelled; it ends at its own timeout
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, call, model_name, attempt_timeout, policy):
+        hedge_delay = self._hedge_delay(model_name, policy)
+        if hedge_delay is None or hedge_delay >= attempt_timeout:
+            return await call(attempt_timeout)
+
+        started = time.monotonic()
+        first = asyncio.ensure_future(call(attempt_timeout))
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+        if done:
+            return first.result()
+
+        self._count('hedged')
+        second = asyncio.ensure_future(call(max(0.001, attempt_timeout - (time.monotonic() - started))))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        self._count('calls')
+
+        def call(attempt_timeout):
+            return self.backend.generate(
+                model_name, contents, tools=tools, cached_content=cached_content, timeout=attempt_timeout
+            )
+
+        for attempt, attempt_timeout, policy in self._attempts(model_name, timeout):
+            started = time.monotonic()
+            try:
+                result = self._hedged(call, model_name, attempt_timeout, policy)
+            except LLMError as e:
+                delay = self._should_retry(model_name, e, attempt, policy)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(model_name, started)
+            return result
+
+    async def agenerate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        self._count('calls')
+
+        async def call(attempt_timeout):
+            try:
+                # Hard stop even if the backend ignores its timeout
+                return await asyncio.wait_for(self.backend.agenerate(
+                    model_name, contents, tools=tools, cached_content=cached_content, timeout=attempt_timeout
+                ), attempt_timeout)
+            except asyncio.TimeoutError as e:
+                raise LLMTimeoutError(f"LLM call to {model_name} exceeded {attempt_timeout:.1f}s") from e
+
+        for attempt, attempt_timeout, policy in self._attempts(model_name, timeout):
+            started = time.monotonic()
+            try:
+                result = await self._ahedged(call, model_name, attempt_timeout, policy)
+            except LLMError as e:
+                delay = self._should_retry(model_name, e, attempt, policy)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(model_name, started)
+            return result
+
+    def stream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        self._count('calls')
+        for attempt, attempt_timeout, policy in self._attempts(model_name, timeout):
+            started = time.monotonic()
+            emitted = False
+            try:
+                with closing(self.backend.stream(
+                    model_name, contents, tools=tools, cached_content=cached_content, timeout=attempt_timeout
+                )) as chunks:
+                    for chunk in chunks:
+                        emitted = True
+                        yield chunk
+            except LLMError as e:
+                delay = None if emitted else self._should_retry(model_name, e, attempt, policy)
+                if delay is None:
+                    if emitted and e.retryable:
+                        self.breaker(model_name).record_failure()
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(model_name, started)
+            return
+
+    async def astream(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        self._count('calls')
+        for attempt, attempt_timeout, policy in self._attempts(model_name, timeout):
+            started = time.monotonic()
+            emitted = False
+            try:
+                async with aclosing(self.backend.astream(
+                    model_name, contents, tools=tools, cached_content=cached_content, timeout=attempt_timeout
+                )) as chunks:
+                    async for chunk in chunks:
+                        emitted = True
+                        yield chunk
+            except LLMError as e:
+                delay = None if emitted else self._should_retry(model_name, e, attempt, policy)
+                if delay is None:
+                    if emitted and e.retryable:
+                        self.breaker(model_name).record_failure()
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(model_name, started)
+            return
+
+    def count_tokens(self, model_name, contents):
+        return self.backend.count_tokens(model_name, contents)
+
+    def upload_file(self, path, display_name):
+        return self.backend.upload_file(path, display_name)
+
+    def resilience_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            breakers = list(self._breakers.values())
+        stats['circuits'] = {breaker.name: breaker.get_stats() for breaker in breakers}
+        return stats
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from chat.llm import get_backend
+from chat.models import Character, ChatSession, Message
+
+BENCH_USERNAME = 'bench_concurrency_user'
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many chat generations one process keeps in flight on the sync "
+        "(send_message) and async (chat/async/send_message) paths, using the fake LLM backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per path')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads available to the sync path')
+        parser.add_argument('--latency', type=float, default=1.0, help='Fake LLM latency in seconds')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        token, _ = Token.objects.get_or_create(user=user)
+        character = Character.objects.create(
+            created_by=user,
+            name="Benchmark Character",
+            description="Used by bench_chat_concurrency."
+        )
+        sessions = []
+        for i in range(options['requests']):
+            session = ChatSession.objects.create(user=user, character=character, title=f"Bench {i}")
+            Message.objects.create(chat_session=session, role='user', content="You are a test character.")
+            sessions.append(session.id)
+
+        bench_settings = override_settings(
+            # The test clients send requests as 'testserver'
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            LLM_BACKEND='fake',
+            LLM_FAKE_LATENCY=options['latency'],
+            LLM_FAKE_TOKENS_PER_SECOND=0,
+            LLM_FAKE_FAILURE_RATE=0.0,
+            # Every request comes from one user, and the point is to see how many run at once
+            CHAT_RATE_LIMITS={},
+            CHAT_MAX_IN_FLIGHT_GENERATIONS=0,
+        )
+        try:
+            with bench_settings:
+                sync_result = self._run_sync(character, sessions, token.key, options)
+                async_result = self._run_async(character, sessions, token.key, options)
+        finally:
+            user.delete()
+
+        self.stdout.write(f"Fake LLM latency: {options['latency']}s, {options['requests']} requests per path")
+        for label, result in (('sync ', sync_result), ('async', async_result)):
+            self.stdout.write(
+                f"{label}: peak in-flight={result['peak']:>5}  "
+                f"wall={result['elapsed']:.2f}s  "
+                f"throughput={result['requests'] / result['elapsed']:.1f} req/s  "
+                f"errors={result['errors']}"
+            )
+
+    def _payload(self, character, session_id):
+        return {'message': "Hello!", 'character_id': character.id, 'chat_session_id': session_id}
+
+    def _run_sync(self, character, sessions, token, options):
+        backend = get_backend()
+        backend.reset_stats()
+        errors = []
+
+        def one_request(session_id):
+            try:
+                response = Client().post(
+                    '/api/chat/send_message/',
+                    self._payload(character, session_id),
+                    content_type='application/json',
+                    HTTP_AUTHORIZATION=f'Token {token}'
+                )
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(one_request, sessions))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'peak': backend.get_stats()['peak_in_flight'],
+            'elapsed': elapsed,
+            'requests': len(sessions),
+            'errors': len(errors),
+        }
+
+    def _run_async(self, character, sessions, token, options):
+        backend = get_backend()
+        backend.reset_stats()
+        errors = []
+
+        async def one_request(client, session_id):
+            response = await client.post(
+                '/api/chat/async/send_message/',
+                self._payload(character, session_id),
+                content_type='application/json',
+                headers={'Authorization': f'Token {token}'}
+            )
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        async def run_all():
+            client = AsyncClient()
+            await asyncio.gather(*(one_request(client, session_id) for session_id in sessions))
+
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+
+        return {
+            'peak': backend.get_stats()['peak_in_flight'],
+            'elapsed': elapsed,
+            'requests': len(sessions),
+            'errors': len(errors),
+        }
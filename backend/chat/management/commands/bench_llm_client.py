@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from chat.llm.registry import ModelRegistry
+from chat.models import ChatSession
+from chat.tasks import get_chat_tools
+
+# The tools of a chat turn with web search enabled
+WEB_SEARCH_TOOLS = get_chat_tools(ChatSession(enable_web_search=True))
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-call LLM client setup overhead: genai.configure + GenerativeModel on every "
+        "call (old behaviour) versus the shared model registry. No requests are sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--api-key', default='', help='Defaults to GEMINI_API_KEY (a placeholder is fine)')
+
+    def handle(self, *args, **options):
+        api_key = options['api_key'] or getattr(settings, 'GEMINI_API_KEY', '') or 'benchmark-placeholder-key'
+        model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-2.5-pro')
+        iterations = options['iterations']
+
+        def per_call_setup(tools):
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(model_name, tools=tools)
+            # What the first generate_content call does: build the API client (gRPC channel)
+            genai_client.get_default_generative_client()
+            return model
+
+        registry = ModelRegistry()
+
+        def registry_setup(tools):
+            model = registry.get_model(model_name, tools=tools)
+            genai_client.get_default_generative_client()
+            return model
+
+        with override_settings(GEMINI_API_KEY=api_key):
+            results = [
+                ('per-call configure', self._time(per_call_setup, iterations)),
+                ('model registry', self._time(registry_setup, iterations)),
+            ]
+
+        self.stdout.write(f"{iterations} calls each, alternating plain and web-search tool configs")
+        for label, elapsed in results:
+            self.stdout.write(f"{label:>20}: {elapsed / iterations * 1e6:9.1f} us/call  ({elapsed:.3f}s total)")
+        self.stdout.write(f"Speed-up: {results[0][1] / results[1][1]:.1f}x")
+        self.stdout.write(f"Registry stats: {registry.get_stats()}")
+
+    def _time(self, setup, iterations):
+        started = time.perf_counter()
+        for i in range(iterations):
+            setup(WEB_SEARCH_TOOLS if i % 2 else None)
+        return time.perf_counter() - started
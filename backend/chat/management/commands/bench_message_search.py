@@ -0,0 +1,164 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat import search
+from chat.models import Character, ChatSession, Message
+from chat.pagination import SearchPagination
+
+BENCH_USERNAME_PREFIX = 'bench_search_user_'
+SEED = 20240601
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+def plan_indexes(queryset):
+    """
+    (index names used, node types) of the EXPLAIN ANALYZE plan of `queryset`.
+    """
+    plan = json.loads(queryset.explain(format='json', analyze=True))[0]['Plan']
+    indexes, nodes = set(), set()
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        nodes.add(node['Node Type'])
+        if 'Index Name' in node:
+            indexes.add(node['Index Name'])
+        pending.extend(node.get('Plans', []))
+    return indexes, nodes
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic multi-million message dataset and time full-text message search "
+        "(first result page) against a content__icontains scan, showing the indexes each plan uses. "
+        "PostgreSQL only; the seeded users are deleted afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2_000_000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--sessions-per-user', type=int, default=20)
+        parser.add_argument('--vocabulary', type=int, default=20_000, help='Distinct words (Zipf-distributed)')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--runs', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--reuse', action='store_true', help='Search data seeded by an earlier --keep run')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+        parser.add_argument('--no-baseline', action='store_true', help='Skip the icontains comparison')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Message search needs PostgreSQL")
+        rng = random.Random(SEED)
+        vocabulary = make_vocabulary(options['vocabulary'], rng)
+
+        users = list(User.objects.filter(username__startswith=BENCH_USERNAME_PREFIX).order_by('id'))
+        if options['reuse']:
+            if not users:
+                raise CommandError("No seeded data to reuse")
+        else:
+            if users:
+                raise CommandError("Seeded data exists; pass --reuse, or delete the bench_search_user_* users")
+            users = self._seed(rng, vocabulary, options)
+        try:
+            self._benchmark(users[0], vocabulary, options)
+        finally:
+            if not options['keep']:
+                self._cleanup(users)
+
+    def _seed(self, rng, vocabulary, options):
+        users = [User.objects.create(username=f'{BENCH_USERNAME_PREFIX}{i}') for i in range(options['users'])]
+        characters = Character.objects.bulk_create([
+            Character(created_by=user, name="Search Benchmark", description="Used by bench_message_search.")
+            for user in users
+        ])
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(user=character.created_by, character=character, title=f"Bench {i}")
+            for character in characters for i in range(options['sessions_per_user'])
+        ])
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+        started = time.monotonic()
+        total = options['messages']
+        batch_size = max(1, options['batch_size'])
+        for start in range(0, total, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, total)):
+                chat_session = sessions[rng.randrange(len(sessions))]
+                batch.append(Message(
+                    chat_session=chat_session,
+                    character_id=chat_session.character_id,
+                    role=('user', 'assistant')[i % 2],
+                    content=' '.join(rng.choices(vocabulary, weights, k=rng.randint(8, 40)))
+                ))
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+            done = start + len(batch)
+            self.stdout.write(f"  seeded {done}/{total} messages ({done / (time.monotonic() - started):.0f} rows/s)")
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(Message._meta.db_table)}')
+        return users
+
+    def _time(self, queryset_factory, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            list(queryset_factory())
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+    def _benchmark(self, user, vocabulary, options):
+        pagination = SearchPagination()
+        size = pagination.page_size
+        queries = {
+            'rare word': vocabulary[-1],
+            'mid word': vocabulary[len(vocabulary) // 100],
+            'common word': vocabulary[0],
+            'two words': f"{vocabulary[5]} {vocabulary[50]}",
+            'phrase': f'"{vocabulary[0]} {vocabulary[1]}"',
+        }
+        runs = max(1, options['runs'])
+        total = Message.objects.count()
+        self.stdout.write(f"{total} messages in the table; searching as {user.username}, {runs} runs per query")
+
+        for label, text in queries.items():
+            results = search.search_messages(user, text)
+
+            def page(results=results):
+                return pagination.keyset_queryset(results, None)[:size]
+            median, p95 = self._time(page, runs)
+            indexes, nodes = plan_indexes(page())
+            hits = results.count()
+            self.stdout.write(
+                f"{label:<12} {text!r:<24} hits={hits:<7} median={median:8.2f}ms p95={p95:8.2f}ms "
+                f"search index used={'yes' if 'message_search_idx' in indexes else 'NO'} "
+                f"indexes={sorted(indexes)}"
+            )
+            if not options['no_baseline'] and not text.startswith('"'):
+                word = text.split()[0]
+
+                def scan(word=word):
+                    return Message.objects.filter(
+                        chat_session__user=user, content__icontains=word
+                    ).order_by('-timestamp', '-id')[:size]
+                median, p95 = self._time(scan, max(1, runs // 4))
+                _, nodes = plan_indexes(scan())
+                self.stdout.write(
+                    f"{'':<12} icontains {word!r:<14} median={median:8.2f}ms p95={p95:8.2f}ms plan={sorted(nodes)}"
+                )
+
+    def _cleanup(self, users):
+        sessions = ChatSession.objects.filter(user__in=users)
+        # One DELETE instead of Django collecting millions of messages in memory
+        messages = Message.objects.filter(chat_session__in=sessions)
+        messages._raw_delete(messages.db)
+        User.objects.filter(id__in=[user.id for user in users]).delete()
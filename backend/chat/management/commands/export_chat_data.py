@@ -0,0 +1,40 @@
+import sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import export
+
+class Command(BaseCommand):
+    help = (
+        "Export a user's characters, sessions and messages as NDJSON, streamed through "
+        "server-side cursors so memory stays flat however long the history is."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE, help='Rows per cursor fetch')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        chunks = export.iter_ndjson(export.iter_records(user, chunk_size=max(1, options['chunk_size'])))
+        if options['gzip']:
+            chunks = export.gzip_chunks(chunks)
+
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
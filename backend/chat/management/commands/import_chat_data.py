@@ -0,0 +1,47 @@
+import os
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.importer import BulkImporter, open_upload
+
+class Command(BaseCommand):
+    help = (
+        "Import character cards (.json) and NDJSON/JSONL chat exports or transcripts (optionally "
+        "gzipped) into a user's account with batched bulk inserts, reporting throughput as it goes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('paths', nargs='+', metavar='path')
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages per INSERT transaction')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+        for path in options['paths']:
+            if not os.path.isfile(path):
+                raise CommandError(f"{path} is not a file")
+
+        importer = BulkImporter(user, batch_size=options['batch_size'], progress=self.report_progress)
+        # Cards first, so transcripts can find their character by name
+        paths = sorted(options['paths'], key=lambda path: not path.lower().endswith('.json'))
+        for path in paths:
+            with open(path, 'rb') as source:
+                if path.lower().endswith('.json'):
+                    importer.import_card(source.read(), source=path)
+                else:
+                    importer.import_lines(open_upload(source), source=path)
+        report = importer.finish()
+
+        for error in report['errors']:
+            self.stderr.write(f"{error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['characters']} characters, {report['sessions']} sessions and "
+            f"{report['messages']} messages ({report['skipped']} skipped) in {report['elapsed_seconds']:.1f}s, "
+            f"{report['rows_per_second'] or 0:.0f} rows/s"
+        ))
+
+    def report_progress(self, report):
+        self.stdout.write(f"  {report['messages']} messages, {report['rows_per_second'] or 0:.0f} rows/s")
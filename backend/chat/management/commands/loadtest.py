@@ -0,0 +1,245 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+SCENARIOS = (
+    'send_message',
+    'send_message_async',
+    'sessions',
+    'messages',
+    'graphql_characters',
+    'graphql_chat_sessions',
+)
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class LoadTestClient:
+    """
+    One HTTP session per worker thread, authenticated with the load-test user's token.
+    """
+    def __init__(self, base_url, token, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        if not hasattr(self._local, 'http'):
+            self._local.http = requests.Session()
+            self._local.http.headers['Authorization'] = f'Token {self.token}'
+        return self._local.http
+
+    def request(self, method, path, **kwargs):
+        started = time.perf_counter()
+        response = self.http.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        elapsed = time.perf_counter() - started
+        queries = response.headers.get('X-DB-Query-Count')
+        return response, elapsed, int(queries) if queries is not None else None
+
+class Command(BaseCommand):
+    help = (
+        "Drive the chat REST and GraphQL endpoints of a running server at a fixed concurrency "
+        "and report latency percentiles, throughput and DB queries per request. "
+        "Start the server with LLM_BACKEND=fake (and QUERY_COUNT_HEADER=True for query counts) "
+        "so upstream LLM latency is not measured, and with the CHAT_RATE_LIMIT_* settings empty "
+        "since every request comes from one user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000/api')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+        parser.add_argument('--seed-messages', type=int, default=20,
+                            help='Messages in the session read by the messages scenario')
+        parser.add_argument('--timeout', type=float, default=120.0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+        parser.add_argument('--baseline', help='Earlier results file to compare against')
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help='Fail if any scenario p95 is this many percent slower than the baseline')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        client = self._setup(options)
+        results = {}
+        for name in scenarios:
+            self.stdout.write(
+                f"Running {name} ({options['requests']} requests, concurrency {options['concurrency']})..."
+            )
+            results[name] = self._run_scenario(client, name, options)
+            self._print_result(name, results[name])
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'base_url': options['base_url'],
+                'concurrency': options['concurrency'],
+                'requests_per_scenario': options['requests'],
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['max_regression'])
+
+    def _setup(self, options):
+        """
+        Register a throwaway user, a character and a seeded session through the public API.
+        """
+        base_url = options['base_url'].rstrip('/')
+        username = f"loadtest_{uuid.uuid4().hex[:8]}"
+        response = requests.post(
+            f"{base_url}/auth/register/",
+            json={'username': username, 'password': uuid.uuid4().hex},
+            timeout=options['timeout']
+        )
+        if response.status_code != 201:
+            raise CommandError(f"Could not register load-test user: {response.status_code} {response.text[:200]}")
+
+        client = LoadTestClient(base_url, response.json()['token'], options['timeout'])
+        response, _, _ = client.request('POST', '/characters/', data={
+            'name': 'Load Test Character',
+            'description': 'Created by manage.py loadtest.',
+        })
+        if response.status_code != 201:
+            raise CommandError(f"Could not create character: {response.status_code} {response.text[:200]}")
+        self.character_id = response.json()['id']
+
+        self.seed_session_id = None
+        for i in range(max(1, options['seed_messages'] // 2)):
+            response, _, _ = client.request('POST', '/chat/send_message/', json=self._send_payload(
+                "You are a load-test character." if i == 0 else f"Seed message {i}", self.seed_session_id
+            ))
+            if response.status_code != 200:
+                raise CommandError(f"Could not seed session: {response.status_code} {response.text[:200]}")
+            self.seed_session_id = response.json()['chat_session_id']
+
+        self._worker_sessions = threading.local()
+        return client
+
+    def _send_payload(self, message, chat_session_id=None):
+        payload = {'message': message, 'character_id': self.character_id}
+        if chat_session_id:
+            payload['chat_session_id'] = chat_session_id
+        return payload
+
+    def _send(self, client, path):
+        # Each worker thread chats in its own session so generations never contend for one session
+        session_id = getattr(self._worker_sessions, path, None)
+        result = client.request('POST', path, json=self._send_payload("Hello there!", session_id))
+        if result[0].status_code == 200 and session_id is None:
+            setattr(self._worker_sessions, path, result[0].json()['chat_session_id'])
+        return result
+
+    def _call(self, client, name):
+        if name == 'send_message':
+            return self._send(client, '/chat/send_message/')
+        if name == 'send_message_async':
+            return self._send(client, '/chat/async/send_message/')
+        if name == 'sessions':
+            return client.request('GET', '/sessions/')
+        if name == 'messages':
+            return client.request('GET', f'/messages/?chat_session_id={self.seed_session_id}')
+        if name == 'graphql_characters':
+            return client.request('POST', '/graphql/', json={'query': '{ characters { id name } }'})
+        return client.request('POST', '/graphql/', json={'query': '{ chatSessions { id title } }'})
+
+    def _run_scenario(self, client, name, options):
+        latencies = []
+        queries = []
+        errors = []
+        lock = threading.Lock()
+
+        def one(_):
+            try:
+                response, elapsed, query_count = self._call(client, name)
+                ok = response.status_code < 400 and 'errors' not in (
+                    response.json() if name.startswith('graphql') else {}
+                )
+            except requests.RequestException as e:
+                with lock:
+                    errors.append(type(e).__name__)
+                return
+            with lock:
+                latencies.append(elapsed)
+                if query_count is not None:
+                    queries.append(query_count)
+                if not ok:
+                    errors.append(response.status_code)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(one, range(options['requests'])))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': options['requests'],
+            'errors': len(errors),
+            'wall_seconds': round(wall, 3),
+            'throughput_rps': round(options['requests'] / wall, 2) if wall else 0.0,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'p99': round(percentile(latencies, 99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'db_queries_per_request': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'max': max(queries) if queries else None,
+            },
+        }
+
+    def _print_result(self, name, result):
+        latency = result['latency_ms']
+        queries = result['db_queries_per_request']
+        self.stdout.write(
+            f"  {name}: p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+            f"throughput={result['throughput_rps']} req/s errors={result['errors']} "
+            f"queries/req={queries['mean'] if queries['mean'] is not None else 'n/a'}"
+        )
+
+    def _compare(self, results, baseline_path, max_regression):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)['scenarios']
+
+        regressions = []
+        self.stdout.write(f"Compared with {baseline_path}:")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            old_p95 = baseline[name]['latency_ms']['p95']
+            new_p95 = result['latency_ms']['p95']
+            change = (new_p95 - old_p95) / old_p95 * 100 if old_p95 else 0.0
+            old_queries = baseline[name]['db_queries_per_request']['mean']
+            new_queries = result['db_queries_per_request']['mean']
+            self.stdout.write(
+                f"  {name}: p95 {old_p95}ms -> {new_p95}ms ({change:+.1f}%), "
+                f"queries/req {old_queries} -> {new_queries}"
+            )
+            if max_regression is not None and change > max_regression:
+                regressions.append(name)
+
+        if regressions:
+            raise CommandError(f"p95 regressed by more than {max_regression}% in: {', '.join(regressions)}")
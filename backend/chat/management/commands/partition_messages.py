@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat import partitioning
+
+class Command(BaseCommand):
+    help = (
+        "Range-partition the message table by timestamp, one partition per month (PostgreSQL only). "
+        "Without --convert, creates the upcoming monthly partitions of an already partitioned table. "
+        "--convert takes an exclusive lock on the table and scans it once; run it in a maintenance window. "
+        "Migrations that alter the message table afterwards must keep the (id, timestamp) primary key."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert the plain message table')
+        parser.add_argument(
+            '--months-ahead', type=int,
+            default=getattr(settings, 'CHAT_MESSAGE_PARTITIONS_AHEAD', 3),
+            help='Monthly partitions to create ahead of time'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Print the SQL instead of running it')
+
+    def handle(self, *args, **options):
+        if not partitioning.is_supported():
+            raise CommandError("Message partitioning requires PostgreSQL")
+        months_ahead = max(1, options['months_ahead'])
+
+        if partitioning.is_partitioned():
+            if options['convert']:
+                self.stdout.write("The message table is already partitioned")
+            statements = partitioning.ensure_plan(months_ahead, existing=partitioning.existing_partitions())
+        elif options['convert']:
+            statements = partitioning.convert_plan(months_ahead)
+        else:
+            raise CommandError("The message table is not partitioned; run with --convert first")
+
+        if options['dry_run']:
+            for statement in statements:
+                self.stdout.write(f"{statement};")
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(f"Ran {len(statements)} partitioning statements"))
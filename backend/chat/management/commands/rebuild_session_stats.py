@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from chat import session_stats
+from chat.models import ChatSession
+
+class Command(BaseCommand):
+    help = (
+        "Recompute each chat session's denormalized message_count, last_message_at and "
+        "last_message_preview from its messages, in batches of sessions. "
+        "Token counters are only collected going forward and are left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--session', type=int, action='append', dest='sessions', help='Only these session ids')
+
+    def handle(self, *args, **options):
+        sessions = ChatSession.objects.all()
+        if options['sessions']:
+            sessions = sessions.filter(id__in=options['sessions'])
+
+        bounds = sessions.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write("No sessions to rebuild")
+            return
+
+        batch_size = max(1, options['batch_size'])
+        updated = 0
+        for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+            # One UPDATE per id range keeps each transaction short on large tables
+            updated += session_stats.rebuild(sessions.filter(id__gte=start, id__lt=start + batch_size))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics for {updated} sessions"))
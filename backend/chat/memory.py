@@ -0,0 +1,230 @@
+"""
+Long-term memory: past messages most similar to the current one, recalled into the prompt
+when they no longer fit in the context window (see context_window.apply_context_window).
+
+Each scope (a session, or a user's sessions with one character; CHAT_MEMORY_SCOPE) has an
+append-only VectorStore on disk under CHAT_MEMORY_DIR. Messages are embedded and appended as
+the prompt builder reads them, so the index grows incrementally and costs no extra queries.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .models import Message
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: appends are then only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# CJK, kana and hangul characters are tokens on their own; other scripts split on non-word characters
+_TOKEN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]|[^\W_]+')
+BIGRAM_WEIGHT = 0.5
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+_append_lock = threading.Lock()
+
+def is_enabled():
+    return getattr(settings, 'CHAT_MEMORY_ENABLED', True)
+
+class HashingEmbedder:
+    """
+    Offline default embedder: signed feature hashing of words and adjacent word pairs into
+    `dimensions` buckets, sublinear term weights, L2-normalised. Deterministic across
+    processes and needs no model or network; it matches shared wording, not synonyms.
+    Any class with `name`, `dimensions` and embed(texts) -> float32 array of shape
+    (len(texts), dimensions) can replace it (CHAT_MEMORY_EMBEDDER).
+    """
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or getattr(settings, 'CHAT_MEMORY_DIMENSIONS', 512)
+        self.name = f"hash{self.dimensions}"
+
+    def features(self, text):
+        tokens = _TOKEN.findall(text.lower())
+        counts = Counter(tokens)
+        weights = {token: 1 + math.log(count) for token, count in counts.items()}
+        for pair, count in Counter(zip(tokens, tokens[1:])).items():
+            weights[' '.join(pair)] = BIGRAM_WEIGHT * (1 + math.log(count))
+        return weights
+
+    def _bucket(self, feature):
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value % self.dimensions, (1.0 if value >> 63 else -1.0)
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self.features(text or '')
+            if not features:
+                continue
+            buckets, signs = zip(*(self._bucket(feature) for feature in features))
+            np.add.at(vectors[row], list(buckets), np.array(signs, dtype=np.float32) * list(features.values()))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+def get_embedder():
+    """
+    The embedder selected by CHAT_MEMORY_EMBEDDER (a dotted path), one instance per process.
+    """
+    path = getattr(settings, 'CHAT_MEMORY_EMBEDDER', 'chat.memory.HashingEmbedder')
+    with _embedders_lock:
+        embedder = _embedders.get(path)
+        if embedder is None:
+            embedder = _embedders[path] = import_string(path)()
+        return embedder
+
+class VectorStore:
+    """
+    Append-only vectors of one scope: `<name>.vec` holds float32 rows of `dimensions` values and
+    `<name>.ids` the message id of each row. Reads memory-map both files, so a large store is
+    served from the page cache instead of process memory, and scoring is one matrix product.
+    """
+    def __init__(self, directory, name, dimensions):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.vectors_path = os.path.join(directory, f"{name}.vec")
+        self.ids_path = os.path.join(directory, f"{name}.ids")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+
+    @property
+    def _row_bytes(self):
+        return 4 * self.dimensions
+
+    def _rows(self):
+        try:
+            return min(os.path.getsize(self.ids_path) // 8, os.path.getsize(self.vectors_path) // self._row_bytes)
+        except FileNotFoundError:
+            return 0
+
+    def load(self):
+        """
+        (ids, vectors) memory-mapped read-only; empty arrays for an empty store.
+        """
+        rows = self._rows()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimensions), dtype=np.float32)
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(rows,))
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimensions))
+        return ids, vectors
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with _append_lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, ids, vectors):
+        """
+        Add the rows whose id is not stored yet. Returns the number of rows added.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._locked():
+            rows = self._rows()
+            # Drop the tail of an append interrupted between the two files
+            for path, size in ((self.ids_path, 8 * rows), (self.vectors_path, self._row_bytes * rows)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    os.truncate(path, size)
+            stored, _ = self.load()
+            new = ~np.isin(ids, stored)
+            if not new.any():
+                return 0
+            with open(self.vectors_path, 'ab') as vectors_file:
+                vectors_file.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+            with open(self.ids_path, 'ab') as ids_file:
+                ids_file.write(ids[new].tobytes())
+            return int(new.sum())
+
+    def search(self, query, k, exclude=()):
+        """
+        [(id, cosine similarity)] of the `k` rows closest to the normalised `query`, best first.
+        """
+        ids, vectors = self.load()
+        if not len(ids) or k <= 0:
+            return []
+        scores = vectors @ query
+        if len(exclude):
+            scores[np.isin(ids, np.asarray(list(exclude), dtype=np.int64))] = -np.inf
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def delete(self):
+        for path in (self.vectors_path, self.ids_path, self.lock_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def scope_name(chat_session):
+    if getattr(settings, 'CHAT_MEMORY_SCOPE', 'session') == 'character':
+        return f"user{chat_session.user_id}-character{chat_session.character_id}"
+    return f"session{chat_session.id}"
+
+def get_store(chat_session, embedder=None):
+    embedder = embedder or get_embedder()
+    directory = getattr(settings, 'CHAT_MEMORY_DIR', os.path.join(settings.BASE_DIR, 'memory_index'))
+    return VectorStore(directory, f"{scope_name(chat_session)}.{embedder.name}", embedder.dimensions)
+
+def index_messages(chat_session, messages):
+    """
+    Embed and store messages that are not in the session's memory yet. Never raises:
+    memory is best effort and must not fail a chat turn.
+    """
+    messages = [msg for msg in messages if msg.content]
+    if not messages or not is_enabled():
+        return 0
+    try:
+        embedder = get_embedder()
+        store = get_store(chat_session, embedder)
+        # A rebuilt history cache passes the whole session again; embed only what is new
+        stored, _ = store.load()
+        messages = [msg for msg, new in zip(messages, ~np.isin([msg.id for msg in messages], stored)) if new]
+        if not messages:
+            return 0
+        return store.append([msg.id for msg in messages], embedder.embed([msg.content for msg in messages]))
+    except Exception as e:
+        logger.warning(f"[WARNING] Could not index messages of session {chat_session.id}: {e}")
+        return 0
+
+def recall(chat_session, text, exclude_ids, k=None):
+    """
+    The stored messages most relevant to `text`, most relevant first, as dicts with
+    role/content/timestamp. Messages in `exclude_ids` (already in the prompt), below
+    CHAT_MEMORY_MIN_SCORE, or deleted since they were indexed are left out.
+    """
+    k = k or getattr(settings, 'CHAT_MEMORY_TOP_K', 5)
+    try:
+        embedder = get_embedder()
+        hits = get_store(chat_session, embedder).search(embedder.embed([text])[0], k, exclude=exclude_ids)
+    except Exception as e:
+        logger.warning(f"[WARNING] Memory recall failed for session {chat_session.id}: {e}")
+        return []
+    min_score = getattr(settings, 'CHAT_MEMORY_MIN_SCORE', 0.3)
+    scores = {pk: score for pk, score in hits if score >= min_score}
+    if not scores:
+        return []
+    rows = Message.objects.filter(id__in=scores, chat_session__user_id=chat_session.user_id).values(
+        'id', 'role', 'content', 'timestamp'
+    )
+    return sorted(rows, key=lambda row: -scores[row['id']])
+
+def delete_session_index(chat_session):
+    if getattr(settings, 'CHAT_MEMORY_SCOPE', 'session') == 'session':
+        get_store(chat_session).delete()
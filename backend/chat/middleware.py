@@ -1,5 +1,7 @@
 # backend/chat/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
 
 class DevAutoLoginMiddleware(MiddlewareMixin):
@@ -14,4 +16,43 @@ class DevAutoLoginMiddleware(MiddlewareMixin):
             defaults={'email': 'demo@example.com', 'is_staff': True, 'is_superuser': True}
         )
 
-        request.user = user
\ No newline at end of file
+        request.user = user
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+class QueryCountHeaderMiddleware:
+    """
+    Adds an `X-DB-Query-Count` header with the number of SQL queries the request ran.
+    Used by the `loadtest` command; enabled with QUERY_COUNT_HEADER=True.
+    For streaming responses only the queries run before the first byte are counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        response['X-DB-Query-Count'] = str(counter.count)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = await self.get_response(request)
+        response['X-DB-Query-Count'] = str(counter.count)
+        return response
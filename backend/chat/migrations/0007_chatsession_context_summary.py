@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_remove_character_gemini_file_uri_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='context_summary',
+            field=models.TextField(blank=True, default='', help_text='Rolling summary of turns that no longer fit in the context window'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summarized_turns',
+            field=models.PositiveIntegerField(default=0, help_text='Number of chat turns folded into context_summary'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_chatsession_context_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='gemini_cache_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='gemini_cache_key',
+            field=models.CharField(blank=True, default='', help_text='Hash of the prefix stored under gemini_chat_id', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='chatsession',
+            name='gemini_chat_id',
+            field=models.CharField(blank=True, help_text='Provider cached-content handle for the prompt prefix', max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+def mark_existing_titles(apps, schema_editor):
+    # Sessions that already moved past the default "Chat with ..." title keep it
+    ChatSession = apps.get_model('chat', 'ChatSession')
+    ChatSession.objects.exclude(title='').exclude(title__startswith='Chat with').update(title_generated=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chatsession_gemini_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='title_generated',
+            field=models.BooleanField(default=False, help_text='Title was generated or set by the user; skip auto-generation'),
+        ),
+        migrations.RunPython(mark_existing_titles, migrations.RunPython.noop),
+    ]
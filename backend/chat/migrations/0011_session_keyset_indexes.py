@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_chat_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chatsession',
+            name='session_user_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chatsession',
+            name='session_user_char_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='session_user_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'character', '-updated_at', '-id'], name='session_user_char_upd_id_idx'),
+        ),
+    ]
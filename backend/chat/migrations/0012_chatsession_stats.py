@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_session_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='prompt_tokens',
+            field=models.PositiveBigIntegerField(default=0, help_text='LLM prompt tokens used by this session'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='completion_tokens',
+            field=models.PositiveBigIntegerField(default=0, help_text='LLM completion tokens used by this session'),
+        ),
+    ]
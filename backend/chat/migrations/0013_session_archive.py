@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_chatsession_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='is_archived',
+            field=models.BooleanField(default=False, help_text='Messages moved to ArchivedSession; restored when the session is reopened'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['updated_at'], name='session_hot_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('chat_session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='chat.chatsession')),
+                ('codec', models.CharField(choices=[('zstd', 'zstd'), ('zlib', 'zlib')], max_length=10)),
+                ('transcript', models.BinaryField(help_text='Compressed JSON array of [id, role, content, timestamp, character_id]')),
+                ('message_count', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
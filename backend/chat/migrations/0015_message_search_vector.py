@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_message_timestamp_default'),
+    ]
+
+    # Adding a STORED generated column rewrites chat_message under an ACCESS EXCLUSIVE lock:
+    # reads and writes of messages wait for the whole table rewrite, and building the GIN index
+    # afterwards blocks writes (SHARE lock). On a large table, run this migration in a
+    # maintenance window.
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('content', config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='message_search_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -41,20 +43,66 @@ class ChatSession(models.Model):
     character = models.ForeignKey(Character, on_delete=models.CASCADE, related_name='chat_sessions')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions')
     title = models.CharField(max_length=200, blank=True)
+    title_generated = models.BooleanField(
+        default=False, help_text="Title was generated or set by the user; skip auto-generation"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_generating_response = models.BooleanField(default=False)
-    gemini_chat_id = models.CharField(max_length=255, blank=True, null=True)
+    gemini_chat_id = models.CharField(
+        max_length=255, blank=True, null=True, help_text="Provider cached-content handle for the prompt prefix"
+    )
+    gemini_cache_key = models.CharField(
+        max_length=64, blank=True, default="", help_text="Hash of the prefix stored under gemini_chat_id"
+    )
+    gemini_cache_expires_at = models.DateTimeField(blank=True, null=True)
     
     world_time = models.CharField(max_length=100, blank=True, default=DEFAULT_CHAT_SESSION_SETTINGS["world_time"])
     user_persona = models.TextField(blank=True, default=DEFAULT_CHAT_SESSION_SETTINGS["user_persona"], help_text="User's role or identity in this chat")
     enable_web_search = models.BooleanField(default=DEFAULT_CHAT_SESSION_SETTINGS["enable_web_search"])
     output_language = models.CharField(max_length=50, blank=True, default=DEFAULT_CHAT_SESSION_SETTINGS["output_language"])
     additional_context = models.TextField(blank=True, default=DEFAULT_CHAT_SESSION_SETTINGS["additional_context"], help_text="Extra instructions for this session")
+    context_summary = models.TextField(
+        blank=True, default="", help_text="Rolling summary of turns that no longer fit in the context window"
+    )
+    summarized_turns = models.PositiveIntegerField(
+        default=0, help_text="Number of chat turns folded into context_summary"
+    )
+
+    # Denormalized statistics, maintained on write by chat.session_stats
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    last_message_preview = models.CharField(max_length=100, blank=True, default="")
+    prompt_tokens = models.PositiveBigIntegerField(default=0, help_text="LLM prompt tokens used by this session")
+    completion_tokens = models.PositiveBigIntegerField(
+        default=0, help_text="LLM completion tokens used by this session"
+    )
+    is_archived = models.BooleanField(
+        default=False, help_text="Messages moved to ArchivedSession; restored when the session is reopened"
+    )
     
+    class Meta:
+        indexes = [
+            # History sidebar: a user's sessions, optionally for one character, newest first
+            # (id breaks updated_at ties for keyset pagination)
+            models.Index(fields=['user', '-updated_at', '-id'], name='session_user_updated_id_idx'),
+            models.Index(fields=['user', 'character', '-updated_at', '-id'], name='session_user_char_upd_id_idx'),
+            # Archival job: the least recently updated sessions still in the message table
+            models.Index(fields=['updated_at'], name='session_hot_updated_idx', condition=models.Q(is_archived=False)),
+        ]
+
     def __str__(self):
         return f"{self.title or f'Chat with {self.character.name}'} - {self.user.username}"
 
+# Text search configuration of Message.search_vector: no stemming or stop words,
+# since chats are in any language
+SEARCH_CONFIG = 'simple'
+
+class MessageManager(models.Manager):
+    def get_queryset(self):
+        # The search vector is only read inside SQL (chat.search); don't ship it to Python
+        return super().get_queryset().defer('search_vector')
+
 class Message(models.Model):
     ROLE_CHOICES = [
         ('user', 'User'),
@@ -64,11 +112,44 @@ class Message(models.Model):
     chat_session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so bulk imports and archive restores keep their timestamps
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     character = models.ForeignKey(Character, on_delete=models.CASCADE, related_name='messages', null=True, blank=True)
+    # Kept up to date by PostgreSQL on every insert and update of content
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
+
+    objects = MessageManager()
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # A session's messages in order (prompt history, chat detail)
+            models.Index(fields=['chat_session', 'timestamp', 'id'], name='message_session_time_idx'),
+            # Full-text search (chat.search)
+            GinIndex(fields=['search_vector'], name='message_search_idx'),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
+
+class ArchivedSession(models.Model):
+    """
+    The messages of a cold session, as one compressed JSON transcript (see chat.archive).
+    """
+    CODEC_CHOICES = [
+        ('zstd', 'zstd'),
+        ('zlib', 'zlib'),
+    ]
+
+    chat_session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    transcript = models.BinaryField(help_text="Compressed JSON array of [id, role, content, timestamp, character_id]")
+    message_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of session {self.chat_session_id} ({self.message_count} messages)"
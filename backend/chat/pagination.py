@@ -0,0 +1,133 @@
+import base64
+import binascii
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (`position_field`, id).
+
+    The first page holds the newest rows; `next` links to the rows before the last one
+    shown (`?before=<cursor>`). Rows inserted meanwhile never shift later pages, and every
+    page is a bounded index range scan however long the list grows.
+    Response: {"next": <url or null>, "results": [...]}.
+    """
+    position_field = None
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'before'
+    # Return the rows of each page oldest-first
+    chronological_pages = False
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def format_position(self, value):
+        return value.isoformat()
+
+    def parse_position(self, raw):
+        """
+        The position encoded by format_position; None or ValueError if invalid.
+        """
+        return parse_datetime(raw)
+
+    def encode_cursor(self, instance):
+        raw = f"{self.format_position(getattr(instance, self.position_field))}|{instance.pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def parse_cursor(self, encoded):
+        """
+        (position, id) from an encoded cursor; raises NotFound if it is invalid.
+        """
+        try:
+            position, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').rsplit('|', 1)
+            position = self.parse_position(position)
+            pk = int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            position = None
+        if position is None:
+            raise NotFound('Invalid cursor')
+        return position, pk
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        return self.parse_cursor(encoded)
+
+    def keyset_queryset(self, queryset, cursor):
+        """
+        The rows before `cursor` ((position, id) or None for the first page), newest first.
+        """
+        field = self.position_field
+        queryset = queryset.order_by(f'-{field}', '-id')
+        if cursor is not None:
+            position, pk = cursor
+            queryset = queryset.filter(Q(**{f'{field}__lt': position}) | Q(**{field: position, 'id__lt': pk}))
+        return queryset
+
+    def page(self, queryset, cursor, page_size):
+        """
+        (rows, next cursor or None) of the page after `cursor`.
+        """
+        rows = list(self.keyset_queryset(queryset, cursor)[:page_size + 1])
+        next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        rows = rows[:page_size]
+        if self.chronological_pages:
+            rows.reverse()
+        return rows, next_cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        rows, self.next_cursor = self.page(queryset, self.decode_cursor(request), self.get_page_size(request))
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+class MessagePagination(KeysetPagination):
+    """
+    A session's messages: the newest page first, each page in chat order.
+    """
+    position_field = 'timestamp'
+    page_size = 50
+    chronological_pages = True
+
+class SessionPagination(KeysetPagination):
+    """
+    History sidebar sessions, most recently updated first.
+    """
+    position_field = 'updated_at'
+    page_size = 30
+
+class SearchPagination(KeysetPagination):
+    """
+    Search hits, best match first: keyset on the annotated `rank`.
+    """
+    position_field = 'rank'
+    page_size = 20
+    max_page_size = 100
+
+    def format_position(self, value):
+        # repr() round-trips the float exactly
+        return repr(value)
+
+    def parse_position(self, raw):
+        return float(raw)
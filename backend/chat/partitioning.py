@@ -0,0 +1,180 @@
+"""
+Declarative time-range partitioning of the message table (PostgreSQL only, opt-in).
+
+convert_plan() returns the statements that turn the plain message table into a table
+PARTITION BY RANGE (timestamp): the existing table becomes the partition of everything
+before the next month, later rows go to monthly partitions and a DEFAULT partition catches
+anything outside them. ensure_plan() creates the upcoming monthly partitions, moving in any
+rows the DEFAULT partition holds for them; the ensure_message_partitions task runs it
+periodically once the table is partitioned.
+
+PostgreSQL requires the partition key in every unique constraint, so the converted table's
+primary key is (id, timestamp). ids still come from a single sequence and stay unique;
+Django keeps treating `id` as the primary key.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection
+from .models import Message
+
+LEGACY_SUFFIX = '_unpartitioned'
+
+def _table():
+    return Message._meta.db_table
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+def _month_start(moment, offset=0):
+    month = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+def partition_name(month_start):
+    return f"{_table()}_y{month_start.year}m{month_start.month:02d}"
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+def is_partitioned():
+    if not is_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [_table()])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+def existing_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [_table()]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+def default_partition_name():
+    return f"{_table()}_default"
+
+def _create_partition(month_start):
+    """
+    Statements adding the partition of one month. PostgreSQL refuses a partition whose range
+    overlaps rows of the DEFAULT partition, so rows it already holds for that month (e.g.
+    imported with future timestamps) are moved into the new table before it is attached.
+    """
+    table, default, partition = _table(), default_partition_name(), partition_name(month_start)
+    start, end = month_start.isoformat(), _month_start(month_start, 1).isoformat()
+    # Generated columns (the search vector) are computed again on insert
+    columns = ', '.join(
+        _quote(field.column) for field in Message._meta.concrete_fields if not getattr(field, 'generated', False)
+    )
+    return [
+        # Held until commit: nothing is routed to the DEFAULT partition while rows move out of it
+        f"LOCK TABLE {_quote(default)} IN ACCESS EXCLUSIVE MODE",
+        f"CREATE TABLE {_quote(partition)} (LIKE {_quote(table)} INCLUDING DEFAULTS INCLUDING GENERATED)",
+        (
+            f"WITH moved AS (DELETE FROM {_quote(default)} "
+            f"WHERE \"timestamp\" >= '{start}' AND \"timestamp\" < '{end}' RETURNING {columns}) "
+            f"INSERT INTO {_quote(partition)} ({columns}) SELECT {columns} FROM moved"
+        ),
+        f"ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(partition)} FOR VALUES FROM ('{start}') TO ('{end}')",
+    ]
+
+def ensure_plan(months_ahead, now=None, existing=()):
+    """
+    Statements creating the partitions of the next `months_ahead` months that are not in
+    `existing` yet; run them in one transaction. Rows the DEFAULT partition took for those
+    months meanwhile are moved into the new partitions.
+    """
+    now = now or datetime.now(dt_timezone.utc)
+    statements = []
+    for offset in range(1, months_ahead + 1):
+        month_start = _month_start(now, offset)
+        if partition_name(month_start) not in existing:
+            statements += _create_partition(month_start)
+    return statements
+
+def _catalog():
+    """
+    The message table's foreign keys, secondary indexes, primary key name and id sequence.
+    """
+    table = _table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f' ORDER BY conname",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+            [table]
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s ORDER BY indexname",
+            [table, primary_key]
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'", [table]
+        )
+        identity = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+    return foreign_keys, indexes, primary_key, bool(identity), sequence
+
+def convert_plan(months_ahead, now=None):
+    """
+    Statements converting the plain message table into a partitioned one; run them in
+    one transaction. The existing table is kept as the first partition, so no row is
+    copied, but attaching it scans it once to validate the range.
+    """
+    table = _table()
+    legacy = f"{table}{LEGACY_SUFFIX}"
+    sequence = f"{table}_id_partitioned_seq"
+    now = now or datetime.now(dt_timezone.utc)
+    first_month = _month_start(now, 1)
+    foreign_keys, indexes, primary_key, identity, old_sequence = _catalog()
+
+    statements = [
+        f"LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE",
+        # A plain sequence: identity columns are not supported on partitioned tables before PostgreSQL 17
+        f"CREATE SEQUENCE {_quote(sequence)}",
+        f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {_quote(table)}), 0) + 1, false)",
+        f"ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}",
+        (
+            f"ALTER TABLE {_quote(legacy)} ALTER COLUMN id DROP IDENTITY" if identity
+            else f"ALTER TABLE {_quote(legacy)} ALTER COLUMN id DROP DEFAULT"
+        ),
+    ]
+    if old_sequence and not identity:
+        statements.append(f"DROP SEQUENCE IF EXISTS {old_sequence}")
+    # Foreign keys and index names move to the partitioned table
+    statements += [f"ALTER TABLE {_quote(legacy)} DROP CONSTRAINT {_quote(name)}" for name, _ in foreign_keys]
+    statements += [
+        f"ALTER INDEX {_quote(name)} RENAME TO {_quote((name + LEGACY_SUFFIX)[:63])}" for name, _ in indexes
+    ]
+    statements += [
+        f"ALTER TABLE {_quote(legacy)} DROP CONSTRAINT {_quote(primary_key)}",
+        f"ALTER TABLE {_quote(legacy)} ADD CONSTRAINT {_quote(legacy + '_pkey')} PRIMARY KEY (id, \"timestamp\")",
+        (
+            f"CREATE TABLE {_quote(table)} (LIKE {_quote(legacy)} INCLUDING DEFAULTS INCLUDING GENERATED) "
+            f"PARTITION BY RANGE (\"timestamp\")"
+        ),
+        f"ALTER TABLE {_quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')",
+        f"ALTER SEQUENCE {_quote(sequence)} OWNED BY {_quote(table)}.id",
+        f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(primary_key)} PRIMARY KEY (id, \"timestamp\")",
+        (
+            f"ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(legacy)} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()}')"
+        ),
+        f"CREATE TABLE {_quote(default_partition_name())} PARTITION OF {_quote(table)} DEFAULT",
+    ]
+    statements += ensure_plan(months_ahead, now=now)
+    # Indexes created on the parent cascade to every partition, reusing the renamed equivalent ones
+    statements += [definition for _, definition in indexes]
+    statements += [
+        f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}" for name, definition in foreign_keys
+    ]
+    return statements
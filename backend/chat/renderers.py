@@ -0,0 +1,23 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+def format_sse(event, data):
+    """
+    Encode a single Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients negotiate `text/event-stream` for streaming endpoints.
+    Successful streams bypass rendering (StreamingHttpResponse); plain Responses,
+    i.e. validation errors, are sent as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_sse('error', data).encode(self.charset)
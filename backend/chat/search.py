@@ -0,0 +1,46 @@
+import html
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from .models import SEARCH_CONFIG, Message
+
+# Control characters mark the highlighted words in the SQL headline, so the snippet can be
+# HTML-escaped before they become <mark> tags
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+SNIPPET_OPTIONS = {'max_words': 30, 'min_words': 10, 'max_fragments': 2, 'fragment_delimiter': ' … '}
+
+def search_query(text):
+    """
+    Web-search syntax: words are ANDed, "quoted phrases", `or`, and -excluded words.
+    """
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+def search_messages(user, text, chat_session_id=None, character_id=None):
+    """
+    The user's messages matching `text` (through the GIN index on search_vector), annotated
+    with `rank`, `snippet` and `chat_session_title`. Messages of archived sessions are not
+    searchable until the session is reopened.
+    """
+    query = search_query(text)
+    # No default (timestamp) ordering: callers order by rank
+    messages = Message.objects.filter(chat_session__user=user, search_vector=query).order_by()
+    if chat_session_id:
+        messages = messages.filter(chat_session_id=chat_session_id)
+    if character_id:
+        messages = messages.filter(chat_session__character_id=character_id)
+    return messages.annotate(
+        # ts_rank is a float4; as float8 the keyset cursor (a Python float) compares equal to it
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        snippet=SearchHeadline(
+            'content', query, config=SEARCH_CONFIG,
+            start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP, **SNIPPET_OPTIONS
+        ),
+        chat_session_title=F('chat_session__title'),
+    )
+
+def render_snippet(snippet):
+    """
+    HTML for a headline: the message text escaped, matches wrapped in <mark>.
+    """
+    return html.escape(snippet or '').replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
@@ -0,0 +1,32 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .pagination import SearchPagination
+from .search import search_messages
+from .serializers import MessageSearchResultSerializer
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """
+    Full-text search of the user's messages: ?q=<web-search syntax>, optionally narrowed
+    with chat_session_id / character_id; best matches first, paged with `before` cursors.
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = {
+            key: int(request.query_params[key])
+            for key in ('chat_session_id', 'character_id') if request.query_params.get(key)
+        }
+    except ValueError:
+        return Response(
+            {'error': 'chat_session_id and character_id must be integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    messages = search_messages(request.user, text, **filters)
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(messages, request)
+    return paginator.get_paginated_response(MessageSearchResultSerializer(page, many=True).data)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Character, ChatSession, Message
+from .search import render_snippet
 
 class CharacterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,6 +19,21 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'role', 'content', 'timestamp', 'character']
         read_only_fields = ['timestamp']
 
+class MessageSearchResultSerializer(serializers.ModelSerializer):
+    """
+    A search hit from chat.search.search_messages; `snippet` is HTML with <mark>ed matches.
+    """
+    chat_session_title = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'chat_session', 'chat_session_title', 'role', 'content', 'timestamp', 'rank', 'snippet']
+
+    def get_snippet(self, obj):
+        return render_snippet(obj.snippet)
+
 class ChatSessionSerializer(serializers.ModelSerializer):
     messages = MessageSerializer(many=True, read_only=True)
     character = CharacterSerializer(read_only=True)
@@ -30,6 +46,26 @@ class ChatSessionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+class CharacterSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Character
+        fields = ['id', 'name', 'avatar_url']
+
+class ChatSessionSummarySerializer(serializers.ModelSerializer):
+    """
+    Sidebar row for the session list, built from the session's denormalized statistics.
+    """
+    character = CharacterSummarySerializer(read_only=True)
+    last_message = serializers.CharField(source='last_message_preview', read_only=True)
+
+    class Meta:
+        model = ChatSession
+        fields = [
+            'id', 'title', 'character', 'message_count', 'last_message', 'last_message_at',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
 class ChatSessionCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatSession
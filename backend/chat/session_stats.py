@@ -0,0 +1,69 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Left
+from .models import ChatSession, Message
+
+PREVIEW_LENGTH = 100
+
+def added(messages, usage=None):
+    """
+    UPDATE kwargs that add newly saved messages (and the LLM usage of the turn) to the
+    session's denormalized statistics. Counters use F() so concurrent writers never lose updates.
+    """
+    messages = [message for message in messages if message is not None]
+    fields = {}
+    if messages:
+        last = max(messages, key=lambda message: (message.timestamp, message.id))
+        fields.update(
+            message_count=F('message_count') + len(messages),
+            last_message_at=last.timestamp,
+            last_message_preview=last.content[:PREVIEW_LENGTH],
+        )
+    if usage is not None:
+        fields.update(
+            prompt_tokens=F('prompt_tokens') + usage.prompt_tokens,
+            completion_tokens=F('completion_tokens') + usage.completion_tokens,
+        )
+    return fields
+
+def record_messages(chat_session_id, messages, usage=None):
+    """
+    Add messages saved outside a chat turn (which records them when it releases the session).
+    """
+    fields = added(messages, usage)
+    if fields:
+        ChatSession.objects.filter(pk=chat_session_id).update(**fields)
+
+def _latest_message(field):
+    messages = Message.objects.filter(chat_session=OuterRef('pk')).order_by('-timestamp', '-id')
+    if field == 'content':
+        return Subquery(messages.annotate(preview=Left('content', PREVIEW_LENGTH)).values('preview')[:1])
+    return Subquery(messages.values(field)[:1])
+
+def _last_message_fields():
+    return {
+        'last_message_at': _latest_message('timestamp'),
+        'last_message_preview': Coalesce(_latest_message('content'), Value('')),
+    }
+
+def record_deletion(chat_session_id):
+    """
+    A message of the session was deleted: decrement the count and re-read the last message.
+    """
+    ChatSession.objects.filter(pk=chat_session_id, message_count__gt=0).update(
+        message_count=F('message_count') - 1,
+        **_last_message_fields()
+    )
+
+def rebuild(queryset):
+    """
+    Recompute message_count and the last message of the sessions from their messages,
+    in one UPDATE. Token counters cannot be recovered from history and are left alone.
+    """
+    count = (
+        Message.objects.filter(chat_session=OuterRef('pk')).order_by()
+        .values('chat_session').annotate(count=Count('id')).values('count')
+    )
+    return queryset.update(
+        message_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+        **_last_message_fields()
+    )
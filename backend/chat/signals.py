@@ -0,0 +1,54 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import memory, session_stats
+from .history_cache import invalidate_history, invalidate_unless_appended
+from .models import ChatSession, Message
+
+_state = threading.local()
+
+@contextmanager
+def bulk_message_delete():
+    """
+    Skip the per-message delete handlers (history invalidation, statistics) in this thread
+    for the block; the caller does that bookkeeping once for the whole batch.
+    """
+    previous = getattr(_state, 'bulk_delete', False)
+    _state.bulk_delete = True
+    try:
+        yield
+    finally:
+        _state.bulk_delete = previous
+
+def _in_bulk_delete():
+    return getattr(_state, 'bulk_delete', False)
+
+@receiver(post_save, sender=Message)
+def invalidate_history_on_edit(sender, instance, created, **kwargs):
+    # New messages are picked up incrementally unless they sort before the cached ones;
+    # that is only known once the row is visible to other connections
+    if created:
+        transaction.on_commit(lambda: invalidate_unless_appended(instance))
+    else:
+        invalidate_history(instance.chat_session_id)
+
+@receiver(post_delete, sender=Message)
+def invalidate_history_on_delete(sender, instance, **kwargs):
+    if not _in_bulk_delete():
+        invalidate_history(instance.chat_session_id)
+
+@receiver(post_delete, sender=Message)
+def update_session_stats_on_delete(sender, instance, origin=None, **kwargs):
+    # Messages removed along with their session (or character/user) need no bookkeeping
+    if getattr(origin, 'model', type(origin)) is Message and not _in_bulk_delete():
+        session_stats.record_deletion(instance.chat_session_id)
+
+@receiver(post_delete, sender=ChatSession)
+def invalidate_history_on_session_delete(sender, instance, **kwargs):
+    invalidate_history(instance.id)
+
+@receiver(post_delete, sender=ChatSession)
+def delete_memory_on_session_delete(sender, instance, **kwargs):
+    memory.delete_session_index(instance)
@@ -0,0 +1,22 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import throttling
+from .llm import get_backend
+from .llm.cache import response_cache
+from .llm.resilience import ResilientBackend
+from .llm.registry import registry
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def llm_stats(request):
+    """
+    Per-process LLM client statistics (staff only).
+    """
+    backend = get_backend()
+    return Response({
+        'model_registry': registry.get_stats(),
+        'response_cache': response_cache.get_stats(),
+        'resilience': backend.resilience_stats() if isinstance(backend, ResilientBackend) else None,
+        'admission': throttling.get_stats(),
+    })
@@ -1,12 +1,32 @@
 from celery import shared_task
+from asgiref.sync import sync_to_async
 from django.conf import settings
-import google.generativeai as genai
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 from .models import Message, Character, ChatSession
+from . import archive, context_window, history_cache, memory, partitioning, session_stats
+from .context_cache import bind_cached_prefix
+from .llm import get_backend
+from .llm.base import LLMResult
+from .llm.cache import response_cache
+from datetime import timedelta
 import traceback
+import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_LOCK_TIMEOUT = 5 * 60
+TITLE_LOCK_TIMEOUT = 5 * 60
+TITLE_BATCH_LOCK_KEY = 'chat:title-batch-lock'
+ARCHIVE_LOCK_KEY = 'chat:archive-lock'
+ARCHIVE_LOCK_TIMEOUT = 60 * 60
+DEFAULT_TITLE_PREFIX = 'Chat with'
+
 @shared_task(retry_backoff=True)
 def build_gemini_parts(initial_prompt_text):
     """
@@ -15,17 +35,53 @@ def build_gemini_parts(initial_prompt_text):
     parts = [initial_prompt_text]
     return parts
     
-@shared_task(retry_backoff=True)
-def update_session_title(chat_session, history_text, api_key):
+def _title_lock_key(session_id):
+    return f"chat:title-lock:{session_id}"
+
+def schedule_title_generation(chat_session):
     """
-    Helper function to generate a creative title based on chat history.
+    Queue title generation for the session unless it already has a generated title
+    or a job for it is still pending. Never blocks the chat response.
+    With CHAT_TITLE_BATCH_ENABLED titles come from generate_session_titles instead.
     """
+    if chat_session.title_generated:
+        return
+    if getattr(settings, 'CHAT_TITLE_BATCH_ENABLED', True):
+        # Picked up by the periodic generate_session_titles job
+        return
+    if not cache.add(_title_lock_key(chat_session.id), True, TITLE_LOCK_TIMEOUT):
+        return
     try:
-        # Use the same model configuration as the main chat to ensure availability
-        model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-2.5-pro')
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
-        
+        update_session_title.delay(chat_session.id)
+        logger.info(f"Queued title generation for Session {chat_session.id}")
+    except Exception as e:
+        cache.delete(_title_lock_key(chat_session.id))
+        logger.warning(f"[WARNING] Could not queue title generation for session {chat_session.id}: {e}")
+
+@shared_task
+def update_session_title(session_id):
+    """
+    Generate a creative title for the session from its opening exchange.
+    """
+    try:
+        chat_session = ChatSession.objects.get(id=session_id)
+        if chat_session.title_generated:
+            return
+
+        # Skip the system prompt; title from the first user message and the reply to it
+        opening = list(
+            Message.objects.filter(chat_session_id=session_id).order_by('timestamp', 'id')[1:3]
+        )
+        if not any(msg.role == 'assistant' for msg in opening):
+            return
+
+        history_text = ""
+        for msg in opening:
+            if msg.role == 'assistant':
+                history_text += f"Character: {msg.content[:100]}..."
+            else:
+                history_text += f"User: {msg.content}\n"
+
         # Optimized prompt for title generation
         prompt = (
             f"Analyze the following short conversation start.\n"
@@ -38,112 +94,497 @@ def update_session_title(chat_session, history_text, api_key):
             f"Conversation:\n{history_text}"
         )
         
-        response = model.generate_content(prompt)
+        # Use the same model configuration as the main chat to ensure availability
+        model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-2.5-pro')
+        response = response_cache.generate(model_name, prompt)
         new_title = response.text.strip().replace('"', '').replace("'", "")
         
         if new_title:
-            chat_session.title = new_title
-            chat_session.save(update_fields=['title'])
-            logger.info(f"[SUCCESS] Successfully updated session {chat_session.id} title to: {new_title}")
+            ChatSession.objects.filter(id=session_id).update(title=new_title[:200], title_generated=True)
+            logger.info(f"[SUCCESS] Successfully updated session {session_id} title to: {new_title}")
         else:
-            logger.warning(f"[WARNING] AI returned empty title for session {chat_session.id}")
+            logger.warning(f"[WARNING] AI returned empty title for session {session_id}")
             
     except Exception as e:
         logger.error(f"[ERROR] Failed to auto-generate title: {e}")
+    finally:
+        cache.delete(_title_lock_key(session_id))
 
-@shared_task(retry_backoff=True)
-def generate_ai_response(message_id, character_id):
+def _parse_json_reply(raw_text):
+    raw_text = raw_text.strip()
+    json_match = re.search(r"```(?:json)?\s*(.*?)```", raw_text, re.DOTALL)
+    if json_match:
+        raw_text = json_match.group(1).strip()
+    return json.loads(raw_text)
+
+def _opening_exchanges(session_ids):
     """
-    Generate AI response using Gemini API, including the character file and all previous chat files.
+    {session_id: [first user message, reply]} for the sessions, in one query.
+    """
+    position = Window(
+        RowNumber(),
+        partition_by=F('chat_session_id'),
+        order_by=(F('timestamp').asc(), F('id').asc())
+    )
+    # Row 1 is the system prompt
+    messages = (
+        Message.objects.filter(chat_session_id__in=session_ids)
+        .annotate(position=position)
+        .filter(position__in=(2, 3))
+        .order_by('chat_session_id', 'position')
+    )
+    openings = {}
+    for msg in messages:
+        openings.setdefault(msg.chat_session_id, []).append(msg)
+    return openings
+
+@shared_task
+def generate_session_titles(batch_size=None):
     """
+    Periodic job (see CELERY_BEAT_SCHEDULE): title up to CHAT_TITLE_BATCH_SIZE sessions that
+    still have their default "Chat with ..." title and at least one exchange, with a single
+    LLM call returning a JSON array, and save them with one bulk_update.
+    Sessions the model leaves out are retried on the next run.
+    """
+    if not cache.add(TITLE_BATCH_LOCK_KEY, True, TITLE_LOCK_TIMEOUT):
+        return 0
     try:
-        user_message = Message.objects.get(id=message_id)
-        character = Character.objects.get(id=character_id)
-        chat_session = user_message.chat_session
-        
-        api_key = getattr(settings, 'GEMINI_API_KEY', '')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in settings")
-        
-        genai.configure(api_key=api_key)
-        
-        tools = []
-        if chat_session.enable_web_search:
-            tools.append({'google_search': {
-                'dynamic_retrieval_config': {
-                    'mode': 'dynamic',
-                    'dynamic_threshold': 0.6,
-                }
-            }})
-            
-        model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-2.5-pro')
-        model = genai.GenerativeModel(model_name, tools=tools if tools else None)
+        batch_size = batch_size or getattr(settings, 'CHAT_TITLE_BATCH_SIZE', 50)
+        answered = Message.objects.filter(chat_session_id=OuterRef('pk'), role='assistant')
+        sessions = list(
+            ChatSession.objects.filter(
+                title_generated=False,
+                title__startswith=DEFAULT_TITLE_PREFIX,
+                message_count__gte=2
+            )
+            .filter(Exists(answered))
+            .order_by('updated_at')
+            .only('id', 'title')[:batch_size]
+        )
+        if not sessions:
+            return 0
 
-        formatted_history = []
-        history_messages = Message.objects.filter(chat_session=chat_session).order_by('timestamp')
+        openings = _opening_exchanges([chat_session.id for chat_session in sessions])
+        conversations = []
+        for chat_session in sessions:
+            turns = [
+                {'role': 'character' if msg.role == 'assistant' else 'user', 'text': msg.content[:200]}
+                for msg in openings.get(chat_session.id, [])
+            ]
+            if turns:
+                conversations.append({'id': chat_session.id, 'conversation': turns})
+        if not conversations:
+            return 0
 
-        system_prompt_message = history_messages.first()
-        if not system_prompt_message:
-            raise ValueError("Cannot generate response for an empty chat session.")
+        prompt = (
+            f"Below is a JSON array of conversation starts, each with an id.\n"
+            f"For each one, generate a short, engaging title (2-6 words) that summarizes the topic.\n"
+            f"Rules:\n"
+            f"1. Use the same language as the conversation (e.g., if Chinese, use Chinese).\n"
+            f"2. Do NOT use quotation marks.\n"
+            f"3. Do NOT include words like 'Chat', 'Conversation', 'Title'.\n"
+            f"4. Just the topic.\n\n"
+            f"Return ONLY a raw JSON array of objects with the keys \"id\" and \"title\".\n\n"
+            f"Conversations:\n{json.dumps(conversations, ensure_ascii=False)}"
+        )
+        model_name = getattr(settings, 'GEMINI_TITLE_MODEL_NAME', 'gemini-2.5-flash')
+        reply = _parse_json_reply(get_backend().generate(model_name, prompt).text)
 
-        session_settings_text = ""
-        settings_parts = []
-        
-        if chat_session.world_time:
-            settings_parts.append(f"Current World Time: {chat_session.world_time}")
-        if chat_session.user_persona:
-            settings_parts.append(f"User Persona/Role: {chat_session.user_persona}")
-        if chat_session.output_language:
-            settings_parts.append(f"Must Respond in Language: {chat_session.output_language}")
-        if chat_session.additional_context:
-            settings_parts.append(f"Additional Context: {chat_session.additional_context}")
-            
-        if settings_parts:
-            session_settings_text = "\n\n[SESSION CONFIGURATION]\n" + "\n".join(settings_parts)
+        titles = {}
+        for item in reply if isinstance(reply, list) else []:
+            if not isinstance(item, dict):
+                continue
+            title = str(item.get('title') or '').strip().replace('"', '').replace("'", "")
+            if title:
+                titles[str(item.get('id'))] = title[:200]
 
-        system_prompt_text = system_prompt_message.content + session_settings_text
-        
-        system_parts = build_gemini_parts(system_prompt_text)
-        formatted_history.append({"role": "user", "parts": system_parts})
+        # Re-read so a title the user set meanwhile is not overwritten
+        titled = list(
+            ChatSession.objects.filter(id__in=[c['id'] for c in conversations], title_generated=False)
+            .only('id', 'title', 'title_generated')
+        )
+        titled = [chat_session for chat_session in titled if str(chat_session.id) in titles]
+        for chat_session in titled:
+            chat_session.title = titles[str(chat_session.id)]
+            chat_session.title_generated = True
+        ChatSession.objects.bulk_update(titled, ['title', 'title_generated'])
 
-        # Prepare text for title generation (User's first message)
-        conversation_text_for_title = f"User: {user_message.content}\n"
+        logger.info(f"[SUCCESS] Generated titles for {len(titled)} of {len(conversations)} sessions")
+        return len(titled)
 
-        actual_chat_messages = history_messages[1:]
-        for msg in actual_chat_messages:
-            role = 'model' if msg.role == 'assistant' else 'user'
-            
-            parts = [msg.content]
-            
-            formatted_history.append({"role": role, "parts": parts})
-        
-        response = model.generate_content(formatted_history)
+    except Exception as e:
+        logger.error(f"[ERROR] Failed to generate session titles: {e}")
+        return 0
+    finally:
+        cache.delete(TITLE_BATCH_LOCK_KEY)
+
+@shared_task
+def archive_cold_sessions(batch_size=None, days=None):
+    """
+    Periodic job (see CELERY_BEAT_SCHEDULE): move the messages of up to CHAT_ARCHIVE_BATCH_SIZE
+    sessions idle for CHAT_ARCHIVE_AFTER_DAYS into compressed ArchivedSession rows, keeping
+    the message table to recent sessions. Each session is archived in its own transaction.
+    """
+    days = getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 30) if days is None else days
+    if not days or not cache.add(ARCHIVE_LOCK_KEY, True, ARCHIVE_LOCK_TIMEOUT):
+        return 0
+    try:
+        batch_size = batch_size or getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 200)
+        session_ids = list(archive.cold_sessions(days).values_list('id', flat=True)[:batch_size])
+        archived = 0
+        for session_id in session_ids:
+            try:
+                archived += archive.archive_session(session_id, days)
+            except Exception as e:
+                logger.error(f"[ERROR] Failed to archive session {session_id}: {e}")
+        if archived:
+            logger.info(f"[SUCCESS] Archived {archived} of {len(session_ids)} cold sessions")
+        return archived
+    finally:
+        cache.delete(ARCHIVE_LOCK_KEY)
+
+@shared_task
+def ensure_message_partitions(months_ahead=None):
+    """
+    Periodic job: create the upcoming monthly partitions of a partitioned message table.
+    A no-op until the table is converted with `manage.py partition_messages --convert`.
+    """
+    if not partitioning.is_partitioned():
+        return 0
+    months_ahead = months_ahead or getattr(settings, 'CHAT_MESSAGE_PARTITIONS_AHEAD', 3)
+    statements = partitioning.ensure_plan(months_ahead, existing=partitioning.existing_partitions())
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    return len(statements)
+
+def get_chat_tools(chat_session):
+    tools = []
+    if chat_session.enable_web_search:
+        tools.append({'google_search': {
+            'dynamic_retrieval_config': {
+                'mode': 'dynamic',
+                'dynamic_threshold': 0.6,
+            }
+        }})
+    return tools or None
+
+def prepare_generation(chat_session, contents):
+    """
+    Keyword arguments for the LLM backend for this turn. When context caching is enabled
+    the system prompt (persona and session settings) is served from the session's
+    cached-content handle and only the remaining turns are sent. The rolling summary is
+    sent with the turns, so a summary refresh does not replace the cached prefix.
+    """
+    prefix_length = 1
+    model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-2.5-pro')
+    tools = get_chat_tools(chat_session)
+
+    cached_content = None
+    cached = bind_cached_prefix(chat_session, model_name, tools, contents, prefix_length)
+    if cached is not None:
+        contents, cached_content = cached
+
+    return {
+        'model_name': model_name,
+        'contents': contents,
+        'tools': tools,
+        'cached_content': cached_content,
+    }
+
+def format_system_turn(chat_session, system_prompt_message):
+    """
+    The first message is the system prompt; the session settings are appended to it.
+    """
+    session_settings_text = ""
+    settings_parts = []
+
+    if chat_session.world_time:
+        settings_parts.append(f"Current World Time: {chat_session.world_time}")
+    if chat_session.user_persona:
+        settings_parts.append(f"User Persona/Role: {chat_session.user_persona}")
+    if chat_session.output_language:
+        settings_parts.append(f"Must Respond in Language: {chat_session.output_language}")
+    if chat_session.additional_context:
+        settings_parts.append(f"Additional Context: {chat_session.additional_context}")
+
+    if settings_parts:
+        session_settings_text = "\n\n[SESSION CONFIGURATION]\n" + "\n".join(settings_parts)
+
+    system_prompt_text = system_prompt_message.content + session_settings_text
+
+    system_parts = build_gemini_parts(system_prompt_text)
+    return {"role": "user", "parts": system_parts}
+
+def format_message_turn(msg):
+    role = 'model' if msg.role == 'assistant' else 'user'
+    return {"role": role, "parts": [msg.content]}
+
+def format_chat_history(chat_session, history_messages):
+    """
+    Format the session's messages (oldest first) into Gemini contents.
+    """
+    if not history_messages:
+        raise ValueError("Cannot generate response for an empty chat session.")
+
+    formatted_history = [format_system_turn(chat_session, history_messages[0])]
+    for msg in history_messages[1:]:
+        formatted_history.append(format_message_turn(msg))
+
+    return formatted_history
+
+def _history_query(chat_session, cached):
+    history_messages = Message.objects.filter(chat_session=chat_session)
+    if cached is not None:
+        # Rows after the cached ones in (timestamp, id) order
+        last_timestamp = cached['last_timestamp']
+        history_messages = history_messages.filter(
+            Q(timestamp__gt=last_timestamp) | Q(timestamp=last_timestamp, id__gt=cached['last_message_id'])
+        )
+    return history_messages.order_by('timestamp', 'id')
+
+def _extend_history(chat_session, cached, new_messages):
+    """
+    (formatted history, message ids) with the new messages appended to the cached copy.
+    """
+    new_ids = [msg.id for msg in new_messages]
+    if cached is None:
+        return format_chat_history(chat_session, new_messages), new_ids
+    return (
+        cached['history'] + [format_message_turn(msg) for msg in new_messages],
+        cached['message_ids'] + new_ids
+    )
+
+def _memory_candidates(cached, new_messages):
+    # The system prompt is never recalled
+    return new_messages if cached is not None else new_messages[1:]
+
+def load_chat_history(chat_session):
+    """
+    (formatted history, message ids) for the session. Only messages newer than the cached
+    copy are read from the database and formatted; they are also added to the session's
+    long-term memory on the way (see chat.memory).
+    """
+    cached = history_cache.get_history(chat_session)
+    new_messages = list(_history_query(chat_session, cached))
+    formatted_history, message_ids = _extend_history(chat_session, cached, new_messages)
+
+    if new_messages:
+        history_cache.store_history(chat_session, formatted_history, message_ids, new_messages[-1])
+        memory.index_messages(chat_session, _memory_candidates(cached, new_messages))
+    return formatted_history, message_ids
+
+async def aload_chat_history(chat_session):
+    cached = await history_cache.aget_history(chat_session)
+    new_messages = [msg async for msg in _history_query(chat_session, cached)]
+    formatted_history, message_ids = _extend_history(chat_session, cached, new_messages)
+
+    if new_messages:
+        await history_cache.astore_history(chat_session, formatted_history, message_ids, new_messages[-1])
+        if memory.is_enabled():
+            await sync_to_async(memory.index_messages)(chat_session, _memory_candidates(cached, new_messages))
+    return formatted_history, message_ids
+
+def build_chat_history(chat_session):
+    """
+    Formatted history for the session (see load_chat_history).
+    """
+    return load_chat_history(chat_session)[0]
+
+def _memory_recall(chat_session, formatted_history, message_ids):
+    """
+    The `recall` hook of apply_context_window: earlier messages relevant to the newest turn,
+    leaving out the system prompt and the turns still in the window. None with memory disabled.
+    """
+    if not memory.is_enabled():
+        return None
+    query = ' '.join(part for part in formatted_history[-1]['parts'] if isinstance(part, str))
+
+    def recall(start):
+        return memory.recall(chat_session, query, [message_ids[0], *message_ids[1 + start:]])
+    return recall
+
+def build_prompt_contents(chat_session):
+    """
+    Gemini contents for the next turn: the history trimmed to the token budget,
+    with older turns replaced by the session's rolling summary and the earlier
+    messages most relevant to the newest one.
+    """
+    formatted_history, message_ids = load_chat_history(chat_session)
+    contents, needs_summary = context_window.apply_context_window(
+        chat_session, formatted_history, _memory_recall(chat_session, formatted_history, message_ids)
+    )
+    if needs_summary:
+        schedule_summary_refresh(chat_session.id)
+    return contents
+
+async def abuild_prompt_contents(chat_session):
+    formatted_history, message_ids = await aload_chat_history(chat_session)
+    recall = _memory_recall(chat_session, formatted_history, message_ids)
+    if recall is None:
+        contents, needs_summary = context_window.apply_context_window(chat_session, formatted_history)
+    else:
+        # Recall reads the vector store and the database
+        contents, needs_summary = await sync_to_async(context_window.apply_context_window)(
+            chat_session, formatted_history, recall
+        )
+    if needs_summary:
+        await sync_to_async(schedule_summary_refresh)(chat_session.id)
+    return contents
+
+def _summary_lock_key(session_id):
+    return f"chat:summary-lock:{session_id}"
+
+def schedule_summary_refresh(session_id):
+    """
+    Queue a rolling-summary refresh for the session unless one is already pending.
+    """
+    if not cache.add(_summary_lock_key(session_id), True, SUMMARY_LOCK_TIMEOUT):
+        return
+    try:
+        refresh_context_summary.delay(session_id)
+    except Exception as e:
+        cache.delete(_summary_lock_key(session_id))
+        logger.warning(f"[WARNING] Could not queue summary refresh for session {session_id}: {e}")
+
+@shared_task
+def refresh_context_summary(session_id):
+    """
+    Fold the turns that fell out of the context window into the session's rolling summary.
+    """
+    try:
+        chat_session = ChatSession.objects.get(id=session_id)
+        formatted_history = build_chat_history(chat_session)
+        new_turns, summarized_turns = context_window.turns_to_summarize(chat_session, formatted_history)
+        if not new_turns:
+            return
+
+        transcript = "\n".join(
+            f"{'Character' if turn['role'] == 'model' else 'User'}: {' '.join(turn['parts'])}"
+            for turn in new_turns
+        )
+        prompt = (
+            f"You maintain a running summary of a role-play conversation.\n"
+            f"Update the summary with the new turns below. Keep names, facts, decisions, "
+            f"relationships and open plot threads; drop small talk. Use the language of the conversation.\n"
+            f"Answer with the updated summary only.\n\n"
+            f"Current summary:\n{chat_session.context_summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}"
+        )
+
+        model_name = getattr(settings, 'GEMINI_SUMMARY_MODEL_NAME', 'gemini-2.5-flash')
+        summary = get_backend().generate(model_name, prompt).text.strip()
+
+        if summary:
+            ChatSession.objects.filter(id=session_id).update(
+                context_summary=summary,
+                summarized_turns=summarized_turns
+            )
+            logger.info(f"[SUCCESS] Folded {len(new_turns)} turns into the summary of session {session_id}")
+
+    except Exception as e:
+        logger.error(f"[ERROR] Failed to refresh context summary for session {session_id}: {e}")
+    finally:
+        cache.delete(_summary_lock_key(session_id))
+
+def _stale_claim_cutoff():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'CHAT_GENERATION_LOCK_TIMEOUT', 180))
+
+def _claimable(chat_session):
+    return ChatSession.objects.filter(
+        Q(is_generating_response=False) | Q(updated_at__lt=_stale_claim_cutoff()),
+        pk=chat_session.pk
+    )
+
+def claim_generation(chat_session):
+    """
+    Claim the session for one AI generation with a conditional UPDATE of
+    is_generating_response, which also bumps updated_at. A claim older than
+    CHAT_GENERATION_LOCK_TIMEOUT counts as abandoned. Returns False if the session is busy.
+    """
+    now = timezone.now()
+    claimed = _claimable(chat_session).update(is_generating_response=True, updated_at=now)
+    if claimed:
+        chat_session.is_generating_response = True
+        chat_session.updated_at = now
+    return bool(claimed)
+
+async def aclaim_generation(chat_session):
+    now = timezone.now()
+    claimed = await _claimable(chat_session).aupdate(is_generating_response=True, updated_at=now)
+    if claimed:
+        chat_session.is_generating_response = True
+        chat_session.updated_at = now
+    return bool(claimed)
+
+def release_generation(chat_session, messages=(), usage=None):
+    """
+    End the session's generation: clears is_generating_response and bumps updated_at in one UPDATE,
+    which also adds the turn's saved `messages` and LLM `usage` to the session statistics.
+    """
+    chat_session.is_generating_response = False
+    chat_session.updated_at = timezone.now()
+    ChatSession.objects.filter(pk=chat_session.pk).update(
+        is_generating_response=False,
+        updated_at=chat_session.updated_at,
+        **session_stats.added(messages, usage)
+    )
+
+async def arelease_generation(chat_session, messages=(), usage=None):
+    chat_session.is_generating_response = False
+    chat_session.updated_at = timezone.now()
+    await ChatSession.objects.filter(pk=chat_session.pk).aupdate(
+        is_generating_response=False,
+        updated_at=chat_session.updated_at,
+        **session_stats.added(messages, usage)
+    )
+
+def complete_turn(chat_session, character, user_message=None):
+    """
+    Generate and save the AI reply to the latest message of a session claimed with
+    claim_generation, then release it. Works on the caller's objects: one history
+    read, one INSERT and one UPDATE per turn. `user_message` (saved by the caller)
+    is counted in the session statistics together with the reply.
+    """
+    ai_message = response = None
+    try:
+        contents = build_prompt_contents(chat_session)
+
+        response = get_backend().generate(**prepare_generation(chat_session, contents))
         ai_response_text = response.text.strip()
-        
+
         ai_message = Message.objects.create(
             chat_session=chat_session,
             role='assistant',
             content=ai_response_text,
             character=character
         )
+    finally:
+        release_generation(chat_session, [user_message, ai_message], response)
+
+    schedule_title_generation(chat_session)
+
+    return ai_message
+
+@shared_task
+def generate_ai_response(message_id, character_id):
+    """
+    Generate AI response using Gemini API, including the character file and all previous chat files.
+    The caller claims the session with claim_generation; it is released when the reply is saved.
+    """
+    try:
+        user_message = Message.objects.select_related('chat_session__character').get(id=message_id)
+        chat_session = user_message.chat_session
+        character = chat_session.character
+        if str(character.id) != str(character_id):
+            character = Character.objects.get(id=character_id)
+
+        ai_message = complete_turn(chat_session, character, user_message)
 
-        # Update session timestamp
-        chat_session.save()
-        
-        # Logic: If title is default ("Chat with...") OR it's one of the very first turns (e.g. message count < 4)
-        # We trigger title generation.
-        message_count = history_messages.count()
-        is_default_title = chat_session.title.startswith("Chat with")
-        
-        if is_default_title or message_count <= 4:
-            conversation_text_for_title += f"Character: {ai_response_text[:100]}..."
-            logger.info(f"Triggering title generation for Session {chat_session.id}...")
-            update_session_title(chat_session, conversation_text_for_title, api_key)
-        
         return {
             'success': True,
             'message_id': ai_message.id,
-            'content': ai_response_text
+            'content': ai_message.content
         }
         
     except Exception as e:
@@ -151,3 +592,81 @@ def generate_ai_response(message_id, character_id):
             'success': False,
             'error': str(e)
         }
+
+async def agenerate_ai_response(user_message, chat_session, character):
+    """
+    Async counterpart of generate_ai_response for the ASGI chat path.
+    Uses the async ORM and Gemini's async client so no thread is held while waiting on the LLM.
+    """
+    try:
+        contents = await abuild_prompt_contents(chat_session)
+        request = await sync_to_async(prepare_generation)(chat_session, contents)
+
+        response = await get_backend().agenerate(**request)
+        ai_response_text = response.text.strip()
+
+        ai_message = await Message.objects.acreate(
+            chat_session=chat_session,
+            role='assistant',
+            content=ai_response_text,
+            character=character
+        )
+
+        await arelease_generation(chat_session, [user_message, ai_message], response)
+
+        await sync_to_async(schedule_title_generation)(chat_session)
+
+        return {
+            'success': True,
+            'message': ai_message,
+            'content': ai_response_text
+        }
+
+    except Exception as e:
+        await arelease_generation(chat_session, [user_message])
+        return {
+            'success': False,
+            'error': str(e),
+            'retry_after': getattr(e, 'retry_after', None)
+        }
+
+async def stream_ai_response(chat_session, character, contents, user_message=None):
+    """
+    Stream the AI response as ('token', text) events, then ('done', message).
+    The assistant message is saved once at the end; if the stream is interrupted
+    (client disconnect or upstream error) whatever was received so far is saved instead.
+    The session's generation claim is released either way, with the token usage
+    the backend reported at the end of the stream.
+    """
+    chunks = []
+    usage = None
+
+    try:
+        request = await sync_to_async(prepare_generation)(chat_session, contents)
+        async for chunk in get_backend().astream(**request):
+            if isinstance(chunk, LLMResult):
+                usage = chunk
+                continue
+            chunks.append(chunk)
+            yield 'token', chunk
+    except BaseException:
+        ai_message = await _save_streamed_message(chat_session, character, chunks)
+        await arelease_generation(chat_session, [user_message, ai_message], usage)
+        logger.warning(f"Stream for session {chat_session.id} interrupted after {len(chunks)} chunks")
+        raise
+
+    ai_message = await _save_streamed_message(chat_session, character, chunks)
+    await arelease_generation(chat_session, [user_message, ai_message], usage)
+    yield 'done', ai_message
+
+async def _save_streamed_message(chat_session, character, chunks):
+    content = ''.join(chunks).strip()
+    if not content:
+        return None
+
+    return await Message.objects.acreate(
+        chat_session=chat_session,
+        role='assistant',
+        content=content,
+        character=character
+    )
@@ -1,2 +1,1614 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from urllib.parse import urlsplit
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from google.api_core import exceptions as google_exceptions
+from rest_framework.test import APIClient
 
+from . import (
+    archive, context_cache, context_window, export, history_cache, idempotency, memory, partitioning, search,
+    session_stats, throttling
+)
+from .llm import get_backend
+from .management.commands import loadtest
+from .llm.base import LLMBackend, LLMError, LLMResult, LLMTimeoutError, LLMUnavailableError, TransientLLMError
+from .llm.cache import response_cache
+from .llm.fake import FakeBackend
+from .llm.gemini import GeminiBackend
+from .llm.resilience import ResilientBackend
+from .importer import BulkImporter
+from .models import ArchivedSession, Character, ChatSession, Message
+from .pagination import MessagePagination, SearchPagination, SessionPagination
+from .tasks import (
+    _memory_recall, archive_cold_sessions, build_prompt_contents, generate_ai_response, generate_session_titles,
+    load_chat_history, prepare_generation, refresh_context_summary, update_session_title
+)
+
+CHAT_TEST_SETTINGS = dict(
+    ALLOWED_HOSTS=['testserver'],
+    LLM_BACKEND='fake',
+    LLM_FAKE_LATENCY=0,
+    LLM_FAKE_TOKENS_PER_SECOND=0,
+    LLM_FAKE_FAILURE_RATE=0.0,
+    # Injected failures would otherwise be retried and trip the shared circuit breaker
+    LLM_RESILIENCE_ENABLED=False,
+    CHAT_CONTEXT_CACHE_BACKEND='',
+    # Keep the whole history in the window so no summary job is queued
+    CHAT_CONTEXT_TOKEN_BUDGET=10 ** 6,
+    CHAT_CONTEXT_MAX_TURNS=10 ** 4,
+    # Keeps vector files out of the source tree; LongTermMemoryTests turns it on in a temp dir
+    CHAT_MEMORY_ENABLED=False,
+)
+
+class ChatTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='demo_user')
+        self.character = Character.objects.create(created_by=self.user, name="Test Character")
+        self.chat_session = ChatSession.objects.create(
+            user=self.user, character=self.character, title="Test", title_generated=True
+        )
+        Message.objects.create(chat_session=self.chat_session, role='user', content="You are a test character.")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, message="Hello", expected_status=200, **headers):
+        response = self.client.post('/api/chat/send_message/', {
+            'message': message,
+            'character_id': self.character.id,
+            'chat_session_id': self.chat_session.id,
+        }, format='json', headers=headers)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class SendMessageQueryCountTests(ChatTestCase):
+    """
+    A chat turn costs a fixed number of queries, however long the session is.
+    """
+    # Session + character, generation claim UPDATE, user message INSERT, new-history SELECT,
+    # AI message INSERT, release UPDATE, plus the DevAutoLoginMiddleware user lookup.
+    SEND_MESSAGE_QUERIES = 7
+    # Message + session + character, new-history SELECT, AI message INSERT, release UPDATE.
+    GENERATE_QUERIES = 4
+
+    def add_history(self, turns):
+        Message.objects.bulk_create([
+            Message(chat_session=self.chat_session, role=role, content=f"{role} turn {i}", character=self.character)
+            for i in range(turns)
+            for role in ('user', 'assistant')
+        ])
+
+    def test_send_message_query_count(self):
+        self.send()
+        for turns in (1, 20, 200):
+            self.add_history(turns)
+            with self.assertNumQueries(self.SEND_MESSAGE_QUERIES):
+                self.send()
+
+    def test_send_message_query_count_with_cold_history_cache(self):
+        for turns in (1, 200):
+            self.add_history(turns)
+            cache.clear()
+            with self.assertNumQueries(self.SEND_MESSAGE_QUERIES):
+                self.send()
+
+    def test_send_message_updates_session_timestamp(self):
+        before = ChatSession.objects.get(id=self.chat_session.id).updated_at
+        response = self.send()
+        self.chat_session.refresh_from_db()
+        self.assertGreater(self.chat_session.updated_at, before)
+        self.assertEqual(
+            list(self.chat_session.messages.values_list('role', flat=True)),
+            ['user', 'user', 'assistant']
+        )
+        self.assertEqual(response.data['ai_message']['role'], 'assistant')
+
+    def test_generate_ai_response_query_count(self):
+        for turns in (1, 200):
+            self.add_history(turns)
+            user_message = Message.objects.create(
+                chat_session=self.chat_session, role='user', content="Hello", character=self.character
+            )
+            with self.assertNumQueries(self.GENERATE_QUERIES):
+                result = generate_ai_response(user_message.id, self.character.id)
+            self.assertTrue(result['success'], result)
+
+@skipUnless(connection.vendor == 'postgresql', "Query plans are checked on PostgreSQL")
+class QueryPlanTests(TestCase):
+    """
+    The hot chat queries are served from an index in the order they need.
+    Sequential scans and sorts are disabled for the planner, so one still showing up
+    in a plan means no index matches the query. Search is ranked, so its plan is checked
+    with the planner's defaults instead.
+    """
+    FORBIDDEN_NODES = {'Seq Scan', 'Sort', 'Incremental Sort'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'plan_user_{i}') for i in range(5)]
+        characters = Character.objects.bulk_create([
+            Character(created_by=user, name=f"Character {i}") for user in cls.users for i in range(4)
+        ])
+        sessions = ChatSession.objects.bulk_create([
+            ChatSession(user=character.created_by, character=character, title=f"Chat {i}")
+            for character in characters for i in range(5)
+        ])
+        Message.objects.bulk_create([
+            Message(chat_session=chat_session, role=('user', 'assistant')[i % 2], content=f"turn {i}")
+            for chat_session in sessions for i in range(20)
+        ])
+        cls.user = cls.users[0]
+        cls.character = characters[0]
+        cls.chat_session = sessions[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plan(self, queryset):
+        pending = [json.loads(queryset.explain(format='json'))[0]['Plan']]
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(node.get('Plans', []))
+
+    def plan_nodes(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+        return (node['Node Type'] for node in self.plan(queryset))
+
+    def assertIndexed(self, queryset):
+        nodes = set(self.plan_nodes(queryset))
+        self.assertFalse(nodes & self.FORBIDDEN_NODES, f"{queryset.query}\nuses {nodes}")
+
+    def test_session_messages(self):
+        self.assertIndexed(Message.objects.filter(chat_session=self.chat_session))
+        self.assertIndexed(Message.objects.filter(chat_session=self.chat_session).order_by('timestamp', 'id'))
+        self.assertIndexed(
+            Message.objects.filter(chat_session=self.chat_session, id__gt=0).order_by('timestamp', 'id')
+        )
+
+    def test_user_sessions(self):
+        sessions = ChatSession.objects.filter(user=self.user)
+        self.assertIndexed(sessions.order_by('-updated_at'))
+        self.assertIndexed(sessions.filter(character=self.character).order_by('-updated_at'))
+
+    def test_keyset_pages(self):
+        cursor = (timezone.now(), 10 ** 6)
+        for pagination, queryset in (
+            (MessagePagination(), Message.objects.filter(chat_session=self.chat_session)),
+            (SessionPagination(), ChatSession.objects.filter(user=self.user)),
+            (SessionPagination(), ChatSession.objects.filter(user=self.user, character=self.character)),
+        ):
+            self.assertIndexed(pagination.keyset_queryset(queryset, None))
+            self.assertIndexed(pagination.keyset_queryset(queryset, cursor))
+
+    def test_user_characters(self):
+        self.assertIndexed(Character.objects.filter(created_by=self.user))
+
+    def test_message_search(self):
+        # The search page query as the view runs it, with the planner's own choices: a rare
+        # word is looked up in the GIN index and only the hits are ranked and sorted
+        Message.objects.bulk_create([
+            Message(chat_session=self.chat_session, role='user', content=f"the lighthouse keeper {i}")
+            for i in range(3)
+        ])
+        with connection.cursor() as cursor:
+            # Enough other rows that reading the whole table costs more than the index
+            cursor.execute(
+                "INSERT INTO chat_message (chat_session_id, role, content, timestamp) "
+                "SELECT %s, 'user', 'filler turn ' || n, now() FROM generate_series(1, 20000) AS n",
+                [self.chat_session.id]
+            )
+            # As autovacuum would: merge the GIN pending list into the index
+            cursor.execute("SELECT gin_clean_pending_list('message_search_idx')")
+            cursor.execute('ANALYZE chat_message')
+        pagination = SearchPagination()
+        messages = search.search_messages(self.user, "lighthouse")
+        for cursor in (None, (1.0, 10 ** 6)):
+            page = pagination.keyset_queryset(messages, cursor)[:pagination.page_size + 1]
+            nodes = list(self.plan(page))
+            message_scans = {node['Node Type'] for node in nodes if node.get('Relation Name') == 'chat_message'}
+            self.assertNotIn('Seq Scan', message_scans, f"{page.query}\nuses {message_scans}")
+            self.assertIn('message_search_idx', {node.get('Index Name') for node in nodes})
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class GenerationLockTests(ChatTestCase):
+    def test_busy_session_returns_conflict(self):
+        ChatSession.objects.filter(id=self.chat_session.id).update(is_generating_response=True)
+        response = self.send(expected_status=409)
+        self.assertEqual(response.data['chat_session_id'], self.chat_session.id)
+        self.assertEqual(self.chat_session.messages.count(), 1)
+
+    def test_stale_claim_is_taken_over(self):
+        ChatSession.objects.filter(id=self.chat_session.id).update(
+            is_generating_response=True,
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.send()
+
+    def test_claim_is_released_after_reply(self):
+        self.send()
+        self.send("Again")
+        self.chat_session.refresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+
+    @override_settings(LLM_FAKE_FAILURE_RATE=1.0)
+    def test_claim_is_released_after_failure(self):
+        self.send(expected_status=500)
+        self.chat_session.refresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class AsyncSendMessageTests(ChatTestCase):
+    async def send_async(self, message="Hello", expected_status=200):
+        response = await self.async_client.post('/api/chat/async/send_message/', {
+            'message': message,
+            'character_id': self.character.id,
+            'chat_session_id': self.chat_session.id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response
+
+    async def message_count(self):
+        return await self.chat_session.messages.acount()
+
+    async def test_saves_the_pair(self):
+        data = (await self.send_async()).json()
+        self.assertEqual(data['chat_session_id'], self.chat_session.id)
+        user_message = await Message.objects.aget(id=data['user_message']['id'])
+        ai_message = await Message.objects.aget(id=data['ai_message']['id'])
+        self.assertEqual((user_message.role, user_message.content), ('user', "Hello"))
+        self.assertEqual((ai_message.role, ai_message.content), ('assistant', data['ai_message']['content']))
+        self.assertEqual(await self.message_count(), 3)
+        await self.chat_session.arefresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+        self.assertEqual(throttling.get_stats()['in_flight'], 0)
+
+    @override_settings(CHAT_RATE_LIMITS={'send_message': '1/min'})
+    async def test_rate_limited(self):
+        await self.send_async()
+        response = await self.send_async(expected_status=429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(await self.message_count(), 3)
+
+    @override_settings(CHAT_MAX_IN_FLIGHT_GENERATIONS=1, CHAT_OVERLOAD_RETRY_AFTER=3)
+    async def test_load_shedding_at_capacity(self):
+        with throttling.generation_slot():
+            response = await self.send_async(expected_status=429)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(await self.message_count(), 1)
+
+    async def test_open_circuit_returns_unavailable(self):
+        unavailable = LLMUnavailableError("LLM upstream is unavailable; try again later", retry_after=7)
+        with mock.patch.object(FakeBackend, 'agenerate', side_effect=unavailable):
+            response = await self.send_async(expected_status=503)
+        self.assertEqual(response['Retry-After'], '7')
+        await self.chat_session.arefresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class StreamMessageTests(ChatTestCase):
+    async def stream(self, message="Hello"):
+        response = await self.async_client.post('/api/chat/stream_message/', {
+            'message': message,
+            'character_id': self.character.id,
+            'chat_session_id': self.chat_session.id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        events = []
+        for block in body.strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    async def assert_released(self):
+        await self.chat_session.arefresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+        self.assertEqual(throttling.get_stats()['in_flight'], 0)
+
+    async def test_event_sequence(self):
+        events = await self.stream()
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[0], 'start')
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(set(kinds[1:-1]), {'token'})
+        self.assertEqual(events[0][1]['user_message']['content'], "Hello")
+        ai_message = events[-1][1]['ai_message']
+        self.assertEqual(''.join(data['text'] for _, data in events[1:-1]).strip(), ai_message['content'])
+        self.assertTrue(await Message.objects.filter(id=ai_message['id'], role='assistant').aexists())
+        await self.assert_released()
+
+    async def test_records_token_usage(self):
+        before = self.chat_session.message_count
+        await self.stream()
+        await self.chat_session.arefresh_from_db()
+        self.assertEqual(self.chat_session.message_count, before + 2)
+        self.assertGreater(self.chat_session.prompt_tokens, 0)
+        self.assertEqual(self.chat_session.completion_tokens, settings.LLM_FAKE_RESPONSE_TOKENS)
+
+    @override_settings(LLM_FAKE_FAILURE_RATE=1.0)
+    async def test_failure_sends_error_event(self):
+        events = await self.stream()
+        self.assertEqual([kind for kind, _ in events], ['start', 'error'])
+        self.assertIn('error', events[-1][1])
+        await self.assert_released()
+        # The session accepts the next message
+        with self.settings(LLM_FAKE_FAILURE_RATE=0.0):
+            self.assertEqual((await self.stream("Again"))[-1][0], 'done')
+
+    async def test_close_before_iteration_releases(self):
+        # The client went away before the first chunk: the server only closes the response
+        response = await self.async_client.post('/api/chat/stream_message/', {
+            'message': "Hello",
+            'character_id': self.character.id,
+            'chat_session_id': self.chat_session.id,
+        }, content_type='application/json')
+        self.assertEqual(throttling.get_stats()['in_flight'], 1)
+        # As the test client does, keep the test's connection open across request_finished
+        request_finished.disconnect(close_old_connections)
+        try:
+            await sync_to_async(response.close)()
+        finally:
+            request_finished.connect(close_old_connections)
+        await self.assert_released()
+        self.assertFalse(await self.chat_session.messages.filter(role='assistant').aexists())
+
+class FakeJob:
+    """
+    Stands in for celery.result.AsyncResult; a None `result` means still pending.
+    """
+    def __init__(self, result=None):
+        self.result = result
+        self.get = mock.Mock(side_effect=CeleryTimeoutError)
+
+    def ready(self):
+        return self.result is not None
+
+    def successful(self):
+        return not isinstance(self.result, Exception)
+
+# No broker here: the queue-depth check would spend its connect timeout on every enqueue
+@override_settings(**CHAT_TEST_SETTINGS, CHAT_MAX_QUEUE_DEPTH=0)
+class GenerationJobTests(ChatTestCase):
+    def enqueue(self, expected_status=202, **delay):
+        delay.setdefault('side_effect', lambda args, task_id: mock.Mock(id=task_id))
+        with mock.patch.object(generate_ai_response, 'apply_async', **delay) as enqueued:
+            response = self.client.post('/api/chat/send_message/', {
+                'message': "Hello",
+                'character_id': self.character.id,
+                'chat_session_id': self.chat_session.id,
+                'async': True,
+            }, format='json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        if expected_status == 202:
+            self.job_id = enqueued.call_args.kwargs['task_id']
+        return response, enqueued
+
+    def get_job(self, job, expected_status=200, job_id=None, **params):
+        job_id = job_id or self.job_id
+        with mock.patch('chat.views.AsyncResult', return_value=job):
+            response = self.client.get(f'/api/chat/jobs/{job_id}/', params)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.data
+
+    def test_enqueue_returns_job(self):
+        response, enqueued = self.enqueue()
+        user_message = Message.objects.get(id=response.data['user_message']['id'])
+        enqueued.assert_called_once_with((user_message.id, self.character.id), task_id=self.job_id)
+        self.assertEqual(response.data['job_id'], self.job_id)
+        self.assertTrue(self.job_id.startswith(f'{user_message.id}-'))
+        # The worker releases the claim once the reply is saved
+        self.chat_session.refresh_from_db()
+        self.assertTrue(self.chat_session.is_generating_response)
+
+    def test_unavailable_queue_releases_claim(self):
+        self.enqueue(expected_status=503, side_effect=ConnectionError("broker down"))
+        self.chat_session.refresh_from_db()
+        self.assertFalse(self.chat_session.is_generating_response)
+
+    @override_settings(CHAT_JOB_MAX_WAIT=2)
+    def test_wait_times_out_as_pending(self):
+        self.enqueue()
+        job = FakeJob()
+        self.assertEqual(self.get_job(job, wait=30)['status'], 'pending')
+        job.get.assert_called_once_with(timeout=2, propagate=False)
+        self.get_job(job, expected_status=400, wait='soon')
+
+    def test_success(self):
+        response, _ = self.enqueue()
+        result = generate_ai_response(response.data['user_message']['id'], self.character.id)
+        data = self.get_job(FakeJob(result), wait=5)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['ai_message']['id'], result['message_id'])
+        self.assertEqual(data['chat_session_id'], self.chat_session.id)
+
+    def test_failure(self):
+        self.enqueue()
+        data = self.get_job(FakeJob({'success': False, 'error': "upstream down"}))
+        self.assertEqual((data['status'], data['error']), ('failed', "upstream down"))
+        data = self.get_job(FakeJob(RuntimeError("worker lost")))
+        self.assertEqual((data['status'], data['error']), ('failed', "worker lost"))
+
+    def test_foreign_job_is_not_found(self):
+        self.get_job(FakeJob({'success': False, 'error': "private"}), expected_status=404, job_id='job-2')
+        self.enqueue()
+        reply = Message.objects.create(chat_session=self.chat_session, role='assistant', content="Not a request")
+        self.get_job(FakeJob(), expected_status=404, job_id=f'{reply.id}-x')
+        other = User.objects.create(username='other')
+        self.client.force_authenticate(other)
+        self.get_job(FakeJob({'success': False, 'error': "private"}), expected_status=404)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class HistoryCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.message = Message.objects.create(chat_session=self.chat_session, role='user', content="First question")
+        load_chat_history(self.chat_session)
+
+    def cached_ids(self):
+        entry = history_cache.get_history(self.chat_session)
+        return entry and entry['message_ids']
+
+    def history(self):
+        formatted_history, message_ids = load_chat_history(self.chat_session)
+        self.assertEqual(self.cached_ids(), message_ids)
+        return [' '.join(turn['parts']) for turn in formatted_history]
+
+    def test_new_message_extends_entry(self):
+        response = self.client.post('/api/messages/', {
+            'chat_session_id': self.chat_session.id, 'role': 'user', 'content': "Second question",
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        # Creating a message keeps the entry; the next read appends only the new row
+        self.assertIsNotNone(self.cached_ids())
+        with self.assertNumQueries(1):
+            history = self.history()
+        self.assertEqual(history[-2:], ["First question", "Second question"])
+
+    def test_rows_are_read_in_timestamp_order(self):
+        # A row with a lower id but a later timestamp, e.g. committed by another request
+        # after a newer one was cached, is still read on the next load
+        entry = history_cache.get_history(self.chat_session)
+        later = Message.objects.create(
+            chat_session=self.chat_session, role='assistant', content="Later answer",
+            timestamp=timezone.now() + timedelta(hours=1)
+        )
+        newer = Message.objects.create(chat_session=self.chat_session, role='user', content="Newer question")
+        history_cache.store_history(
+            self.chat_session, entry['history'] + [{'role': 'user', 'parts': [newer.content]}],
+            entry['message_ids'] + [newer.id], newer
+        )
+        self.assertEqual(self.history()[-3:], ["First question", "Newer question", "Later answer"])
+        self.assertEqual(self.cached_ids()[-2:], [newer.id, later.id])
+
+    def test_insert_before_cached_rows_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(
+                chat_session=self.chat_session, role='user', content="Next question",
+                timestamp=self.message.timestamp + timedelta(hours=1)
+            )
+        self.history()
+        self.assertIsNotNone(self.cached_ids())
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(
+                chat_session=self.chat_session, role='assistant', content="Imported answer",
+                timestamp=self.message.timestamp + timedelta(minutes=1)
+            )
+        self.assertIsNone(self.cached_ids())
+        self.assertEqual(self.history()[-3:], ["First question", "Imported answer", "Next question"])
+
+    def test_edit_invalidates(self):
+        response = self.client.patch(f'/api/messages/{self.message.id}/', {'content': "Edited question"}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(self.cached_ids())
+        self.assertEqual(self.history()[-1], "Edited question")
+
+    def test_delete_invalidates(self):
+        response = self.client.delete(f'/api/messages/{self.message.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached_ids())
+        self.assertNotIn("First question", self.history())
+
+    def test_archive_invalidates(self):
+        ChatSession.objects.update(message_count=2, updated_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(archive_cold_sessions(days=30), 1)
+        self.assertIsNone(self.cached_ids())
+        self.chat_session.refresh_from_db()
+        archive.rehydrate(self.chat_session)
+        self.assertEqual(self.history()[-1], "First question")
+
+    def test_settings_change_invalidates(self):
+        response = self.client.patch(
+            f'/api/sessions/{self.chat_session.id}/', {'world_time': "Midnight"}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(self.cached_ids())
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class ContextWindowTests(ChatTestCase):
+    BUDGET = 200
+
+    def setUp(self):
+        super().setUp()
+        Message.objects.bulk_create([
+            Message(chat_session=self.chat_session, role=role, content=f"Turn {i}: the caravan crosses the dunes.")
+            for i in range(30)
+            for role in ('user', 'assistant')
+        ])
+        Message.objects.create(chat_session=self.chat_session, role='user', content="What happens next?")
+
+    def prompt(self):
+        with mock.patch.object(refresh_context_summary, 'delay') as queued:
+            contents = build_prompt_contents(self.chat_session)
+        return [' '.join(turn['parts']) for turn in contents], queued
+
+    def test_keeps_newest_turns_within_budget(self):
+        history = [' '.join(turn['parts']) for turn in load_chat_history(self.chat_session)[0]]
+        with self.settings(CHAT_CONTEXT_TOKEN_BUDGET=self.BUDGET):
+            texts, queued = self.prompt()
+        self.assertTrue(texts[0].startswith("You are a test character."))
+        # The window is the newest suffix of the history, never cut in the middle
+        self.assertLess(len(texts), len(history))
+        self.assertEqual(texts[1:], history[len(history) - len(texts) + 1:])
+        self.assertEqual(texts[-1], "What happens next?")
+        self.assertLessEqual(sum(context_window.estimate_tokens(text) + 4 for text in texts), self.BUDGET)
+        # Turns fell out of the window: a summary refresh is queued
+        queued.assert_called_once_with(self.chat_session.id)
+
+    def test_max_turns(self):
+        with self.settings(CHAT_CONTEXT_MAX_TURNS=5):
+            texts, _ = self.prompt()
+        self.assertEqual(len(texts), 6)
+        self.assertEqual(texts[-1], "What happens next?")
+
+    def test_everything_fits(self):
+        texts, queued = self.prompt()
+        self.assertEqual(len(texts), 62)
+        queued.assert_not_called()
+
+    def test_summary_replaces_old_turns(self):
+        with self.settings(CHAT_CONTEXT_TOKEN_BUDGET=self.BUDGET):
+            refresh_context_summary(self.chat_session.id)
+            self.chat_session.refresh_from_db()
+            self.assertTrue(self.chat_session.context_summary)
+            self.assertGreater(self.chat_session.summarized_turns, 0)
+            texts, _ = self.prompt()
+        self.assertTrue(texts[0].startswith("You are a test character."))
+        self.assertEqual(texts[1], f"[EARLIER CONVERSATION SUMMARY]\n{self.chat_session.context_summary}")
+        self.assertEqual(texts[-1], "What happens next?")
+        # Summarized turns are not repeated
+        history = [' '.join(turn['parts']) for turn in load_chat_history(self.chat_session)[0]]
+        self.assertLessEqual(len(texts) - 2, len(history) - 1 - self.chat_session.summarized_turns)
+        self.assertEqual(texts[2:], history[len(history) - len(texts) + 2:])
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class KeysetPaginationTests(ChatTestCase):
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_messages_newest_page_first(self):
+        Message.objects.bulk_create([
+            Message(chat_session=self.chat_session, role='user', content=f"turn {i}") for i in range(119)
+        ])
+        # Identical timestamps: the id decides the order
+        Message.objects.filter(chat_session=self.chat_session).update(timestamp=timezone.now())
+        expected = list(self.chat_session.messages.order_by('timestamp', 'id').values_list('id', flat=True))
+
+        page = self.get_page('/api/messages/', {'chat_session_id': self.chat_session.id, 'page_size': 50})
+        pages = [page['results']]
+        # Messages sent while paging back do not shift older pages
+        Message.objects.create(chat_session=self.chat_session, role='user', content="new")
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append(page['results'])
+
+        self.assertEqual([len(results) for results in pages], [50, 50, 20])
+        ids = [message['id'] for results in reversed(pages) for message in results]
+        self.assertEqual(ids, expected)
+
+    def test_sessions_most_recent_first(self):
+        for i in range(4):
+            ChatSession.objects.create(user=self.user, character=self.character, title=f"Chat {i}")
+        expected = list(ChatSession.objects.order_by('-updated_at', '-id').values_list('id', flat=True))
+
+        page = self.get_page('/api/sessions/', {'page_size': 2})
+        ids = [chat_session['id'] for chat_session in page['results']]
+        while page['next']:
+            page = self.get_page(page['next'])
+            ids += [chat_session['id'] for chat_session in page['results']]
+        self.assertEqual(ids, expected)
+
+    def test_session_list_is_a_summary(self):
+        for i in range(5):
+            chat_session = ChatSession.objects.create(user=self.user, character=self.character, title=f"Chat {i}")
+            for j in range(i):
+                Message.objects.create(chat_session=chat_session, role='user', content=f"message {j}")
+
+        session_stats.rebuild(ChatSession.objects.all())
+        # Demo user lookup in DevAutoLoginMiddleware, then one query for the page
+        with self.assertNumQueries(2):
+            page = self.get_page('/api/sessions/')
+        rows = {row['id']: row for row in page['results']}
+        self.assertEqual(len(rows), 6)
+
+        newest = page['results'][0]
+        self.assertNotIn('messages', newest)
+        self.assertEqual(newest['character'], {'id': self.character.id, 'name': "Test Character", 'avatar_url': None})
+        self.assertEqual(newest['message_count'], 4)
+        self.assertEqual(newest['last_message'], "message 3")
+        self.assertEqual(rows[self.chat_session.id]['message_count'], 1)
+
+        detail = self.get_page(f'/api/sessions/{self.chat_session.id}/')
+        self.assertEqual(len(detail['messages']), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/sessions/', {'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class SessionStatsTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        session_stats.rebuild(ChatSession.objects.all())
+
+    def test_turn_updates_stats(self):
+        response = self.send()
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.message_count, 3)
+        self.assertEqual(self.chat_session.last_message_preview, response.data['ai_message']['content'][:100])
+        self.assertIsNotNone(self.chat_session.last_message_at)
+        self.assertGreater(self.chat_session.prompt_tokens, 0)
+        self.assertGreater(self.chat_session.completion_tokens, 0)
+
+    @override_settings(LLM_FAKE_FAILURE_RATE=1.0)
+    def test_failed_turn_counts_user_message(self):
+        self.send("Hello there", expected_status=500)
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.message_count, 2)
+        self.assertEqual(self.chat_session.last_message_preview, "Hello there")
+
+    def test_delete_updates_stats(self):
+        self.send()
+        last = self.chat_session.messages.order_by('-timestamp', '-id').first()
+        response = self.client.delete(f'/api/messages/{last.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.message_count, 2)
+        self.assertEqual(self.chat_session.last_message_preview, "Hello")
+
+    def test_rebuild_command(self):
+        self.send()
+        ChatSession.objects.update(message_count=0, last_message_preview="")
+        call_command('rebuild_session_stats', '--batch-size', '1', stdout=StringIO())
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.message_count, 3)
+        self.assertEqual(
+            self.chat_session.last_message_preview,
+            self.chat_session.messages.order_by('-timestamp', '-id').first().content[:100]
+        )
+
+@override_settings(**CHAT_TEST_SETTINGS, CHAT_ARCHIVE_AFTER_DAYS=30)
+class SessionArchiveTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        session_stats.rebuild(ChatSession.objects.all())
+        self.send()
+        self.messages = list(
+            self.chat_session.messages.order_by('timestamp', 'id').values_list('id', 'content', 'timestamp')
+        )
+
+    def age(self, days=31):
+        ChatSession.objects.update(updated_at=timezone.now() - timedelta(days=days))
+
+    def test_archives_cold_sessions_only(self):
+        self.age(days=5)
+        self.assertEqual(archive_cold_sessions(), 0)
+        self.age()
+        self.assertEqual(archive_cold_sessions(), 1)
+        self.assertFalse(Message.objects.filter(chat_session=self.chat_session).exists())
+        stored = ArchivedSession.objects.get(chat_session=self.chat_session)
+        self.assertEqual(stored.message_count, 3)
+        self.chat_session.refresh_from_db()
+        self.assertTrue(self.chat_session.is_archived)
+        # The sidebar keeps working from the denormalized statistics
+        self.assertEqual(self.chat_session.message_count, 3)
+
+    def test_reopening_rehydrates(self):
+        self.age()
+        archive_cold_sessions()
+        response = self.client.get('/api/messages/', {'chat_session_id': self.chat_session.id})
+        self.assertEqual(response.status_code, 200)
+        restored = self.chat_session.messages.order_by('timestamp', 'id').values_list('id', 'content', 'timestamp')
+        self.assertEqual(list(restored), self.messages)
+        self.assertEqual([message['id'] for message in response.data['results']], [row[0] for row in self.messages])
+        self.assertFalse(ArchivedSession.objects.exists())
+        self.assertFalse(ChatSession.objects.get(id=self.chat_session.id).is_archived)
+
+    def test_send_to_archived_session(self):
+        self.age()
+        archive_cold_sessions()
+        self.send("Back again")
+        self.assertEqual(self.chat_session.messages.count(), 5)
+        self.chat_session.refresh_from_db()
+        self.assertFalse(self.chat_session.is_archived)
+        self.assertEqual(self.chat_session.message_count, 5)
+
+    def test_codec_round_trip(self):
+        codec, data = archive.compress(b'{"hello": "world"}' * 10)
+        self.assertEqual(archive.decompress(codec, data), b'{"hello": "world"}' * 10)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class ExportTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.send()
+
+    def records(self, data):
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get('/api/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertFalse(response.is_async)
+        records = self.records(b''.join(response.streaming_content))
+        self.assertEqual([record['type'] for record in records[:3]], ['export', 'character', 'session'])
+        messages = [record for record in records if record['type'] == 'message']
+        self.assertEqual(
+            [message['id'] for message in messages],
+            list(self.chat_session.messages.order_by('timestamp', 'id').values_list('id', flat=True))
+        )
+
+    async def test_asgi_streams_asynchronously(self):
+        response = await self.async_client.get('/api/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        records = self.records(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(len([record for record in records if record['type'] == 'message']), 3)
+
+    def test_timestamps_keep_microseconds(self):
+        records = self.records(b''.join(export.iter_ndjson(export.iter_records(self.user))))
+        timestamps = self.chat_session.messages.order_by('timestamp', 'id').values_list('timestamp', flat=True)
+        self.assertEqual(
+            [record['timestamp'] for record in records if record['type'] == 'message'],
+            [timestamp.isoformat() for timestamp in timestamps]
+        )
+
+    def test_gzip_includes_archived_sessions(self):
+        ChatSession.objects.update(updated_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(archive_cold_sessions(days=30), 1)
+        response = self.client.get('/api/export/', {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = self.records(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(len([record for record in records if record['type'] == 'message']), 3)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            call_command(
+                'export_chat_data', self.user.username, '--output', path, '--chunk-size', '1', stdout=StringIO()
+            )
+            with open(path, 'rb') as output:
+                records = self.records(output.read())
+        self.assertEqual(len(records), 1 + 1 + 1 + 3)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class ImportTests(ChatTestCase):
+    def test_export_round_trip(self):
+        self.send()
+        lines = b''.join(export.iter_ndjson(export.iter_records(self.user))).splitlines()
+        other = User.objects.create(username='other_user')
+        importer = BulkImporter(other, batch_size=2)
+        importer.import_lines(lines)
+        report = importer.finish()
+        self.assertEqual(
+            (report['characters'], report['sessions'], report['messages'], report['skipped']), (1, 1, 3, 0)
+        )
+
+        imported = ChatSession.objects.get(user=other)
+        source = self.chat_session.messages.order_by('timestamp', 'id')
+        self.assertEqual(
+            list(imported.messages.order_by('timestamp', 'id').values_list('role', 'content', 'timestamp')),
+            list(source.values_list('role', 'content', 'timestamp'))
+        )
+        self.assertEqual(imported.message_count, 3)
+        self.assertEqual(imported.title, self.chat_session.title)
+
+    def test_timestamps_are_exact(self):
+        importer = BulkImporter(self.user)
+        importer.import_lines([
+            json.dumps({'type': 'character', 'id': 1, 'name': "Aria"}),
+            json.dumps({'type': 'session', 'id': 1, 'character_id': 1}),
+            json.dumps({'type': 'message', 'chat_session_id': 1, 'role': 'user', 'content': "Hi",
+                        'timestamp': '2024-01-01T10:00:00.123456+00:00'}),
+            json.dumps({'type': 'message', 'chat_session_id': 1, 'role': 'assistant', 'content': "Hello",
+                        'timestamp': 1704103200.654321}),
+        ])
+        importer.finish()
+        timestamps = list(
+            Message.objects.filter(chat_session__character__name="Aria")
+            .order_by('timestamp', 'id').values_list('timestamp', flat=True)
+        )
+        self.assertEqual(timestamps, [
+            datetime(2024, 1, 1, 10, 0, 0, 123456, tzinfo=dt_timezone.utc),
+            datetime(2024, 1, 1, 10, 0, 0, 654321, tzinfo=dt_timezone.utc),
+        ])
+
+    def test_card_and_transcript_upload(self):
+        card = {
+            'spec': 'chara_card_v2',
+            'data': {'name': "Aria", 'description': "A bard", 'first_mes': "Hi!", 'tags': ['music']},
+        }
+        transcript = "\n".join([
+            json.dumps({'user_name': "You", 'character_name': "Aria", 'create_date': '2024-01-01T10:00:00Z'}),
+            json.dumps({'name': "Aria", 'is_user': False, 'send_date': 1704103200000, 'mes': "Hi!"}),
+            json.dumps({'name': "You", 'is_user': True, 'send_date': '2024-01-01T10:01:00Z', 'mes': "Sing"}),
+            "not json",
+            json.dumps({'name': "Aria", 'is_user': False, 'mes': "La la"}),
+        ])
+        response = self.client.post('/api/import/', {
+            'file': [
+                SimpleUploadedFile('chat.jsonl', gzip.compress(transcript.encode('utf-8'))),
+                SimpleUploadedFile('aria.json', json.dumps(card).encode('utf-8')),
+            ],
+            'batch_size': 2,
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data['characters'], response.data['sessions'], response.data['messages']), (1, 1, 3))
+        self.assertEqual(response.data['errors'][0]['line'], 'chat.jsonl:4')
+        self.assertIsNotNone(response.data['rows_per_second'])
+
+        chat_session = ChatSession.objects.get(user=self.user, character__name="Aria")
+        messages = list(chat_session.messages.order_by('timestamp', 'id'))
+        self.assertEqual([message.content for message in messages], ["Hi!", "Sing", "La la"])
+        self.assertEqual(messages[0].timestamp, datetime(2024, 1, 1, 10, 0, tzinfo=dt_timezone.utc))
+        # No send_date: placed right after the previous message
+        self.assertEqual(messages[2].timestamp, messages[1].timestamp)
+        self.assertEqual(chat_session.updated_at, messages[2].timestamp)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class MessageSearchTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hits = [
+            Message.objects.create(chat_session=self.chat_session, role='user', content=content)
+            for content in ("The dragon sleeps", "dragon dragon & fire", "A red dragon")
+        ]
+        Message.objects.create(chat_session=self.chat_session, role='assistant', content="No match here")
+        other = User.objects.create(username='other_user')
+        other_session = ChatSession.objects.create(user=other, character=self.character, title="Other")
+        Message.objects.create(chat_session=other_session, role='user', content="dragon")
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_ranked_and_highlighted(self):
+        data = self.search(q="dragon")
+        self.assertEqual({result['id'] for result in data['results']}, {message.id for message in self.hits})
+        best = data['results'][0]
+        self.assertEqual(best['id'], self.hits[1].id)
+        self.assertIn('<mark>dragon</mark>', best['snippet'])
+        self.assertIn('&amp;', best['snippet'])
+        self.assertEqual(best['chat_session_title'], "Test")
+
+    def test_filters(self):
+        self.assertEqual(len(self.search(q="dragon", chat_session_id=self.chat_session.id)['results']), 3)
+        self.assertEqual(self.search(q="dragon", character_id=self.character.id + 1)['results'], [])
+        self.assertEqual(len(self.search(q='"red dragon"')['results']), 1)
+        self.assertEqual(len(self.search(q="dragon -red")['results']), 2)
+        self.assertEqual(self.client.get('/api/search/', {'q': ' '}).status_code, 400)
+
+    def all_pages(self, **params):
+        seen = []
+        data = self.search(**params)
+        while True:
+            seen += [result['id'] for result in data['results']]
+            if not data['next']:
+                return seen
+            data = self.client.get(data['next']).data
+
+    def test_keyset_pages(self):
+        seen = self.all_pages(q="dragon", page_size=1)
+        self.assertEqual(sorted(seen), sorted(message.id for message in self.hits))
+
+    def test_tied_ranks_span_pages(self):
+        tied = [
+            Message.objects.create(chat_session=self.chat_session, role='user', content="A wyvern circles")
+            for _ in range(5)
+        ]
+        seen = self.all_pages(q="wyvern", page_size=2)
+        self.assertEqual(seen, sorted((message.id for message in tied), reverse=True))
+
+    def test_graphql_field(self):
+        query = """
+            query ($after: String) {
+                searchMessages(query: "dragon", first: 2, after: $after) {
+                    results { id snippet rank }
+                    nextCursor
+                }
+            }
+        """
+        response = self.client.post('/api/graphql/', {'query': query}, format='json')
+        page = response.json()['data']['searchMessages']
+        self.assertEqual(len(page['results']), 2)
+        response = self.client.post(
+            '/api/graphql/', {'query': query, 'variables': {'after': page['nextCursor']}}, format='json'
+        )
+        last = response.json()['data']['searchMessages']
+        self.assertEqual(len(last['results']), 1)
+        self.assertIsNone(last['nextCursor'])
+
+@override_settings(**{**CHAT_TEST_SETTINGS, 'CHAT_MEMORY_ENABLED': True})
+class LongTermMemoryTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        memory_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(memory_dir.cleanup)
+        self.memory_dir = memory_dir.name
+        settings_override = override_settings(CHAT_MEMORY_DIR=self.memory_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def prompt(self):
+        formatted_history, message_ids = load_chat_history(self.chat_session)
+        contents, _ = context_window.apply_context_window(
+            self.chat_session, formatted_history, _memory_recall(self.chat_session, formatted_history, message_ids)
+        )
+        return [' '.join(turn['parts']) for turn in contents]
+
+    def test_vector_store_top_k(self):
+        embedder = memory.HashingEmbedder(64)
+        store = memory.VectorStore(self.memory_dir, 'test', 64)
+        texts = ["The dragon guards the northern pass", "We bought bread at the market", "A storm over the sea"]
+        self.assertEqual(store.append([1, 2, 3], embedder.embed(texts)), 3)
+        self.assertEqual(store.append([3], embedder.embed(texts[2:])), 0)
+
+        query = embedder.embed(["Who guards the northern pass?"])[0]
+        hits = store.search(query, 2)
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(hits[0][0], 1)
+        self.assertNotIn(1, [pk for pk, _ in store.search(query, 3, exclude=[1])])
+
+    def test_relevant_old_message_is_recalled(self):
+        Message.objects.create(
+            chat_session=self.chat_session, role='user',
+            content="My sister Aiko lives in the lighthouse on Kestrel Island."
+        )
+        Message.objects.bulk_create([
+            Message(chat_session=self.chat_session, role=role, content=f"We keep walking down the road, step {i}.")
+            for i in range(30)
+            for role in ('user', 'assistant')
+        ])
+        Message.objects.create(chat_session=self.chat_session, role='user', content="Where does my sister Aiko live?")
+
+        # Everything fits: no recall
+        self.assertFalse(any(text.startswith('[RELEVANT EARLIER MESSAGES]') for text in self.prompt()))
+        self.assertEqual(len(memory.get_store(self.chat_session).load()[0]), 62)
+
+        with self.settings(CHAT_CONTEXT_TOKEN_BUDGET=300, CHAT_CONTEXT_MAX_TURNS=6):
+            texts = self.prompt()
+        recalled = [text for text in texts if text.startswith('[RELEVANT EARLIER MESSAGES]')]
+        self.assertEqual(len(recalled), 1)
+        self.assertIn('Kestrel Island', recalled[0])
+        self.assertNotIn('walking', recalled[0])
+        self.assertEqual(texts[-1], "Where does my sister Aiko live?")
+
+    def test_session_delete_removes_index(self):
+        Message.objects.create(chat_session=self.chat_session, role='user', content="Remember the blue door.")
+        load_chat_history(self.chat_session)
+        store = memory.get_store(self.chat_session)
+        self.assertTrue(os.path.exists(store.ids_path))
+        self.chat_session.delete()
+        self.assertFalse(os.path.exists(store.ids_path))
+
+class MessagePartitionPlanTests(TestCase):
+    def test_ensure_plan_creates_upcoming_months(self):
+        now = datetime(2026, 11, 20, tzinfo=dt_timezone.utc)
+        statements = partitioning.ensure_plan(2, now=now, existing={'chat_message_y2026m12'})
+        self.assertTrue(all('chat_message_y2026m12' not in statement for statement in statements))
+        self.assertIn('"chat_message_y2027m01"', statements[-1])
+        self.assertIn("FROM ('2027-01-01T00:00:00+00:00') TO ('2027-02-01T00:00:00+00:00')", statements[-1])
+
+    def partition_of(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM chat_message WHERE id = %s", [message.id])
+            return cursor.fetchone()[0]
+
+    @skipUnless(connection.vendor == 'postgresql', "Message partitioning requires PostgreSQL")
+    def test_rows_in_default_partition_move_to_new_month(self):
+        user = User.objects.create(username='partition_user')
+        character = Character.objects.create(created_by=user, name="Partition Character")
+        chat_session = ChatSession.objects.create(user=user, character=character, title="Partitioned")
+        now = timezone.now()
+        # DDL is transactional in PostgreSQL: the conversion is rolled back with the test.
+        # Checking the foreign keys now lets the tables be altered within this transaction.
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            for statement in partitioning.convert_plan(1, now=now):
+                cursor.execute(statement)
+        future = Message.objects.create(
+            chat_session=chat_session, role='user', content="From the future", timestamp=now + timedelta(days=70)
+        )
+        self.assertEqual(self.partition_of(future), partitioning.default_partition_name())
+
+        with connection.cursor() as cursor:
+            for statement in partitioning.ensure_plan(3, now=now, existing=partitioning.existing_partitions()):
+                cursor.execute(statement)
+        self.assertEqual(self.partition_of(future), partitioning.partition_name(future.timestamp.replace(day=1)))
+        self.assertEqual(search.search_messages(user, "future").get().id, future.id)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class IdempotencyKeyTests(ChatTestCase):
+    def test_duplicate_returns_first_result(self):
+        first = self.send(**{'Idempotency-Key': 'abc'})
+        second = self.send(**{'Idempotency-Key': 'abc'})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second[idempotency.REPLAY_HEADER], 'true')
+        self.assertEqual(self.chat_session.messages.filter(role='assistant').count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.send(**{'Idempotency-Key': 'abc'})
+        self.send("Something else", expected_status=422, **{'Idempotency-Key': 'abc'})
+
+    @override_settings(CHAT_IDEMPOTENCY_WAIT=0)
+    def test_duplicate_of_in_flight_request(self):
+        fingerprint = idempotency.request_fingerprint({
+            'message': "Hello",
+            'character_id': self.character.id,
+            'chat_session_id': self.chat_session.id,
+        })
+        idempotency.begin(self.user.id, 'abc', fingerprint)
+        self.send(expected_status=409, **{'Idempotency-Key': 'abc'})
+        self.assertEqual(self.chat_session.messages.count(), 1)
+
+    @override_settings(CHAT_GENERATION_LOCK_TIMEOUT=60, CHAT_IDEMPOTENCY_TTL=3600)
+    def test_pending_record_expires_before_result(self):
+        with mock.patch.object(idempotency, 'cache') as cache:
+            cache.add.return_value = True
+            self.assertIsNone(idempotency.begin(self.user.id, 'abc', 'fingerprint'))
+            idempotency.complete(self.user.id, 'abc', 'fingerprint', 201, {})
+        self.assertEqual(cache.add.call_args.args[2], 60)
+        self.assertEqual(cache.set.call_args.args[2], 3600)
+
+    def test_failed_request_can_be_retried(self):
+        ChatSession.objects.filter(id=self.chat_session.id).update(is_generating_response=True)
+        self.send(expected_status=409, **{'Idempotency-Key': 'abc'})
+        ChatSession.objects.filter(id=self.chat_session.id).update(is_generating_response=False)
+        self.send(**{'Idempotency-Key': 'abc'})
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class GenerationThrottlingTests(ChatTestCase):
+    @override_settings(CHAT_RATE_LIMITS={'send_message': '2/min'})
+    def test_rate_limit_per_user(self):
+        self.send()
+        self.send()
+        response = self.send(expected_status=429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.chat_session.messages.count(), 5)
+
+        other = User.objects.create(username='other_user')
+        self.client.force_authenticate(other)
+        self.chat_session = ChatSession.objects.create(user=other, character=self.character, title="Other")
+        self.send()
+
+    def redis_settings(self, location):
+        return override_settings(CACHES={
+            **settings.CACHES,
+            'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': location},
+        })
+
+    @override_settings(CHAT_RATE_LIMITS={'send_message': '2/min'})
+    def test_redis_cache_runs_the_atomic_script(self):
+        client = mock.Mock()
+        client.eval.side_effect = [b'0', b'0', b'12.5']
+        redis_client = mock.patch.object(throttling, '_redis_client', return_value=client)
+        with self.redis_settings('redis://127.0.0.1:1/0'), redis_client:
+            throttling.check_rate(self.user.id, 'send_message')
+            throttling.check_rate(self.user.id, 'send_message')
+            with self.assertRaises(throttling.GenerationRejected) as raised:
+                throttling.check_rate(self.user.id, 'send_message')
+        self.assertEqual(raised.exception.retry_after, 13)
+        script, _, key, capacity, *_ = client.eval.call_args.args
+        self.assertEqual(script, throttling.TOKEN_BUCKET_SCRIPT)
+        self.assertTrue(key.endswith(f'chat:rate:send_message:{self.user.id}'))
+        self.assertEqual(capacity, 2)
+
+    @skipUnless(os.environ.get('TEST_REDIS_URL'), "Set TEST_REDIS_URL to run the rate limit against Redis")
+    @override_settings(CHAT_RATE_LIMITS={'send_message': '2/min'})
+    def test_redis_token_bucket(self):
+        with self.redis_settings(os.environ['TEST_REDIS_URL']):
+            caches['default'].delete(throttling._bucket_key(self.user.id, 'send_message'))
+            throttling.check_rate(self.user.id, 'send_message')
+            throttling.check_rate(self.user.id, 'send_message')
+            with self.assertRaises(throttling.GenerationRejected) as raised:
+                throttling.check_rate(self.user.id, 'send_message')
+            caches['default'].delete(throttling._bucket_key(self.user.id, 'send_message'))
+        # 2/min refills one token every 30 seconds
+        self.assertIn(raised.exception.retry_after, (29, 30))
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('30/min'), (30, 0.5))
+        self.assertEqual(throttling.parse_rate('5/s'), (5, 5))
+        self.assertIsNone(throttling.parse_rate(''))
+
+    @override_settings(CHAT_MAX_IN_FLIGHT_GENERATIONS=1, CHAT_OVERLOAD_RETRY_AFTER=3)
+    def test_load_shedding_at_capacity(self):
+        with throttling.generation_slot():
+            response = self.send(expected_status=429)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(self.chat_session.messages.count(), 1)
+        self.send()
+        self.assertEqual(throttling.get_stats()['in_flight'], 0)
+
+class TitleBackend(LLMBackend):
+    """
+    Answers a batched title prompt with "Topic <id>" for every session id in it.
+    """
+    name = 'titles'
+    calls = 0
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        TitleBackend.calls += 1
+        ids = re.findall(r'"id": (\d+)', contents)
+        return LLMResult(text=json.dumps([{'id': int(i), 'title': f"Topic {i}"} for i in ids]))
+
+@override_settings(**{**CHAT_TEST_SETTINGS, 'LLM_BACKEND': 'chat.tests.TitleBackend'})
+class BatchTitleTests(ChatTestCase):
+    def add_session(self, *roles):
+        chat_session = ChatSession.objects.create(
+            user=self.user, character=self.character, title=f"Chat with {self.character.name}"
+        )
+        messages = [
+            Message.objects.create(chat_session=chat_session, role=role, content=f"{role} says hi")
+            for role in ('user',) + roles
+        ]
+        session_stats.record_messages(chat_session.id, messages)
+        return chat_session
+
+    def test_titles_are_generated_in_one_call(self):
+        answered = [self.add_session('user', 'assistant') for _ in range(3)]
+        unanswered = self.add_session('user')
+        TitleBackend.calls = 0
+
+        self.assertEqual(generate_session_titles(), 3)
+        self.assertEqual(TitleBackend.calls, 1)
+        for chat_session in answered:
+            chat_session.refresh_from_db()
+            self.assertEqual(chat_session.title, f"Topic {chat_session.id}")
+            self.assertTrue(chat_session.title_generated)
+        unanswered.refresh_from_db()
+        self.assertFalse(unanswered.title_generated)
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.title, "Test")
+
+        # Nothing left to do
+        self.assertEqual(generate_session_titles(), 0)
+        self.assertEqual(TitleBackend.calls, 1)
+
+    def test_batch_size(self):
+        for _ in range(3):
+            self.add_session('user', 'assistant')
+        self.assertEqual(generate_session_titles(batch_size=2), 2)
+        self.assertEqual(generate_session_titles(batch_size=2), 1)
+
+@override_settings(**CHAT_TEST_SETTINGS, CHAT_TITLE_BATCH_ENABLED=False)
+class SessionTitleTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        ChatSession.objects.filter(id=self.chat_session.id).update(title_generated=False)
+        self.chat_session.refresh_from_db()
+
+    def send_turns(self, turns):
+        with mock.patch.object(update_session_title, 'delay') as enqueued:
+            for i in range(turns):
+                self.send(f"Message {i}")
+        return enqueued
+
+    def test_quick_turns_enqueue_once(self):
+        enqueued = self.send_turns(3)
+        enqueued.assert_called_once_with(self.chat_session.id)
+        # The job releases the debounce lock when it finishes
+        update_session_title(self.chat_session.id)
+        self.chat_session.refresh_from_db()
+        self.assertTrue(self.chat_session.title_generated)
+        self.assertNotEqual(self.chat_session.title, "Test")
+
+    def test_generated_title_is_kept(self):
+        self.send_turns(1)
+        update_session_title(self.chat_session.id)
+        self.chat_session.refresh_from_db()
+        title = self.chat_session.title
+
+        self.send_turns(2).assert_not_called()
+        with mock.patch.object(response_cache, 'generate') as generate:
+            update_session_title(self.chat_session.id)
+        generate.assert_not_called()
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.title, title)
+
+    def test_manual_rename_sticks(self):
+        self.send_turns(1)
+        response = self.client.patch(
+            f'/api/sessions/{self.chat_session.id}/', {'title': "My own title"}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        # The job queued before the rename finds the title taken
+        update_session_title(self.chat_session.id)
+        self.send_turns(1).assert_not_called()
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.chat_session.title, "My own title")
+        self.assertTrue(self.chat_session.title_generated)
+
+@override_settings(**{**CHAT_TEST_SETTINGS, 'CHAT_CONTEXT_CACHE_BACKEND': 'local'}, CHAT_CONTEXT_CACHE_MIN_TOKENS=0)
+class ContextCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        # A fresh LocalContextCache per test
+        backend = mock.patch.object(context_cache, '_backend', None)
+        backend.start()
+        self.addCleanup(backend.stop)
+        Message.objects.create(chat_session=self.chat_session, role='user', content="Hello there")
+
+    def prepare(self):
+        contents = build_prompt_contents(self.chat_session)
+        request = prepare_generation(self.chat_session, contents)
+        # The local stand-in prepends the cached prefix again
+        self.assertEqual(request['contents'], contents)
+        self.chat_session.refresh_from_db()
+        return self.chat_session.gemini_chat_id
+
+    @property
+    def stats(self):
+        return context_cache.get_context_cache().stats
+
+    def test_created_then_reused(self):
+        name = self.prepare()
+        self.assertTrue(name)
+        self.assertEqual((self.stats['created'], self.stats['hits']), (1, 1))
+        Message.objects.create(chat_session=self.chat_session, role='assistant', content="Hi!")
+        self.assertEqual(self.prepare(), name)
+        self.assertEqual((self.stats['created'], self.stats['hits']), (1, 2))
+
+    def test_refreshed_near_expiry(self):
+        name = self.prepare()
+        expires_at = timezone.now() + timedelta(seconds=30)
+        ChatSession.objects.filter(id=self.chat_session.id).update(gemini_cache_expires_at=expires_at)
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.prepare(), name)
+        self.assertEqual((self.stats['created'], self.stats['refreshed']), (1, 1))
+        self.assertGreater(self.chat_session.gemini_cache_expires_at, expires_at + timedelta(minutes=30))
+
+    def test_rebuilt_when_prefix_changes(self):
+        name = self.prepare()
+        ChatSession.objects.filter(id=self.chat_session.id).update(user_persona="A retired sea captain")
+        self.chat_session.refresh_from_db()
+        self.assertNotEqual(self.prepare(), name)
+        self.assertEqual((self.stats['created'], self.stats['deleted']), (2, 1))
+
+    def test_summary_refresh_keeps_prefix(self):
+        name = self.prepare()
+        ChatSession.objects.filter(id=self.chat_session.id).update(
+            context_summary="They met at the harbor.", summarized_turns=0
+        )
+        self.chat_session.refresh_from_db()
+        self.assertEqual(self.prepare(), name)
+        self.assertEqual(self.stats['created'], 1)
+
+    def test_create_failure_sends_full_prompt(self):
+        with mock.patch.object(context_cache.LocalContextCache, 'create', side_effect=RuntimeError("quota")):
+            contents = build_prompt_contents(self.chat_session)
+            request = prepare_generation(self.chat_session, contents)
+        self.assertEqual(request['contents'], contents)
+        self.assertIsNone(request['cached_content'])
+        self.chat_session.refresh_from_db()
+        self.assertIsNone(self.chat_session.gemini_chat_id)
+
+@override_settings(**CHAT_TEST_SETTINGS)
+class LLMResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['llm'].clear()
+        response_cache.reset_stats()
+        get_backend().reset_stats()
+
+    def calls(self):
+        return get_backend().get_stats()['calls']
+
+    def test_identical_calls_hit_the_cache(self):
+        first = response_cache.generate('model-a', "Name this chat")
+        second = response_cache.generate('model-a', "Name this chat")
+        self.assertEqual(second, first)
+        self.assertEqual(self.calls(), 1)
+        self.assertEqual(response_cache.get_stats()['hit_rate'], 0.5)
+
+    def test_key_covers_model_and_prompt(self):
+        response_cache.generate('model-a', "Name this chat")
+        response_cache.generate('model-b', "Name this chat")
+        response_cache.generate('model-a', ["Name this chat", "again"])
+        self.assertEqual(self.calls(), 3)
+
+    def test_opt_out(self):
+        response_cache.generate('model-a', "Name this chat")
+        response_cache.generate('model-a', "Name this chat", use_cache=False)
+        self.assertEqual(self.calls(), 2)
+        self.assertEqual(response_cache.get_stats()['bypassed'], 1)
+
+    def test_rejected_results_are_not_stored(self):
+        response_cache.generate('model-a', "Name this chat", cache_if=lambda result: False)
+        response_cache.generate('model-a', "Name this chat")
+        self.assertEqual(self.calls(), 2)
+
+class FlakyBackend(LLMBackend):
+    """
+    Fails the first `failures` calls with `error`; call n sleeps delays[n] seconds if given.
+    """
+    name = 'flaky'
+
+    def __init__(self, failures=0, error=TransientLLMError, delays=()):
+        self.failures = failures
+        self.error = error
+        self.delays = list(delays)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        delay = self.delays[self.calls - 1] if self.calls <= len(self.delays) else 0
+        if self.calls <= self.failures:
+            raise self.error(f"failure {self.calls}")
+        return delay
+
+    def generate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        time.sleep(self._next())
+        return LLMResult(text=f"reply {self.calls}")
+
+    async def agenerate(self, model_name, contents, tools=None, cached_content=None, timeout=None):
+        call = self.calls + 1
+        await asyncio.sleep(self._next())
+        return LLMResult(text=f"reply {call}")
+
+@override_settings(
+    LLM_TIMEOUT=5,
+    LLM_DEADLINE=10,
+    LLM_MAX_ATTEMPTS=3,
+    LLM_RETRY_BASE_DELAY=0,
+    LLM_CIRCUIT_FAILURE_THRESHOLD=5,
+    LLM_CIRCUIT_RESET_TIMEOUT=30,
+    LLM_HEDGE_PERCENTILE=0,
+)
+class ResilientBackendTests(TestCase):
+    def test_transient_errors_are_retried(self):
+        inner = FlakyBackend(failures=2)
+        result = ResilientBackend(inner).generate('model', "Hi")
+        self.assertEqual(result.text, "reply 3")
+
+    def test_other_errors_are_not_retried(self):
+        inner = FlakyBackend(failures=1, error=LLMError)
+        with self.assertRaises(LLMError):
+            ResilientBackend(inner).generate('model', "Hi")
+        self.assertEqual(inner.calls, 1)
+
+    def test_retries_are_bounded(self):
+        inner = FlakyBackend(failures=10)
+        with self.assertRaises(TransientLLMError):
+            ResilientBackend(inner).generate('model', "Hi")
+        self.assertEqual(inner.calls, 3)
+
+    @override_settings(LLM_MAX_ATTEMPTS=1, LLM_CIRCUIT_FAILURE_THRESHOLD=2)
+    def test_circuit_opens_and_fails_fast(self):
+        inner = FlakyBackend(failures=2)
+        backend = ResilientBackend(inner)
+        for _ in range(2):
+            with self.assertRaises(TransientLLMError):
+                backend.generate('model', "Hi")
+        with self.assertRaises(LLMUnavailableError):
+            backend.generate('model', "Hi")
+        self.assertEqual(inner.calls, 2)
+        # Other models have their own circuit
+        backend.generate('other-model', "Hi")
+
+    @override_settings(LLM_MAX_ATTEMPTS=1, LLM_CIRCUIT_FAILURE_THRESHOLD=1, LLM_CIRCUIT_RESET_TIMEOUT=0)
+    def test_circuit_closes_after_successful_trial(self):
+        backend = ResilientBackend(FlakyBackend(failures=1))
+        with self.assertRaises(TransientLLMError):
+            backend.generate('model', "Hi")
+        backend.generate('model', "Hi")
+        self.assertEqual(backend.breaker('model').state, 'closed')
+
+    @override_settings(
+        LLM_TIMEOUT=0.05, LLM_MAX_ATTEMPTS=1, LLM_FAKE_LATENCY=1, LLM_FAKE_TOKENS_PER_SECOND=0,
+        LLM_FAKE_FAILURE_RATE=0.0
+    )
+    def test_calls_have_a_deadline(self):
+        backend = ResilientBackend(FakeBackend())
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeoutError):
+            backend.generate('model', "Hi")
+        with self.assertRaises(LLMTimeoutError):
+            asyncio.run(backend.agenerate('model', "Hi"))
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @override_settings(LLM_TIMEOUT=0.05, LLM_MAX_ATTEMPTS=1)
+    def test_sync_call_is_abandoned_at_its_timeout(self):
+        # FlakyBackend ignores its timeout
+        backend = ResilientBackend(FlakyBackend(delays=[1]))
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeoutError):
+            backend.generate('model', "Hi")
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    @override_settings(LLM_RETRY_BASE_DELAY=30, LLM_RETRY_MAX_DELAY=30)
+    def test_backoff_stops_at_the_deadline(self):
+        backend = ResilientBackend(FlakyBackend(failures=10))
+        started = time.monotonic()
+        with self.assertRaises(LLMError):
+            backend.generate('model', "Hi", timeout=0.2)
+        with self.assertRaises(LLMError):
+            asyncio.run(backend.agenerate('model', "Hi", timeout=0.2))
+        self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(LLM_HEDGE_PERCENTILE=50, LLM_HEDGE_MIN_SAMPLES=5)
+    def test_slow_sync_call_is_hedged(self):
+        backend = ResilientBackend(FlakyBackend(delays=[0] * 5 + [2, 0]))
+        for _ in range(5):
+            backend.generate('model', "Hi")
+        started = time.monotonic()
+        self.assertEqual(backend.generate('model', "Hi").text, "reply 7")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(backend.resilience_stats()['hedge_wins'], 1)
+
+    @override_settings(LLM_HEDGE_PERCENTILE=50, LLM_HEDGE_MIN_SAMPLES=5)
+    def test_slow_call_is_hedged(self):
+        backend = ResilientBackend(FlakyBackend(delays=[0] * 5 + [2, 0]))
+        for _ in range(5):
+            asyncio.run(backend.agenerate('model', "Hi"))
+        started = time.monotonic()
+        result = asyncio.run(backend.agenerate('model', "Hi"))
+        self.assertEqual(result.text, "reply 7")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(backend.resilience_stats()['hedge_wins'], 1)
+
+class GetBackendTests(TestCase):
+    @override_settings(LLM_BACKEND='fake', LLM_RESILIENCE_ENABLED=False)
+    def test_alias(self):
+        backend = get_backend()
+        self.assertIsInstance(backend, FakeBackend)
+        self.assertIs(get_backend(), backend)
+
+    @override_settings(LLM_BACKEND='chat.tests.FlakyBackend', LLM_RESILIENCE_ENABLED=False)
+    def test_dotted_path(self):
+        self.assertIsInstance(get_backend(), FlakyBackend)
+
+    @override_settings(LLM_BACKEND='gemini', LLM_RESILIENCE_ENABLED=True)
+    def test_resilience_wrapper(self):
+        backend = get_backend()
+        self.assertIsInstance(backend, ResilientBackend)
+        self.assertIsInstance(backend.backend, GeminiBackend)
+        with self.settings(LLM_RESILIENCE_ENABLED=False):
+            self.assertIsInstance(get_backend(), GeminiBackend)
+
+class GeminiBackendTests(TestCase):
+    """
+    GeminiBackend against a mocked genai model.
+    """
+    def setUp(self):
+        self.backend = GeminiBackend()
+        self.model = mock.Mock()
+        get_model = mock.patch('chat.llm.gemini.registry.get_model', return_value=self.model)
+        get_model.start()
+        self.addCleanup(get_model.stop)
+
+    def test_blocked_response_raises_llm_error(self):
+        response = mock.Mock(usage_metadata=None)
+        type(response).text = mock.PropertyMock(side_effect=ValueError("Response was blocked"))
+        self.model.generate_content.return_value = response
+        with self.assertRaisesMessage(LLMError, "Response was blocked"):
+            self.backend.generate('model', "Hi")
+
+    def test_result(self):
+        self.model.generate_content.return_value = mock.Mock(
+            text="Hello there", usage_metadata=mock.Mock(prompt_token_count=12, candidates_token_count=3)
+        )
+        result = self.backend.generate('model', "Hi", timeout=5)
+        self.assertEqual((result.text, result.prompt_tokens, result.completion_tokens), ("Hello there", 12, 3))
+        self.model.generate_content.assert_called_once_with("Hi", request_options={'timeout': 5})
+
+    def test_errors(self):
+        for error, expected in (
+            (google_exceptions.DeadlineExceeded("slow"), LLMTimeoutError),
+            (google_exceptions.ServiceUnavailable("overloaded"), TransientLLMError),
+            (google_exceptions.TooManyRequests("quota"), TransientLLMError),
+            (google_exceptions.InvalidArgument("bad request"), LLMError),
+        ):
+            with self.subTest(error=type(error).__name__):
+                self.model.generate_content.side_effect = error
+                with self.assertRaises(expected) as raised:
+                    self.backend.generate('model', "Hi")
+                self.assertIs(raised.exception.__cause__, error)
+                self.assertEqual(raised.exception.retryable, expected is not LLMError)
+
+    def test_stream(self):
+        final = mock.Mock(usage_metadata=mock.Mock(prompt_token_count=7, candidates_token_count=2))
+        type(final).text = mock.PropertyMock(side_effect=ValueError("no text parts"))
+        self.model.generate_content.return_value = iter([mock.Mock(text="Hel"), mock.Mock(text="lo"), final])
+        *chunks, usage = self.backend.stream('model', "Hi")
+        self.assertEqual(chunks, ["Hel", "lo"])
+        self.assertEqual((usage.text, usage.prompt_tokens, usage.completion_tokens), ('', 7, 2))
+
+class TestClientSession:
+    """
+    Stands in for requests.Session in the loadtest command: sends each request through
+    the Django test client.
+    """
+    def __init__(self):
+        self.client = Client()
+        self.headers = {}
+
+    def request(self, method, url, timeout=None, json=None, data=None):
+        url = urlsplit(url)
+        path = f"{url.path}?{url.query}" if url.query else url.path
+        send = getattr(self.client, method.lower())
+        try:
+            if json is not None:
+                return send(path, json, content_type='application/json', headers=self.headers)
+            return send(path, data, headers=self.headers)
+        finally:
+            # The test client keeps connections open; the command's worker threads would leak theirs
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+@override_settings(
+    **CHAT_TEST_SETTINGS,
+    CHAT_RATE_LIMITS={},
+    CHAT_MAX_QUEUE_DEPTH=0,
+    MIDDLEWARE=['chat.middleware.QueryCountHeaderMiddleware', *settings.MIDDLEWARE],
+)
+class LoadTestCommandTests(TransactionTestCase):
+    """
+    A tiny run of `manage.py loadtest`; its worker threads need committed data.
+    """
+    def test_report(self):
+        output = os.path.join(tempfile.mkdtemp(), 'loadtest.json')
+        with mock.patch('chat.management.commands.loadtest.requests.Session', TestClientSession), \
+                mock.patch('chat.management.commands.loadtest.requests.post',
+                           lambda url, **kwargs: TestClientSession().request('POST', url, **kwargs)):
+            call_command(
+                'loadtest', base_url='http://testserver/api', concurrency=2, requests=4, seed_messages=4,
+                output=output, stdout=StringIO()
+            )
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['meta']['concurrency'], 2)
+        self.assertEqual(set(report['scenarios']), set(loadtest.SCENARIOS))
+        for name, result in report['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual((result['requests'], result['errors']), (4, 0))
+                self.assertGreater(result['throughput_rps'], 0)
+                latency = result['latency_ms']
+                self.assertLessEqual(latency['p50'], latency['p95'])
+                self.assertLessEqual(latency['p95'], latency['p99'])
+                self.assertGreater(result['db_queries_per_request']['mean'], 0)
@@ -0,0 +1,210 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+import redis
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH_CACHE_KEY = 'chat:generation-queue-depth'
+QUEUE_DEPTH_CACHE_TIMEOUT = 1
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# Refill and take one token atomically; returns the wait in seconds ("0" when allowed)
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return tostring(wait)
+"""
+
+_local_lock = threading.Lock()
+_redis_clients = {}
+_redis_clients_lock = threading.Lock()
+
+class GenerationRejected(Exception):
+    """
+    A generation request refused by a rate limit or by admission control.
+    Views answer it with 429 and a Retry-After header.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def parse_rate(rate):
+    """
+    '20/min' -> (capacity 20, refill of 20 tokens per minute, in tokens per second).
+    Returns None for an empty rate (no limit).
+    """
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+def _bucket_key(user_id, scope):
+    return f"chat:rate:{scope}:{user_id}"
+
+def _redis_client():
+    """
+    A redis-py client for the default cache's server, one per process. Django's RedisCache
+    has no public way to reach its client, so the script runs on a pool of our own.
+    """
+    location = settings.CACHES['default']['LOCATION']
+    if not isinstance(location, str):
+        location = location[0]
+    url = location.split(',')[0]
+    with _redis_clients_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            client = _redis_clients[url] = redis.Redis.from_url(url)
+        return client
+
+def _take_redis(backend, key, capacity, refill_rate, ttl):
+    return float(_redis_client().eval(
+        TOKEN_BUCKET_SCRIPT, 1, backend.make_and_validate_key(key), capacity, refill_rate, ttl
+    ))
+
+def _take_local(backend, key, capacity, refill_rate, ttl):
+    # The in-process cache is private to this process, so a process-wide lock makes get + set atomic
+    now = time.time()
+    with _local_lock:
+        tokens, updated = backend.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0, now - updated) * refill_rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / refill_rate
+        backend.set(key, (tokens, now), ttl)
+    return wait
+
+def check_rate(user_id, scope):
+    """
+    Take a token from the user's bucket for `scope` (see CHAT_RATE_LIMITS).
+    Buckets live in Redis when it is the cache backend, so the limit holds across processes.
+    Raises GenerationRejected when the bucket is empty; a cache outage never blocks requests.
+    """
+    rate = parse_rate(getattr(settings, 'CHAT_RATE_LIMITS', {}).get(scope))
+    if rate is None:
+        return
+    capacity, refill_rate = rate
+    key = _bucket_key(user_id, scope)
+    # Idle buckets are full again after this long, so they can expire
+    ttl = math.ceil(capacity / refill_rate) + 1
+    # `cache` is a proxy; the dispatch needs the configured backend itself
+    backend = caches['default']
+    try:
+        take = _take_redis if isinstance(backend, RedisCache) else _take_local
+        wait = take(backend, key, capacity, refill_rate, ttl)
+    except Exception as e:
+        logger.warning(f"[WARNING] Rate limit check failed for {scope}: {e}")
+        return
+    if wait > 0:
+        generation_slots.count('rate_limited')
+        raise GenerationRejected(f"Rate limit exceeded for {scope}; try again later", wait)
+
+class GenerationSlots:
+    """
+    Counts generations running in this process and refuses new ones past
+    CHAT_MAX_IN_FLIGHT_GENERATIONS, so accepted requests keep their latency under bursts.
+    Per process, so the global capacity is the limit times the number of server processes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._stats = {'admitted': 0, 'shed': 0, 'queue_full': 0, 'rate_limited': 0}
+
+    def count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def acquire(self):
+        limit = getattr(settings, 'CHAT_MAX_IN_FLIGHT_GENERATIONS', 0)
+        with self._lock:
+            if limit and self.in_flight >= limit:
+                self._stats['shed'] += 1
+                raise GenerationRejected(
+                    "Server is at capacity; try again later",
+                    getattr(settings, 'CHAT_OVERLOAD_RETRY_AFTER', 5)
+                )
+            self.in_flight += 1
+            self._stats['admitted'] += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def get_stats(self):
+        with self._lock:
+            return {'in_flight': self.in_flight, **self._stats}
+
+generation_slots = GenerationSlots()
+
+@contextmanager
+def generation_slot():
+    """
+    Hold one of this process's generation slots for the duration of the block.
+    """
+    generation_slots.acquire()
+    try:
+        yield
+    finally:
+        generation_slots.release()
+
+def queue_depth():
+    """
+    Messages waiting in the Celery default queue, cached for a second.
+    None if the broker cannot be reached.
+    """
+    depth = cache.get(QUEUE_DEPTH_CACHE_KEY)
+    if depth is not None:
+        return depth
+    try:
+        # Fail fast instead of retrying the broker connection forever
+        with current_app.connection_for_read(connect_timeout=1, transport_options={'max_retries': 1}) as connection:
+            depth = connection.default_channel.queue_declare(
+                queue=current_app.conf.task_default_queue, passive=True
+            ).message_count
+    except Exception as e:
+        logger.warning(f"[WARNING] Could not read generation queue depth: {e}")
+        return None
+    cache.set(QUEUE_DEPTH_CACHE_KEY, depth, QUEUE_DEPTH_CACHE_TIMEOUT)
+    return depth
+
+def check_queue_depth():
+    """
+    Raise GenerationRejected when CHAT_MAX_QUEUE_DEPTH jobs are already waiting.
+    """
+    limit = getattr(settings, 'CHAT_MAX_QUEUE_DEPTH', 0)
+    if not limit:
+        return
+    depth = queue_depth()
+    if depth is not None and depth >= limit:
+        generation_slots.count('queue_full')
+        raise GenerationRejected(
+            "Generation queue is full; try again later",
+            getattr(settings, 'CHAT_OVERLOAD_RETRY_AFTER', 5)
+        )
+
+def get_stats():
+    return generation_slots.get_stats()
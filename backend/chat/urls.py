@@ -1,9 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CharacterViewSet, ChatSessionViewSet, MessageViewSet, ChatViewSet
+from .async_views import send_message_async
 from .authentication_views import login, register, logout
 from .file_views import upload_file_view
 from .api import upload_image
+from .stats_views import llm_stats
+from .export_views import export_data
+from .import_views import import_data
+from .search_views import search
 from strawberry.django.views import AsyncGraphQLView
 from .graphql.schema import schema
 
@@ -14,11 +19,16 @@ router.register(r'messages', MessageViewSet)
 router.register(r'chat', ChatViewSet, basename='chat')
 
 urlpatterns = [
+    path('chat/async/send_message/', send_message_async, name='send_message_async'),
     path('', include(router.urls)),
     path('auth/login/', login, name='login'),
     path('auth/register/', register, name='register'),
     path('auth/logout/', logout, name='logout'),
     path('files/upload/', upload_file_view, name='upload_file'),
     path('upload/', upload_image, name='upload_image'),
+    path('stats/llm/', llm_stats, name='llm_stats'),
+    path('export/', export_data, name='export_data'),
+    path('import/', import_data, name='import_data'),
+    path('search/', search, name='search'),
     path('graphql/', AsyncGraphQLView.as_view(schema=schema), name='graphql'),
 ]
\ No newline at end of file
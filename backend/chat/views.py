@@ -2,26 +2,144 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from contextlib import aclosing
 import tempfile
 import os
-import google.generativeai as genai
+import uuid
 from .models import Character, ChatSession, Message
 from .constants import DEFAULT_CHAT_SESSION_SETTINGS
 from .serializers import (
     CharacterSerializer,
     ChatSessionSerializer,
+    ChatSessionSummarySerializer,
     ChatSessionCreateSerializer,
     MessageSerializer,
     MessageCreateSerializer
 )
-from .tasks import generate_ai_response
+from .history_cache import invalidate_history
+from .pagination import MessagePagination, SessionPagination
+from .llm.base import LLMUnavailableError
+from . import archive, idempotency, session_stats, throttling
+from .renderers import EventStreamRenderer, format_sse
+from .tasks import (
+    generate_ai_response,
+    complete_turn,
+    claim_generation,
+    release_generation,
+    build_prompt_contents,
+    stream_ai_response,
+    schedule_title_generation
+)
+from asgiref.sync import sync_to_async
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _is_truthy(value):
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def _job_id(user_message):
+    # The job id names the user message it answers, so ownership is checked against
+    # the database rather than anything kept alongside the Celery result.
+    return f"{user_message.id}-{uuid.uuid4().hex}"
+
+def _job_message_id(job_id):
+    message_id, _, _ = job_id.partition('-')
+    return int(message_id) if message_id.isdigit() else None
+
+def session_settings_from_data(data):
+    """
+    Session settings for a chat started from send_message, falling back to the defaults.
+    """
+    return {
+        key: data.get(key, default)
+        for key, default in DEFAULT_CHAT_SESSION_SETTINGS.items()
+    }
+
+def rejected_response(error):
+    """
+    429 for a request refused by throttling.GenerationRejected.
+    """
+    return Response(
+        {'error': str(error)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+def generation_in_progress(chat_session_id):
+    return {
+        'error': 'A response is already being generated for this chat session',
+        'chat_session_id': chat_session_id
+    }
+
+class GenerationEventStream:
+    """
+    Server-Sent Events body of stream_message. It holds a generation slot until the stream ends,
+    and the session's claim until stream_ai_response takes it over. StreamingHttpResponse calls
+    close() when the response is closed, so both are also released if the client goes away
+    before the stream is iterated.
+    """
+    def __init__(self, chat_session, user_message, events):
+        self.chat_session = chat_session
+        self.user_message = user_message
+        self.events = events
+        self.holds_slot = True
+        self.holds_claim = True
+
+    def __aiter__(self):
+        return self._stream()
+
+    def release_slot(self):
+        if self.holds_slot:
+            self.holds_slot = False
+            throttling.generation_slots.release()
+
+    def close(self):
+        self.release_slot()
+        if self.holds_claim:
+            self.holds_claim = False
+            release_generation(self.chat_session, [self.user_message])
+
+    async def _stream(self):
+        chat_session = self.chat_session
+        try:
+            yield format_sse('start', {
+                'user_message': MessageSerializer(self.user_message).data,
+                'chat_session_id': chat_session.id
+            })
+
+            # From here on stream_ai_response releases the claim, however the stream ends
+            self.holds_claim = False
+            async with aclosing(self.events):
+                async for kind, payload in self.events:
+                    if kind == 'token':
+                        yield format_sse('token', {'text': payload})
+                        continue
+
+                    if payload is None:
+                        yield format_sse('error', {'error': 'AI returned an empty response'})
+                        return
+
+                    yield format_sse('done', {
+                        'ai_message': MessageSerializer(payload).data,
+                        'chat_session_id': chat_session.id
+                    })
+                    await sync_to_async(schedule_title_generation)(chat_session)
+        except Exception as e:
+            logger.error(f"Streaming failed for session {chat_session.id}: {e}")
+            yield format_sse('error', {'error': str(e)})
+        finally:
+            self.release_slot()
+
 class CharacterViewSet(viewsets.ModelViewSet):
     queryset = Character.objects.all() 
     serializer_class = CharacterSerializer
@@ -37,10 +155,13 @@ class CharacterViewSet(viewsets.ModelViewSet):
 class ChatSessionViewSet(viewsets.ModelViewSet):
     queryset = ChatSession.objects.none() 
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
             return ChatSessionCreateSerializer
+        if self.action == 'list':
+            return ChatSessionSummarySerializer
         return ChatSessionSerializer
     
     def get_queryset(self):
@@ -48,16 +169,47 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
         character_id = self.request.query_params.get('character_id')
         if character_id:
             queryset = queryset.filter(character_id=character_id)
+        if self.action == 'list':
+            queryset = self._with_summary(queryset)
         
         return queryset.order_by('-updated_at')
 
+    def get_object(self):
+        chat_session = super().get_object()
+        if self.action == 'retrieve':
+            # Reopening an archived session brings its messages back
+            archive.ensure_hot(chat_session)
+        return chat_session
+
+    def _with_summary(self, queryset):
+        """
+        Sidebar rows in one query: the character's id/name/avatar and the session's
+        denormalized statistics.
+        """
+        return queryset.select_related('character').only(
+            'id', 'title', 'created_at', 'updated_at',
+            'message_count', 'last_message_at', 'last_message_preview',
+            'character__id', 'character__name', 'character__avatar_url'
+        )
+
     def perform_create(self, serializer):
         user = self.request.user
         serializer.save(user=user)
 
+    def perform_update(self, serializer):
+        title = serializer.validated_data.get('title')
+        if title and title != serializer.instance.title:
+            # A title set by the user is never overwritten by auto-generation
+            chat_session = serializer.save(title_generated=True)
+        else:
+            chat_session = serializer.save()
+        # Session settings are part of the system prompt
+        invalidate_history(chat_session.id)
+
 class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.none()
     permission_classes = [IsAuthenticated]
+    pagination_class = MessagePagination
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -68,6 +220,8 @@ class MessageViewSet(viewsets.ModelViewSet):
         queryset = Message.objects.filter(chat_session__user=self.request.user).order_by('timestamp')
         chat_session_id = self.request.query_params.get('chat_session_id')
         if chat_session_id:
+            if self.action == 'list':
+                archive.ensure_hot_by_id(chat_session_id, self.request.user)
             queryset = queryset.filter(chat_session_id=chat_session_id)
         return queryset
     
@@ -86,7 +240,9 @@ class MessageViewSet(viewsets.ModelViewSet):
                 id=chat_session_id,
                 user=user
             )
-            serializer.save(chat_session=chat_session)
+            archive.ensure_hot(chat_session)
+            message = serializer.save(chat_session=chat_session)
+            session_stats.record_messages(chat_session.id, [message])
         except ChatSession.DoesNotExist:
             return Response(
                 {'error': 'Chat session not found or access denied'}, 
@@ -95,12 +251,103 @@ class MessageViewSet(viewsets.ModelViewSet):
 
 class ChatViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
+
+    def _get_or_create_session(self, request, character_id, chat_session_id):
+        """
+        Returns (chat_session, created). An existing session is read together with
+        its character in one query; use chat_session.character afterwards.
+        """
+        user = self.request.user
+
+        if chat_session_id:
+            chat_session = ChatSession.objects.select_related('character').get(
+                id=chat_session_id,
+                user=user,
+                character_id=character_id
+            )
+            archive.ensure_hot(chat_session)
+            return chat_session, False
+
+        character = Character.objects.get(id=character_id)
+        chat_session = ChatSession.objects.create(
+            user=user,
+            character=character,
+            title=f"Chat with {character.name}",
+            # A new session starts out claimed for its first generation
+            is_generating_response=True,
+            **session_settings_from_data(request.data)
+        )
+        return chat_session, True
     
     @action(detail=False, methods=['post'])
     def send_message(self, request):
         """
-        Send a message and get AI response
+        Send a message and get AI response.
+        With an `Idempotency-Key` header a repeated request returns the first request's
+        result (waiting for it if still in flight) instead of generating again.
         """
+        try:
+            key = idempotency.get_key(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if key is None:
+            return self._admit_send_message(request)
+
+        user_id = request.user.id
+        fingerprint = idempotency.request_fingerprint(request.data)
+        record = idempotency.begin(user_id, key, fingerprint)
+        if record is not None:
+            return self._replay(request, key, fingerprint, record)
+
+        response = self._admit_send_message(request)
+        if response.status_code < 400:
+            idempotency.complete(user_id, key, fingerprint, response.status_code, response.data)
+        else:
+            idempotency.abandon(user_id, key)
+        return response
+
+    def _replay(self, request, key, fingerprint, record):
+        if record['fingerprint'] != fingerprint:
+            return Response(
+                {'error': f'{idempotency.HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        if record['state'] == idempotency.PENDING:
+            wait = getattr(settings, 'CHAT_IDEMPOTENCY_WAIT', 30)
+            record = idempotency.wait_for(request.user.id, key, wait)
+            if record is None:
+                # The first request failed and released the key; this one takes over
+                return self.send_message(request)
+            if record['state'] == idempotency.PENDING:
+                return Response(
+                    {'error': f'A request with this {idempotency.HEADER} is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        return Response(
+            record['body'],
+            status=record['status_code'],
+            headers={idempotency.REPLAY_HEADER: 'true'}
+        )
+
+    def _admit_send_message(self, request):
+        """
+        _send_message behind the user's rate limit and admission control: a generation
+        run here takes one of the process's slots, an `async` one needs room in the queue.
+        """
+        try:
+            throttling.check_rate(request.user.id, 'send_message')
+            if _is_truthy(request.data.get('async')):
+                throttling.check_queue_depth()
+                return self._send_message(request)
+            with throttling.generation_slot():
+                return self._send_message(request)
+        except throttling.GenerationRejected as e:
+            return rejected_response(e)
+
+    def _send_message(self, request):
         message_content = request.data.get('message')
         character_id = request.data.get('character_id')
         chat_session_id = request.data.get('chat_session_id')
@@ -112,28 +359,11 @@ class ChatViewSet(viewsets.ViewSet):
             )
         
         try:
-            character = Character.objects.get(id=character_id)
-            
-            user = self.request.user
-            
-            if chat_session_id:
-                chat_session = ChatSession.objects.get(
-                    id=chat_session_id,
-                    user=user,
-                    character=character
-                )
-            else:
-                chat_session = ChatSession.objects.create(
-                    user=user,
-                    character=character,
-                    title=f"Chat with {character.name}",
-                    world_time=request.data.get('world_time', DEFAULT_CHAT_SESSION_SETTINGS["world_time"]),
-                    user_persona=request.data.get('user_persona', DEFAULT_CHAT_SESSION_SETTINGS["user_persona"]),
-                    enable_web_search=request.data.get('enable_web_search', DEFAULT_CHAT_SESSION_SETTINGS["enable_web_search"]),
-                    output_language=request.data.get('output_language', DEFAULT_CHAT_SESSION_SETTINGS["output_language"]),
-                    additional_context=request.data.get('additional_context', DEFAULT_CHAT_SESSION_SETTINGS["additional_context"])
-                )
-            
+            chat_session, created = self._get_or_create_session(request, character_id, chat_session_id)
+            character = chat_session.character
+
+            if not created and not claim_generation(chat_session):
+                return Response(generation_in_progress(chat_session.id), status=status.HTTP_409_CONFLICT)
 
             user_message = Message.objects.create(
                 chat_session=chat_session,
@@ -141,19 +371,41 @@ class ChatViewSet(viewsets.ViewSet):
                 content=message_content,
                 character=character
             )
+
+            if _is_truthy(request.data.get('async')):
+                try:
+                    job = generate_ai_response.apply_async(
+                        (user_message.id, character.id), task_id=_job_id(user_message)
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to enqueue AI response for message {user_message.id}: {e}")
+                    release_generation(chat_session, [user_message])
+                    return Response(
+                        {'error': 'Generation queue is unavailable'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE
+                    )
+
+                return Response({
+                    'job_id': job.id,
+                    'user_message': MessageSerializer(user_message).data,
+                    'chat_session_id': chat_session.id
+                }, status=status.HTTP_202_ACCEPTED)
             
-            chat_session.save()
-            
-            result = generate_ai_response(user_message.id, character.id)
-            
-            if not result.get('success'):
+            try:
+                ai_message = complete_turn(chat_session, character, user_message)
+            except LLMUnavailableError as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(e.retry_after)}
+                )
+            except Exception as e:
+                logger.error(f"AI response failed for session {chat_session.id}: {e}")
                 return Response(
-                    {'error': result.get('error', 'Failed to generate AI response')},
+                    {'error': str(e) or 'Failed to generate AI response'},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
-            ai_message = Message.objects.get(id=result['message_id'])
-
             return Response({
                 'user_message': MessageSerializer(user_message).data,
                 'ai_message': MessageSerializer(ai_message).data,
@@ -169,4 +421,128 @@ class ChatViewSet(viewsets.ViewSet):
             return Response(
                 {'error': 'Chat session not found or access denied'},
                 status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+            )
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[^/.]+)')
+    def job(self, request, job_id=None):
+        """
+        Result of a send_message call made with `async: true`.
+        Pass `?wait=<seconds>` to long-poll until the job finishes (capped by CHAT_JOB_MAX_WAIT).
+        Jobs enqueued by another user are reported as not found.
+        """
+        message_id = _job_message_id(job_id)
+        if message_id is None or not Message.objects.filter(
+            id=message_id, role='user', chat_session__user=request.user
+        ).exists():
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), getattr(settings, 'CHAT_JOB_MAX_WAIT', 30))
+        except ValueError:
+            return Response({'error': 'wait must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = AsyncResult(job_id, app=generate_ai_response.app)
+        if wait > 0 and not job.ready():
+            try:
+                job.get(timeout=wait, propagate=False)
+            except CeleryTimeoutError:
+                pass
+
+        if not job.ready():
+            return Response({'job_id': job_id, 'status': 'pending'})
+
+        result = job.result if job.successful() else None
+        if not isinstance(result, dict) or not result.get('success'):
+            error = result.get('error') if isinstance(result, dict) else str(job.result)
+            return Response({
+                'job_id': job_id,
+                'status': 'failed',
+                'error': error or 'Failed to generate AI response'
+            })
+
+        try:
+            ai_message = Message.objects.get(id=result['message_id'], chat_session__user=request.user)
+        except Message.DoesNotExist:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'job_id': job_id,
+            'status': 'success',
+            'ai_message': MessageSerializer(ai_message).data,
+            'chat_session_id': ai_message.chat_session_id
+        })
+
+    @action(detail=False, methods=['post'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def stream_message(self, request):
+        """
+        Send a message and stream the AI response as Server-Sent Events.
+        Events: `start` (user message + session id), `token` (text delta),
+        `done` (saved AI message) or `error`.
+        The stream holds a generation slot until it ends.
+        """
+        try:
+            throttling.check_rate(request.user.id, 'stream_message')
+            throttling.generation_slots.acquire()
+        except throttling.GenerationRejected as e:
+            return rejected_response(e)
+
+        try:
+            response = self._stream_message(request)
+        except BaseException:
+            throttling.generation_slots.release()
+            raise
+        if not isinstance(response, StreamingHttpResponse):
+            throttling.generation_slots.release()
+        return response
+
+    def _stream_message(self, request):
+        message_content = request.data.get('message')
+        character_id = request.data.get('character_id')
+        chat_session_id = request.data.get('chat_session_id')
+
+        if not message_content or not character_id:
+            return Response(
+                {'error': 'message and character_id are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            chat_session, created = self._get_or_create_session(request, character_id, chat_session_id)
+            character = chat_session.character
+
+            if not created and not claim_generation(chat_session):
+                return Response(generation_in_progress(chat_session.id), status=status.HTTP_409_CONFLICT)
+
+            user_message = Message.objects.create(
+                chat_session=chat_session,
+                role='user',
+                content=message_content,
+                character=character
+            )
+
+            try:
+                contents = build_prompt_contents(chat_session)
+            except Exception:
+                release_generation(chat_session, [user_message])
+                raise
+
+        except Character.DoesNotExist:
+            return Response(
+                {'error': 'Character not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except ChatSession.DoesNotExist:
+            return Response(
+                {'error': 'Chat session not found or access denied'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        events = stream_ai_response(chat_session, character, contents, user_message)
+        response = StreamingHttpResponse(
+            GenerationEventStream(chat_session, user_message, events),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
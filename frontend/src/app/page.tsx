@@ -36,12 +36,26 @@ interface ChatHistoryItem {
   updated_at: string;
 }
 
+function toHistoryItem(session: ChatSession): ChatHistoryItem {
+  return {
+    id: session.id,
+    title: session.title || `Chat #${session.id}`,
+    characterId: session.character?.id || '',
+    characterName: session.character?.name || '',
+    created_at: session.createdAt,
+    updated_at: session.updatedAt
+  };
+}
+
 export default function AIStudioLayout() {
   const [currentView, setCurrentView] = useState<ViewState>('playground');
   const [isSidebarOpen, setIsSidebarOpen] = useState(true);
   const [selectedCharacterId, setSelectedCharacterId] = useState<string | null>(null);
   const [selectedSessionId, setSelectedSessionId] = useState<string | null>(null);
   const [recentChats, setRecentChats] = useState<ChatHistoryItem[]>([]);
+  // Cursor of the next page of older sessions (the API returns the most recently updated first)
+  const [sessionsCursor, setSessionsCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -76,23 +90,8 @@ export default function AIStudioLayout() {
       }
 
       if (response.data) {
-        const formattedChats: ChatHistoryItem[] = response.data.map((session) => {
-          const charId = session.character?.id || '';
-
-          return {
-            id: session.id,
-            title: session.title || `Chat #${session.id}`,
-            characterId: charId,
-            characterName: session.character?.name || '',
-            created_at: session.createdAt,
-            updated_at: session.updatedAt
-          };
-        });
-
-        const sortedSessions = formattedChats
-          .sort((a, b) => new Date(b.updated_at).getTime() - new Date(a.updated_at).getTime());
-
-        setRecentChats(sortedSessions);
+        setRecentChats(response.data.items.map(toHistoryItem));
+        setSessionsCursor(response.data.before);
       }
     } catch (err) {
       console.error('Failed to fetch chat sessions:', err);
@@ -102,6 +101,29 @@ export default function AIStudioLayout() {
     }
   };
 
+  // Appends the next page of older sessions
+  const loadMoreChatSessions = async () => {
+    if (!sessionsCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const response = await apiService.getChatSessions(undefined, sessionsCursor);
+      if (response.error) {
+        setError(response.error);
+        return;
+      }
+      if (response.data) {
+        const older = response.data.items.map(toHistoryItem);
+        setRecentChats(chats => [...chats, ...older.filter(chat => !chats.some(c => c.id === chat.id))]);
+        setSessionsCursor(response.data.before);
+      }
+    } catch (err) {
+      console.error('Failed to fetch more chat sessions:', err);
+      setError('Failed to load conversation history');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchChatSessions();
   }, []);
@@ -136,22 +158,8 @@ export default function AIStudioLayout() {
       const response = await apiService.getChatSessions();
 
       if (response.data) {
-        const formattedChats: ChatHistoryItem[] = response.data.map((session) => {
-          const charId = session.character?.id || '';
-
-          return {
-            id: session.id,
-            title: session.title || `Chat #${session.id}`,
-            characterId: charId,
-            characterName: session.character?.name || '',
-            created_at: session.createdAt,
-            updated_at: session.updatedAt
-          };
-        });
-
-        const sortedSessions = formattedChats
-          .sort((a, b) => new Date(b.updated_at).getTime() - new Date(a.updated_at).getTime());
-        setRecentChats(sortedSessions);
+        setRecentChats(response.data.items.map(toHistoryItem));
+        setSessionsCursor(response.data.before);
       }
     } catch (error) {
       console.error("Failed to delete session:", error);
@@ -392,6 +400,18 @@ export default function AIStudioLayout() {
                     </div>
                   </div>
 
+                  {sessionsCursor && historyPage === totalPages && (
+                    <div className="flex justify-center mb-4">
+                      <button
+                        onClick={loadMoreChatSessions}
+                        disabled={loadingMore}
+                        className="px-4 py-2 bg-white border border-gray-300 rounded-lg text-sm font-medium text-gray-700 hover:bg-gray-50 disabled:opacity-50 transition-colors shadow-sm"
+                      >
+                        {loadingMore ? 'Loading...' : 'Load older conversations'}
+                      </button>
+                    </div>
+                  )}
+
                   {totalPages > 1 && (
                     <div className="flex items-center justify-center gap-2">
                       <button
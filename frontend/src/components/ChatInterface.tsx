@@ -3,13 +3,20 @@
 import { useState, useEffect, useRef } from 'react';
 import { Character, RootState, Message, ChatSession } from '@/types';
 import { useDispatch, useSelector } from 'react-redux';
-import { setCharacter, addMessage, setMessages, setLoading, setError, clearChat, setChatSession, updateChatSession } from '@/store/chatSlice';
+import { setCharacter, addMessage, setMessages, prependMessages, setLoading, setError, clearChat, setChatSession, updateChatSession } from '@/store/chatSlice';
 import ChatWindow from '@/components/ChatWindow';
 import SessionSettings from '@/components/SessionSettings';
 import { apiService, getAuthToken, removeAuthToken } from '@/utils/api';
 import { Settings, User, LogOut, Clock } from 'lucide-react';
 import { DEFAULT_CHAT_SESSION_SETTINGS } from '@/constants';
 
+const formatMessage = (msg: { id: string | number; content: string; role: 'user' | 'assistant'; timestamp: string }): Message => ({
+  id: String(msg.id),
+  content: msg.content,
+  role: msg.role,
+  timestamp: msg.timestamp,
+});
+
 interface ChatInterfaceProps {
   characterId?: string;
   initialSessionId?: string | null;
@@ -26,6 +33,9 @@ export default function ChatInterface({
   const [hasStartedConversation, setHasStartedConversation] = useState(false);
   const [currentUser, setCurrentUser] = useState<string | null>(null);
   const [chatSessionId, setChatSessionId] = useState<string | null>(initialSessionId || null);
+  // Cursor of the next older page of messages; null once the first message is loaded
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState<string | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
 
   const [pendingSettings, setPendingSettings] = useState<Partial<ChatSession>>(DEFAULT_CHAT_SESSION_SETTINGS);
 
@@ -88,6 +98,7 @@ export default function ChatInterface({
         dispatch(clearChat());
         dispatch(setChatSession(null));
         setChatSessionId(null);
+        setOlderMessagesCursor(null);
         setHasStartedConversation(false);
         setPendingSettings(DEFAULT_CHAT_SESSION_SETTINGS);
         return;
@@ -97,6 +108,7 @@ export default function ChatInterface({
       dispatch(setLoading(true));
 
       setChatSessionId(initialSessionId);
+      setOlderMessagesCursor(null);
 
       try {
 
@@ -105,15 +117,9 @@ export default function ChatInterface({
           apiService.getChatSession(initialSessionId)
         ]);
 
-        if (messagesRes.data && messagesRes.data.length > 0) {
-          const formattedMessages = messagesRes.data.map(msg => ({
-            id: String(msg.id),
-            content: msg.content,
-            role: msg.role,
-            timestamp: msg.timestamp,
-          }));
-
-          dispatch(setMessages(formattedMessages));
+        if (messagesRes.data && messagesRes.data.items.length > 0) {
+          dispatch(setMessages(messagesRes.data.items.map(formatMessage)));
+          setOlderMessagesCursor(messagesRes.data.before);
           setHasStartedConversation(true);
         } else {
           setHasStartedConversation(false);
@@ -135,6 +141,25 @@ export default function ChatInterface({
     loadChatHistory();
   }, [initialSessionId, dispatch]);
 
+  const handleLoadOlderMessages = async () => {
+    if (!chatSessionId || !olderMessagesCursor || isLoadingOlder) return;
+
+    setIsLoadingOlder(true);
+    try {
+      const response = await apiService.getMessages(chatSessionId, olderMessagesCursor);
+      if (response.error) throw new Error(response.error);
+      if (response.data) {
+        dispatch(prependMessages(response.data.items.map(formatMessage)));
+        setOlderMessagesCursor(response.data.before);
+      }
+    } catch (error) {
+      console.error("Failed to load older messages:", error);
+      dispatch(setError("Failed to load older messages"));
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async (userInput: string) => {
     if (!character) return;
 
@@ -357,6 +382,9 @@ export default function ChatInterface({
           onSendMessage={handleSendMessage}
           isLoading={useSelector((state: RootState) => state.chat.isLoading)}
           isFirstMessage={!hasStartedConversation}
+          hasOlderMessages={olderMessagesCursor !== null}
+          isLoadingOlder={isLoadingOlder}
+          onLoadOlderMessages={handleLoadOlderMessages}
         />
       </div>
 
@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useRef } from 'react';
+import { useEffect, useLayoutEffect, useRef } from 'react';
 import { Message, RootState } from '@/types';
 import { useSelector } from 'react-redux';
 
@@ -8,24 +8,62 @@ interface ChatWindowProps {
   onSendMessage: (message: string) => void;
   isLoading: boolean;
   isFirstMessage: boolean;
+  hasOlderMessages?: boolean;
+  isLoadingOlder?: boolean;
+  onLoadOlderMessages?: () => void;
 }
 
 export default function ChatWindow({
   onSendMessage,
   isLoading,
   isFirstMessage,
+  hasOlderMessages = false,
+  isLoadingOlder = false,
+  onLoadOlderMessages,
 }: ChatWindowProps) {
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const scrollRef = useRef<HTMLDivElement>(null);
+  // Scroll height before older messages were prepended, to keep the visible messages in place
+  const heightBeforeLoad = useRef<number | null>(null);
   const messages = useSelector((state: RootState) => state.chat.messages);
+  const lastMessageId = messages.length > 0 ? messages[messages.length - 1].id : null;
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
+  // Only new messages at the bottom scroll the view; older pages load above it
   useEffect(() => {
     scrollToBottom();
+  }, [lastMessageId]);
+
+  useLayoutEffect(() => {
+    const container = scrollRef.current;
+    if (container && heightBeforeLoad.current !== null) {
+      container.scrollTop += container.scrollHeight - heightBeforeLoad.current;
+      heightBeforeLoad.current = null;
+    }
   }, [messages]);
 
+  useEffect(() => {
+    // A failed load leaves the messages unchanged
+    if (!isLoadingOlder) {
+      heightBeforeLoad.current = null;
+    }
+  }, [isLoadingOlder]);
+
+  const loadOlderMessages = () => {
+    if (!onLoadOlderMessages || !hasOlderMessages || isLoadingOlder) return;
+    heightBeforeLoad.current = scrollRef.current?.scrollHeight ?? null;
+    onLoadOlderMessages();
+  };
+
+  const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    if (e.currentTarget.scrollTop < 40) {
+      loadOlderMessages();
+    }
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent<HTMLTextAreaElement>) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -49,7 +87,18 @@ export default function ChatWindow({
 
   return (
     <div className="flex flex-col h-full bg-gray-50 rounded-lg border border-gray-200">
-      <div className="flex-1 overflow-y-auto p-4 space-y-4">
+      <div ref={scrollRef} onScroll={handleScroll} className="flex-1 overflow-y-auto p-4 space-y-4">
+        {hasOlderMessages && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadOlderMessages}
+              disabled={isLoadingOlder}
+              className="text-xs text-gray-500 hover:text-gray-800 disabled:opacity-50"
+            >
+              {isLoadingOlder ? 'Loading earlier messages...' : 'Load earlier messages'}
+            </button>
+          </div>
+        )}
         {messages.length === 0 ? (
           <div className="flex items-center justify-center h-full text-gray-500">
             <div className="text-center">
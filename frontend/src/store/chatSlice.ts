@@ -19,6 +19,9 @@ const chatSlice = createSlice({
     addMessage: (state, action: PayloadAction<Message>) => {
       state.messages.push(action.payload);
     },
+    prependMessages: (state, action: PayloadAction<Message[]>) => {
+      state.messages = [...action.payload, ...state.messages];
+    },
     setLoading: (state, action: PayloadAction<boolean>) => {
       state.isLoading = action.payload;
     },
@@ -51,6 +54,7 @@ const chatSlice = createSlice({
 export const {
   setMessages,
   addMessage,
+  prependMessages,
   setLoading,
   setError,
   setCharacter,
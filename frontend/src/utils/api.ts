@@ -39,6 +39,10 @@ interface ApiSession {
   additional_context?: string;
   created_at: string;
   updated_at: string;
+  // Session list rows only: character is reduced to {id, name, avatar_url}
+  message_count?: number;
+  last_message?: string;
+  last_message_at?: string | null;
 }
 
 interface ApiMessage {
@@ -49,6 +53,17 @@ interface ApiMessage {
   chat_session?: string;
 }
 
+interface ApiPage<T> {
+  next: string | null;
+  results: T[];
+}
+
+// One page of a keyset-paginated list; pass `before` back to fetch the next (older) page
+export interface Page<T> {
+  items: T[];
+  before: string | null;
+}
+
 function normalizeCharacter(apiData: ApiCharacter): Character {
   const apiBaseUrl = process.env.NEXT_PUBLIC_API_URL?.replace('/api', '') || 'http://localhost:8000';
 
@@ -191,6 +206,22 @@ class ApiService {
     }
   }
 
+  // Fetches one page of a keyset-paginated list: the newest one, or the one older than `before`
+  private async requestPage<T>(endpoint: string, before?: string | null): Promise<ApiResponse<Page<T>>> {
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const url = before ? `${endpoint}${separator}before=${encodeURIComponent(before)}` : endpoint;
+    const response = await this.request<ApiPage<T>>(url);
+    if (!response.data) {
+      return { error: response.error };
+    }
+    return {
+      data: {
+        items: response.data.results,
+        before: response.data.next ? new URL(response.data.next).searchParams.get('before') : null,
+      }
+    };
+  }
+
   async getCharacters(): Promise<ApiResponse<Character[]>> {
     const response = await this.request<ApiCharacter[]>('/characters/');
     if (response.data) {
@@ -255,14 +286,15 @@ class ApiService {
     return { data: undefined };
   }
 
-  async getChatSessions(characterId?: string): Promise<ApiResponse<ChatSession[]>> {
+  // Newest sessions first; pass the returned `before` to load the next page
+  async getChatSessions(characterId?: string, before?: string | null): Promise<ApiResponse<Page<ChatSession>>> {
     const params = characterId ? `?character_id=${characterId}` : '';
-    const response = await this.request<ApiSession[]>(`/sessions/${params}`);
+    const response = await this.requestPage<ApiSession>(`/sessions/${params}`, before);
 
     if (response.data) {
       const sessions: ChatSession[] = [];
 
-      for (const sessionData of response.data) {
+      for (const sessionData of response.data.items) {
         if (typeof sessionData.character === 'number') {
           const charResponse = await this.getCharacter(String(sessionData.character));
           if (charResponse.data) {
@@ -292,9 +324,9 @@ class ApiService {
         }
       }
 
-      return { data: sessions };
+      return { data: { items: sessions, before: response.data.before } };
     }
-    return { data: undefined };
+    return { error: response.error };
   }
 
   async createChatSession(characterId: string, title?: string, settings?: Partial<CreateSessionRequest>): Promise<ApiResponse<ChatSession>> {
@@ -407,8 +439,9 @@ class ApiService {
     });
   }
 
-  async getMessages(chatSessionId: string): Promise<ApiResponse<ApiMessage[]>> {
-    return this.request(`/messages/?chat_session_id=${chatSessionId}`);
+  // The newest messages of a session in chat order; pass the returned `before` to load older ones
+  async getMessages(chatSessionId: string, before?: string | null): Promise<ApiResponse<Page<ApiMessage>>> {
+    return this.requestPage<ApiMessage>(`/messages/?chat_session_id=${chatSessionId}`, before);
   }
 
   async sendMessage(data: SendMessageRequest): Promise<ApiResponse<{ ai_message: ApiMessage; chat_session_id?: string }>> {